@@ -0,0 +1,132 @@
+# The distinct values of a category field, for lists too long to show whole.
+#
+# A field coerced to Category can have tens of thousands of values. Those are
+# kept here once, most frequent first, with a sorted index over their labels
+# for prefix search and the unchecked ones as a bitset, so that neither a
+# click nor composing the filter walks every value. The list model on top
+# shows a page of values at a time.
+
+import bisect
+import collections
+
+# values listed at first, and fetched per scroll, in a long category list
+TOP_VALUES = 100
+
+
+def value_key(value):
+    """the value counts and lookups use for an attribute value, None for NULL of any kind"""
+    if value is None or hasattr(value, 'isNull') and value.isNull():
+        return None
+    try:
+        hash(value)
+    except TypeError:
+        return str(value)
+    return value
+
+
+def value_label(value):
+    return "NULL" if value_key(value) is None else str(value)
+
+
+def value_counts(loader, name, is_canceled=None):
+    """:return: value -> number of features, counted in one pass of a feature_loader loader"""
+    counts = collections.Counter()
+    for chunk in loader.chunks(is_canceled=is_canceled):
+        counts.update(value_key(value) for value in chunk.columns[name].values[:chunk.size])
+    return counts
+
+
+class Bitset(object):
+    """a set of small non-negative integers, one bit each"""
+
+    __slots__ = ('bits',)
+
+    def __init__(self, positions=()):
+        self.bits = 0
+        for i in positions:
+            self.add(i)
+
+    def add(self, i):
+        self.bits |= 1 << i
+
+    def discard(self, i):
+        self.bits &= ~(1 << i)
+
+    def clear(self):
+        self.bits = 0
+
+    def __contains__(self, i):
+        return bool(self.bits >> i & 1)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __iter__(self):
+        """yields the positions in ascending order, in as many steps as there are"""
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def complement(self, size):
+        """:return: the positions below size that are not in the set"""
+        inverse = Bitset()
+        inverse.bits = ((1 << size) - 1) & ~self.bits
+        return inverse
+
+
+class CategoryIndex(object):
+    """
+    Distinct values in display order, with their labels and a prefix index.
+
+    :ivar values: the distinct values, most frequent first when counts are known, by label otherwise
+    :ivar counts: number of features per value, in the same order, or None
+    :ivar unchecked: Bitset of the positions of the unchecked values
+    """
+
+    def __init__(self, values, counts=None):
+        values = list(values)
+        labels = [value_label(v) for v in values]
+        if counts is not None:
+            order = sorted(range(len(values)), key=lambda i: (-counts[i], labels[i].lower()))
+            self.counts = [counts[i] for i in order]
+        else:
+            order = sorted(range(len(values)), key=lambda i: labels[i].lower())
+            self.counts = None
+        self.values = [values[i] for i in order]
+        self.labels = [labels[i] for i in order]
+        self._position = dict((value_key(v), i) for i, v in enumerate(self.values))
+        keyed = sorted((label.lower(), i) for i, label in enumerate(self.labels))
+        self._sorted_labels = [label for label, _ in keyed]
+        self._sorted_positions = [i for _, i in keyed]
+        self.unchecked = Bitset()
+
+    def __len__(self):
+        return len(self.values)
+
+    def position(self, value):
+        """:return: where value is listed, or None"""
+        return self._position.get(value_key(value))
+
+    def search(self, prefix):
+        """:return: positions of the values whose label starts with prefix, ignoring case, in display order"""
+        if not prefix:
+            return range(len(self.values))
+        prefix = prefix.lower()
+        first = bisect.bisect_left(self._sorted_labels, prefix)
+        last = bisect.bisect_left(self._sorted_labels, prefix + '\U0010ffff', first)
+        return sorted(self._sorted_positions[first:last])
+
+    def checked_values(self):
+        return [self.values[i] for i in self.unchecked.complement(len(self.values))]
+
+    def unchecked_values(self):
+        return [self.values[i] for i in self.unchecked]
+
+    def set_unchecked(self, values):
+        self.unchecked.clear()
+        for value in values:
+            i = self.position(value)
+            if i is not None:
+                self.unchecked.add(i)
@@ -11,35 +11,267 @@
 # mytext = vlayer.customProperty("mytext", "default text")
 
 
-WIDGET_SETTING_PREFIX = "legend_data_filter_%s"
-
 from qgis.PyQt.QtWidgets import *
-from qgis.PyQt.QtWidgets import QListWidget, QListWidgetItem, QDialog, QComboBox, QTableWidget, QTableWidgetItem, QDialogButtonBox, QMessageBox
-from qgis.PyQt import QtCore
-from qgis.core import QgsMessageLog, QgsAggregateCalculator, Qgis
+from qgis.PyQt.QtWidgets import QListWidget, QListWidgetItem, QDialog, QComboBox, QTableView, QLineEdit, QPushButton, QDialogButtonBox, QMessageBox
+from qgis.PyQt import QtCore, QtGui
+from qgis.core import QgsMessageLog, QgsAggregateCalculator, Qgis, QgsProject
+from qgis.core import QgsApplication, QgsTask, QgsVectorLayerFeatureSource, QgsFeatureRequest, QgsSpatialIndex
 from qgis.core import QgsMapLayer, QgsExpression, QgsExpressionContext, QgsExpressionContextUtils
 from qgis.PyQt.QtCore import QDate, QDateTime
 from qgis.gui import QgsLayerTreeEmbeddedWidgetProvider, QgsLayerTreeEmbeddedWidgetRegistry
-from .qrangeslider import QRangeSlider
-
+from .qrangeslider import QPaintedRangeSlider
+from .filter_perf import PERF, TRACER
+from .filter_config import FilterConfig
+from .filter_stats import FieldStats
+from .tail_follow import TailReader, delimited_text_source
+from .feature_loader import AttributeLoader, ExpressionLoader, SqliteLoader, loader_for, sqlite_source
+from .parquet_stats import ParquetFooter, parquet_path
+from .zone_map import BLOCK_SIZE, ColumnStore
+from .duckdb_engine import DuckDbEngine, EngineError, available as duckdb_available
+from .parallel_stats import WORKERS, parallel_summaries
+from .category_index import TOP_VALUES, CategoryIndex, value_counts, value_key
+from .trigram_index import TrigramIndex
+from .semi_join import JoinTable, joined_fields
+from .extent_index import ExtentTracker
+
+import contextlib
+import datetime
+import hashlib
+import json
 import numbers
 import math
-
-
-class CategoryFilterWidget(QWidget):
-    def __init__(self, parent, field_name, unique_values, is_spacious=False):
+import os
+import re
+import time
+
+
+def _map_canvas():
+    """returns the main map canvas, or None when running outside the QGIS desktop"""
+    try:
+        from qgis.utils import iface
+    except ImportError:
+        return None
+    return iface.mapCanvas() if iface is not None else None
+
+
+# positions on a RangeSlider run from 0 to SLIDER_STEPS
+SLIDER_STEPS = 100
+# the subset string as it is carried in the uri of OGR, delimited text and database layers
+SUBSET_IN_URI = re.compile(r"\|subset=.*$| sql=.*$|[?&]subset=[^&]*$|(?<=[?&])subset=[^&]*&")
+
+
+def source_uri(db):
+    """:return: the data source uri of a provider without the subset string, which every filter changes"""
+    return SUBSET_IN_URI.sub("", db.dataSourceUri())
+
+
+def source_fingerprint(layer):
+    """
+    cheap identity of the data behind a layer: its fields, its source and, for
+    file based sources, the file's size and modification time. Saved filter
+    statistics are only reused while this is unchanged.
+    """
+    db = layer.dataProvider()
+    parts = ["%s:%s" % (field.name(), field.type()) for field in db.fields()]
+    if hasattr(db, 'dataSourceUri'):
+        uri = source_uri(db)
+        parts.append(uri)
+        path = uri.split('|')[0]
+        if os.path.isfile(path):
+            st = os.stat(path)
+            parts.append("%d:%d" % (st.st_size, int(st.st_mtime)))
+    return hashlib.sha1("\n".join(parts).encode('utf-8')).hexdigest()
+
+
+@contextlib.contextmanager
+def unfiltered(layer):
+    """
+    lifts the subset string off the provider of layer for the duration, so that featureCount
+    and the feature sources made meanwhile cover every feature. A feature source keeps the
+    subset string it was made with, and goes on reading every feature once the filter is back.
+    """
+    db = layer.dataProvider()
+    subset = db.subsetString() if hasattr(db, 'subsetString') else ""
+    if subset:
+        db.setSubsetString("")
+    try:
+        yield
+    finally:
+        if subset:
+            db.setSubsetString(subset)
+
+
+def range_query_value(slider_num, slider_max, fmin, fmax, is_date_or_time, is_numeric):
+    """converts a slider position into the literal used in the subset string"""
+    num = (float(slider_num)/slider_max) * (fmax - fmin) + fmin
+
+    if is_date_or_time and not is_numeric:
+        msecs = int(num) if abs(num) > 30000000000 else int(num * 1000)
+        dt = QDateTime.fromMSecsSinceEpoch(msecs)
+        return "'" + dt.toString("yyyy-MM-dd HH:mm:ss") + "'"
+
+    if fmax == fmin:
+        return str(fmax)
+
+    if num == fmax:
+      if fmax - fmin > 10:
+        return str(math.ceil(num))
+      else:
+        num += 0.01
+        return str(num)
+    elif fmax - fmin > 10:
+        return str(int(num))
+    else:
+        return str(num)
+
+
+def to_timestamp(val):
+    """converts date and time values to epoch seconds, leaving anything else as it is"""
+    if hasattr(val, 'toMSecsSinceEpoch'):
+        return val.toMSecsSinceEpoch() / 1000.0
+    elif type(val) is QtCore.QDate:
+        return QtCore.QDateTime(val).toMSecsSinceEpoch() / 1000.0
+    elif hasattr(val, 'toPython'):
+        return val.toPython().timestamp()
+    elif type(val) is datetime.date:
+        return datetime.datetime(val.year, val.month, val.day).timestamp()
+    elif type(val) is datetime.datetime:
+        return val.timestamp()
+    return val
+
+
+def remap_range_state(state, steps, old_min, old_max, new_min, new_max):
+    """
+    :return: a range filter state for a new min/max, with the handles of a moved
+        filter kept as close as the steps allow to the values they were on
+    """
+    if not state.get("dirty") or old_max == old_min or new_max == new_min:
+        return dict(state)
+    def position(pos):
+        value = (float(pos) / steps) * (old_max - old_min) + old_min
+        return min(steps, max(0, int(round((value - new_min) / (new_max - new_min) * steps))))
+    remapped = dict(state)
+    remapped["start"] = position(state["start"])
+    remapped["end"] = position(state["end"])
+    return remapped
+
+
+def range_filter_clause(field_name, start_value, end_value):
+    filter_clause1 = '"%s" >= %s' % (field_name, start_value)
+    filter_clause2 = '"%s" <= %s' % (field_name, end_value)
+    return filter_clause1 + ' AND ' + filter_clause2
+
+
+def category_filter_clause(field_name, checked_values, all_checked):
+    if all_checked:
+        return ""
+    if not checked_values:
+        return "1 = 0"
+
+    formatted_values = []
+    has_null = False
+    for v in checked_values:
+        if v is None:
+            has_null = True
+        elif isinstance(v, (int, float)):
+            formatted_values.append(str(v))
+        else:
+            formatted_values.append("'" + str(v).replace("'", "''") + "'")
+
+    conditions = []
+    if formatted_values:
+        in_clause = ", ".join(formatted_values)
+        conditions.append(f'"{field_name}" IN ({in_clause})')
+    if has_null:
+        conditions.append(f'"{field_name}" IS NULL')
+
+    if not conditions:
+        return "1 = 0"
+    return " OR ".join(conditions)
+
+
+def category_exclusion_clause(field_name, unchecked_values):
+    """filters out the unchecked values, for categories where most values stay checked"""
+    formatted_values = []
+    has_null = False
+    for v in unchecked_values:
+        if value_key(v) is None:
+            has_null = True
+        elif isinstance(v, (int, float)):
+            formatted_values.append(str(v))
+        else:
+            formatted_values.append("'" + str(v).replace("'", "''") + "'")
+    if not formatted_values:
+        return f'"{field_name}" IS NOT NULL' if has_null else ""
+    not_in = f'"{field_name}" NOT IN ({", ".join(formatted_values)})'
+    # NOT IN never lets NULL through
+    return not_in if has_null else f'({not_in} OR "{field_name}" IS NULL)'
+
+
+def text_filter_clause(field_name, text, like="LIKE"):
+    """
+    lets through the values containing text, ignoring case
+
+    :param like: "ILIKE" where the provider has it, "LIKE" where LIKE ignores case already
+    """
+    pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    pattern = pattern.replace("'", "''")
+    # backslash is the default escape for ILIKE providers, SQL dialects need it named
+    escape = "" if like == "ILIKE" else " ESCAPE '\\'"
+    return f'"{field_name}" {like} \'{pattern}\'{escape}'
+
+
+def category_clause(field_name, values, unchecked):
+    """:return: the clause for a category with the unchecked values left out, listing the fewer of checked and unchecked"""
+    unchecked = set(value_key(v) for v in unchecked)
+    if not unchecked:
+        return ""
+    if len(values) > LARGE_CATEGORY_THRESHOLD and 2 * len(unchecked) <= len(values):
+        return category_exclusion_clause(field_name, [v for v in values if value_key(v) in unchecked])
+    return category_filter_clause(field_name, [v for v in values if value_key(v) not in unchecked], False)
+
+
+class FilterWidget(QWidget):
+    """
+    what every filter widget has: the label with its field's name, the parent it reports changes to,
+    and the context menu, which the parent shows with showFilterMenu
+    """
+
+    def __init__(self, parent, field_name, is_spacious=False):
         QWidget.__init__(self)
         self.parent = parent
         self.field_name = field_name
-        self._dirty = False
         self.is_spacious = is_spacious
+        self._dirty = False
+        self._interaction_time = None
+        self.installEventFilter(self)
 
-        layout = QVBoxLayout() if is_spacious else QHBoxLayout()
+    def _labelledLayout(self):
+        """:return: the widget's layout, holding the label so far"""
+        layout = QVBoxLayout() if self.is_spacious else QHBoxLayout()
         self.setLayout(layout)
+        label = QLabel(self.field_name)
+        label.setToolTip(self.field_name)
+        label.setFixedWidth(120 if self.is_spacious else 60)
+        layout.addWidget(label)
+        layout.setContentsMargins(0, 0, 0, 0)
+        return layout
+
+    def eventFilter(self, source, event):
+        if event.type() == QtCore.QEvent.ContextMenu and source is self:
+            if hasattr(self.parent, 'showFilterMenu'):
+                self.parent.showFilterMenu(self, event.globalPos())
+            return True
+        return False
+
+    def interactionTime(self):
+        return self._interaction_time
 
-        label = QLabel(field_name)
-        label.setToolTip(field_name)
-        label.setFixedWidth(120 if is_spacious else 60)
+
+class CategoryFilterWidget(FilterWidget):
+    def __init__(self, parent, field_name, unique_values, is_spacious=False):
+        FilterWidget.__init__(self, parent, field_name, is_spacious)
+        layout = self._labelledLayout()
 
         self.list_widget = QListWidget()
         if not is_spacious:
@@ -56,40 +288,7 @@ class CategoryFilterWidget(QWidget):
             self.list_widget.addItem(item)
 
         self.list_widget.itemChanged.connect(self.on_value_changed)
-
-        layout.addWidget(label)
         layout.addWidget(self.list_widget)
-        layout.setContentsMargins(0, 0, 0, 0)
-
-        self.installEventFilter(self)
-
-    def eventFilter(self, source, event):
-        if event.type() == QtCore.QEvent.ContextMenu and source is self:
-            menu = QMenu()
-            action_hide = menu.addAction('Hide')
-            action_number = menu.addAction('Treat as Number')
-            action_date = menu.addAction('Treat as Date')
-            action_category = menu.addAction('Treat as Category')
-            menu.addSeparator()
-            action_options = menu.addAction('Options...')
-            selected_action = menu.exec_(event.globalPos())
-            if selected_action == action_hide:
-                if hasattr(self.parent, 'on_coerce_slider_hide'):
-                    self.parent.on_coerce_slider_hide(self)
-            elif selected_action == action_number:
-                if hasattr(self.parent, 'on_coerce_slider_number'):
-                    self.parent.on_coerce_slider_number(self)
-            elif selected_action == action_date:
-                if hasattr(self.parent, 'on_coerce_slider_date'):
-                    self.parent.on_coerce_slider_date(self)
-            elif selected_action == action_category:
-                if hasattr(self.parent, 'on_coerce_slider_category'):
-                    self.parent.on_coerce_slider_category(self)
-            elif selected_action == action_options:
-                if hasattr(self.parent, 'on_options_menu'):
-                    self.parent.on_options_menu()
-            return True
-        return False
 
     def getRangeFilter(self):
         if not self._dirty:
@@ -103,34 +302,43 @@ class CategoryFilterWidget(QWidget):
                 checked_values.append(item.data(QtCore.Qt.UserRole))
             else:
                 all_checked = False
+        return category_filter_clause(self.field_name, checked_values, all_checked)
 
-        if all_checked:
-            return ""
-        if not checked_values:
-            return "1 = 0"
-
-        formatted_values = []
-        has_null = False
-        for v in checked_values:
-            if v is None:
-                has_null = True
-            elif isinstance(v, (int, float)):
-                formatted_values.append(str(v))
-            else:
-                formatted_values.append("'" + str(v).replace("'", "''") + "'")
-
-        conditions = []
-        if formatted_values:
-            in_clause = ", ".join(formatted_values)
-            conditions.append(f'"{self.field_name}" IN ({in_clause})')
-        if has_null:
-            conditions.append(f'"{self.field_name}" IS NULL')
-
-        if not conditions:
-            return "1 = 0"
-        return " OR ".join(conditions)
+    def getState(self):
+        unchecked = []
+        for i in range(self.list_widget.count()):
+            item = self.list_widget.item(i)
+            if item.checkState() != QtCore.Qt.Checked:
+                unchecked.append(item.data(QtCore.Qt.UserRole))
+        return {"unchecked": unchecked, "dirty": self._dirty}
+
+    def setState(self, state):
+        """restores getState() output without notifying the parent"""
+        unchecked = set(state.get("unchecked", []))
+        self.list_widget.blockSignals(True)
+        for i in range(self.list_widget.count()):
+            item = self.list_widget.item(i)
+            item.setCheckState(QtCore.Qt.Unchecked if item.data(QtCore.Qt.UserRole) in unchecked else QtCore.Qt.Checked)
+        self.list_widget.blockSignals(False)
+        self._dirty = state.get("dirty", False)
+
+    def setValues(self, unique_values):
+        """replaces the listed values, keeping unchecked ones unchecked"""
+        state = self.getState()
+        self.list_widget.blockSignals(True)
+        self.list_widget.clear()
+        for val in unique_values:
+            val_str = str(val) if val is not None else "NULL"
+            item = QListWidgetItem(val_str)
+            item.setData(QtCore.Qt.UserRole, val)
+            item.setFlags(item.flags() | QtCore.Qt.ItemIsUserCheckable)
+            item.setCheckState(QtCore.Qt.Checked)
+            self.list_widget.addItem(item)
+        self.list_widget.blockSignals(False)
+        self.setState(state)
 
     def on_value_changed(self, item=None):
+        self._interaction_time = time.perf_counter()
         if not self._dirty:
             QgsMessageLog.logMessage("Switching category field %s to dirty" % self.field_name, 'Range Filter Plugin', level=Qgis.Info)
             self._dirty = True
@@ -138,10 +346,510 @@ class CategoryFilterWidget(QWidget):
 
 
 
+# categories with more values than this get a LargeCategoryFilterWidget
+LARGE_CATEGORY_THRESHOLD = 100
+
+
+class CategoryValueModel(QtCore.QAbstractListModel):
+    """
+    Checkable list over a CategoryIndex, showing the values that match the search
+    TOP_VALUES at a time as the view scrolls.
+    """
+
+    def __init__(self, index, parent=None):
+        super(CategoryValueModel, self).__init__(parent)
+        self.category_index = index
+        # positions in the index of the values matching the search
+        self.rows = index.search("")
+        self._fetched = min(TOP_VALUES, len(self.rows))
+        # called with no arguments whenever a value is checked or unchecked
+        self.on_toggled = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self._fetched
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self._fetched < len(self.rows)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        more = min(TOP_VALUES, len(self.rows) - self._fetched)
+        if more <= 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self._fetched, self._fetched + more - 1)
+        self._fetched += more
+        self.endInsertRows()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        i = self.rows[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            counts = self.category_index.counts
+            label = self.category_index.labels[i]
+            return label if counts is None else "%s (%d)" % (label, counts[i])
+        if role == QtCore.Qt.CheckStateRole:
+            return QtCore.Qt.Unchecked if i in self.category_index.unchecked else QtCore.Qt.Checked
+        if role == QtCore.Qt.UserRole:
+            return self.category_index.values[i]
+        return None
+
+    def flags(self, index):
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if role != QtCore.Qt.CheckStateRole or not index.isValid():
+            return False
+        i = self.rows[index.row()]
+        if value == QtCore.Qt.Checked:
+            self.category_index.unchecked.discard(i)
+        else:
+            self.category_index.unchecked.add(i)
+        self.dataChanged.emit(index, index)
+        if self.on_toggled is not None:
+            self.on_toggled()
+        return True
+
+    def setSearch(self, prefix):
+        self.beginResetModel()
+        self.rows = self.category_index.search(prefix)
+        self._fetched = min(TOP_VALUES, len(self.rows))
+        self.endResetModel()
+
+    def setIndex(self, index):
+        self.beginResetModel()
+        self.category_index = index
+        self.rows = index.search("")
+        self._fetched = min(TOP_VALUES, len(self.rows))
+        self.endResetModel()
+
+
+class LargeCategoryFilterWidget(CategoryFilterWidget):
+    """
+    Category filter for fields with many values: a search box and a lazily filled list,
+    most frequent values first, over a CategoryIndex instead of one item per value.
+    """
+
+    def __init__(self, parent, field_name, unique_values, counts=None, is_spacious=False):
+        # the label, but none of the list items of a CategoryFilterWidget
+        FilterWidget.__init__(self, parent, field_name, is_spacious)
+        layout = self._labelledLayout()
+
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("Search %d values" % len(unique_values))
+        self.search.textChanged.connect(self.on_search_changed)
+
+        self.model = CategoryValueModel(CategoryIndex(unique_values, counts), self)
+        self.model.on_toggled = self.on_value_changed
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        self.list_view.setFixedHeight(120 if is_spacious else 60)
+
+        column = QVBoxLayout()
+        column.setContentsMargins(0, 0, 0, 0)
+        column.addWidget(self.search)
+        column.addWidget(self.list_view)
+        layout.addLayout(column)
+
+    def getRangeFilter(self):
+        if not self._dirty:
+            return ""
+        index = self.model.category_index
+        unchecked = len(index.unchecked)
+        if unchecked == 0:
+            return ""
+        if 2 * unchecked <= len(index):
+            return category_exclusion_clause(self.field_name, index.unchecked_values())
+        return category_filter_clause(self.field_name, index.checked_values(), False)
+
+    def getState(self):
+        return {"unchecked": self.model.category_index.unchecked_values(), "dirty": self._dirty}
+
+    def setState(self, state):
+        """restores getState() output without notifying the parent"""
+        self.model.category_index.set_unchecked(state.get("unchecked", []))
+        self.model.setIndex(self.model.category_index)
+        self._dirty = state.get("dirty", False)
+
+    def setValues(self, unique_values, counts=None):
+        """replaces the listed values, keeping unchecked ones unchecked"""
+        state = self.getState()
+        self.model.setIndex(CategoryIndex(unique_values, counts))
+        self.setState(state)
+
+    def on_search_changed(self, text):
+        self.model.setSearch(text)
+
+
+class TextFilterWidget(FilterWidget):
+    """filters a free-text field on what it contains"""
+
+    def __init__(self, parent, field_name, like="LIKE", is_spacious=False):
+        FilterWidget.__init__(self, parent, field_name, is_spacious)
+        self.like = like
+        layout = self._labelledLayout()
+
+        self.line_edit = QLineEdit()
+        self.line_edit.setPlaceholderText("contains...")
+        self.line_edit.textChanged.connect(self.on_value_changed)
+        layout.addWidget(self.line_edit)
+
+    def text(self):
+        return self.line_edit.text()
+
+    def getRangeFilter(self):
+        if not self._dirty or not self.text():
+            return ""
+        return text_filter_clause(self.field_name, self.text(), self.like)
+
+    def getState(self):
+        return {"text": self.text(), "dirty": self._dirty}
+
+    def setState(self, state):
+        """restores getState() output without notifying the parent"""
+        self.line_edit.blockSignals(True)
+        self.line_edit.setText(state.get("text", ""))
+        self.line_edit.blockSignals(False)
+        self._dirty = state.get("dirty", False)
+
+    def on_value_changed(self, text=None):
+        self._interaction_time = time.perf_counter()
+        self._dirty = True
+        self.parent.on_slider_changed(self)
+
+
+def category_filter_widget(parent, field_name, values, counts=None, is_spacious=False):
+    """:return: a CategoryFilterWidget, or a LargeCategoryFilterWidget for many values"""
+    if len(values) > LARGE_CATEGORY_THRESHOLD:
+        return LargeCategoryFilterWidget(parent, field_name, values, counts, is_spacious=is_spacious)
+    return CategoryFilterWidget(parent, field_name, values, is_spacious=is_spacious)
+
+
+# data types offered in the options dialog, and the coercion each one is saved as
+FIELD_TYPES = ["Hidden/Ignore", "Number", "Date", "Category", "Text"]
+COERCION_FOR_TYPE = {"Hidden/Ignore": "HIDDEN", "Number": "NUMBER", "Date": "DATE", "Category": "CATEGORY", "Text": "TEXT"}
+TYPE_FOR_COERCION = dict((v, k) for k, v in COERCION_FOR_TYPE.items())
+# engines offered in the options dialog, and how each one is saved
+ENGINE_FOR_LABEL = {"Provider": "provider", "DuckDB": "duckdb"}
+LABEL_FOR_ENGINE = dict((v, k) for k, v in ENGINE_FOR_LABEL.items())
+
+# categories with more distinct values than this are flagged in the options dialog
+CATEGORY_WARN_LIMIT = 10
+# counting distinct values for the options dialog stops past this many
+CATEGORY_COUNT_LIMIT = 1000
+
+# statistics of this many fields or more of a GeoPackage or SpatiaLite layer are gathered on worker threads
+PARALLEL_MIN_FIELDS = 4
+
+# (layer id, field name) -> number of distinct values, shared by every dialog and widget
+CATEGORY_SIZE_CACHE = {}
+
+
+def count_distinct(source, field_index, limit=CATEGORY_COUNT_LIMIT, is_canceled=None):
+    """
+    counts the distinct values of one field of a feature source, without geometries
+
+    :return: the count, or limit + 1 if there are more than limit
+    """
+    loader = AttributeLoader(source, [(field_index, field_index, False)])
+    return count_distinct_fields(loader, limit, is_canceled)[field_index]
+
+
+def count_distinct_fields(loader, limit=CATEGORY_COUNT_LIMIT, is_canceled=None, total=None, progress=None):
+    """
+    counts the distinct values of every field a loader reads, in one pass
+
+    :return: field name -> count, or limit + 1 for fields with more than limit
+    """
+    names = [name for name, _, _ in loader.columns]
+    seen = dict((name, set()) for name in names)
+    open_fields = set(names)
+    for chunk in loader.chunks(total, progress, is_canceled):
+        for name in list(open_fields):
+            values = seen[name]
+            for value in chunk.values(name):
+                try:
+                    values.add(value)
+                except TypeError:
+                    values.add(str(value)) # unhashable, e.g. a QVariant NULL
+            if len(values) > limit:
+                open_fields.discard(name)
+        if not open_fields:
+            break # every field is past the limit
+    return dict((name, min(len(values), limit + 1)) for name, values in seen.items())
+
+
+class _CallbackTask(QgsTask):
+    """
+    a cancelable task whose work() runs in the background. Feature sources may be read from the task's
+    thread, layers may not; one made under unfiltered() reads every feature, whatever the filter
+    """
+
+    def __init__(self, description, done=None):
+        QgsTask.__init__(self, description, QgsTask.CanCancel)
+        # called with the task on the main thread once it is over
+        self.done = done
+
+    def work(self):
+        """:return: True if it succeeded"""
+        raise NotImplementedError
+
+    def run(self):
+        return self.work()
+
+    def finished(self, result):
+        if self.done is not None:
+            self.done(self)
+
+
+class CategorySizeTask(_CallbackTask):
+    """counts the distinct values of some fields of a layer in the background"""
+
+    def __init__(self, layer, field_names, done=None):
+        _CallbackTask.__init__(self, "Counting categories of %s" % layer.name(), done)
+        self.loader = loader_for(layer, field_names, source=QgsVectorLayerFeatureSource(layer))
+        self.total = layer.featureCount()
+        self.counts = {}
+
+    def work(self):
+        if self.loader.columns:
+            self.counts = count_distinct_fields(self.loader, is_canceled=self.isCanceled,
+                                                total=self.total, progress=self.setProgress)
+        return not self.isCanceled()
+
+
+# range and category filtered values held in memory for live match counts, at most
+IN_MEMORY_VALUE_LIMIT = 4000000
+# text filters with more matches than this are left to LIKE in the provider, fewer are sent as feature ids
+ID_FILTER_LIMIT = 5000
+# providers whose subset strings are QGIS expressions, with ILIKE and $id
+EXPRESSION_PROVIDERS = ('memory', 'delimitedtext')
+
+
+class ColumnStoreTask(_CallbackTask):
+    """loads the filtered columns of a layer into a ColumnStore in the background"""
+
+    def __init__(self, layer, field_names, done=None):
+        _CallbackTask.__init__(self, "Loading %s for filtering" % layer.name(), done)
+        self.loader = loader_for(layer, field_names, source=QgsVectorLayerFeatureSource(layer), chunk_size=BLOCK_SIZE)
+        self.total = layer.featureCount()
+        self.store = None
+
+    def work(self):
+        self.store = ColumnStore.load(self.loader, self.total, self.setProgress, self.isCanceled)
+        return self.store is not None
+
+
+class EngineCountTask(_CallbackTask):
+    """counts the features a subset string lets through with the DuckDB engine, in the background"""
+
+    def __init__(self, engine, subset, done=None):
+        _CallbackTask.__init__(self, "Counting matches", done)
+        self.engine = engine
+        self.subset = subset
+        self.count = None
+        self.error = None
+
+    def work(self):
+        try:
+            with PERF.timed('count_duckdb'):
+                self.count = self.engine.count(self.subset)
+        except EngineError as e:
+            self.error = e
+        return self.error is None
+
+
+class TextIndexTask(_CallbackTask):
+    """builds the TrigramIndex of a text filtered field in the background"""
+
+    def __init__(self, layer, field_name, done=None):
+        _CallbackTask.__init__(self, "Indexing %s of %s" % (field_name, layer.name()), done)
+        self.field_name = field_name
+        self.loader = loader_for(layer, [field_name], source=QgsVectorLayerFeatureSource(layer))
+        self.total = layer.featureCount()
+        self.index = None
+
+    def work(self):
+        self.index = TrigramIndex.load(self.loader, self.field_name, self.total, self.setProgress, self.isCanceled)
+        return self.index is not None
+
+
+class ExpressionColumnTask(_CallbackTask):
+    """evaluates the expression of an expression slider on every feature into a ColumnStore in the background"""
+
+    def __init__(self, layer, expression_text, done=None):
+        _CallbackTask.__init__(self, "Computing %s of %s" % (expression_text, layer.name()), done)
+        self.field_name = expression_text
+        # the context is built and the expression prepared here, on the main thread
+        context = QgsExpressionContext(QgsExpressionContextUtils.globalProjectLayerScopes(layer))
+        expression = QgsExpression(expression_text)
+        expression.prepare(context)
+        self.loader = ExpressionLoader(QgsVectorLayerFeatureSource(layer), [(expression_text, expression)], context,
+                                       chunk_size=BLOCK_SIZE)
+        self.total = layer.featureCount()
+        self.store = None
+
+    def work(self):
+        self.store = ColumnStore.load(self.loader, self.total, self.setProgress, self.isCanceled)
+        return self.store is not None
+
+
+class ExtentIndexTask(_CallbackTask):
+    """
+    builds a spatial index of a layer and reads the values of its filtered fields in the background,
+    for statistics of the features in view
+    """
+
+    def __init__(self, layer, field_names, range_names=(), done=None):
+        _CallbackTask.__init__(self, "Indexing the features of %s" % layer.name(), done)
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.loader = loader_for(layer, field_names, source=self.source)
+        # range statistics hold dates as timestamps
+        self.convert = dict((name, to_timestamp) for name in range_names)
+        self.tracker = None
+
+    def work(self):
+        index = QgsSpatialIndex(self.source.getFeatures(QgsFeatureRequest().setSubsetOfAttributes([])))
+        if self.isCanceled():
+            return False
+        self.tracker = ExtentTracker.load(index, self.loader, self.convert, self.isCanceled)
+        return self.tracker is not None
+
+
+class FieldTypeModel(QtCore.QAbstractTableModel):
+    """fields of a layer, the data type chosen for each and, for categories, their size"""
+
+    COLUMNS = ["Field", "Data Type", "Distinct"]
+    NAME, TYPE, DISTINCT = range(3)
+
+    def __init__(self, names, types, counts=None, parent=None):
+        super(FieldTypeModel, self).__init__(parent)
+        self.names = list(names)
+        self.types = list(types)
+        # field name -> row
+        self._rows = dict((name, row) for row, name in enumerate(self.names))
+        # field name -> distinct values, None while being counted
+        self.counts = dict(counts or {})
+        # called with the field names that were switched to Category and have no count yet
+        self.on_uncounted_categories = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.names)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def _countText(self, row):
+        name = self.names[row]
+        if self.types[row] != "Category" or name not in self.counts:
+            return ""
+        count = self.counts[name]
+        if count is None:
+            return "..."
+        return "%d+" % CATEGORY_COUNT_LIMIT if count > CATEGORY_COUNT_LIMIT else str(count)
+
+    def _tooLarge(self, row):
+        count = self.counts.get(self.names[row])
+        return self.types[row] == "Category" and count is not None and count > CATEGORY_WARN_LIMIT
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        name = self.names[row]
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            if column == self.NAME:
+                return name
+            if column == self.TYPE:
+                return self.types[row]
+            return self._countText(row)
+        if role == QtCore.Qt.UserRole:
+            # sort key
+            if column == self.DISTINCT:
+                count = self.counts.get(name) if self.types[row] == "Category" else None
+                return -1 if count is None else count
+            return self.data(index, QtCore.Qt.DisplayRole).lower()
+        if role == QtCore.Qt.ForegroundRole and column == self.DISTINCT and self._tooLarge(row):
+            return QtGui.QColor('#c00000')
+        if role == QtCore.Qt.ToolTipRole and self._tooLarge(row):
+            return "Are you sure? There are %s distinct items!" % self._countText(row)
+        return None
+
+    def flags(self, index):
+        flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        if index.column() == self.TYPE:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if role != QtCore.Qt.EditRole or index.column() != self.TYPE or value not in FIELD_TYPES:
+            return False
+        self.setTypes([index.row()], value)
+        return True
+
+    def setTypes(self, rows, value):
+        """assigns one data type to many fields at once"""
+        rows = sorted(rows)
+        if not rows:
+            return
+        for row in rows:
+            self.types[row] = value
+        self.dataChanged.emit(self.index(rows[0], self.TYPE), self.index(rows[-1], self.DISTINCT))
+        if value == "Category":
+            self.requestCounts([self.names[row] for row in rows])
+
+    def requestCounts(self, names):
+        uncounted = [name for name in names if name not in self.counts]
+        for name in uncounted:
+            self.counts[name] = None
+        if uncounted and self.on_uncounted_categories is not None:
+            self.on_uncounted_categories(uncounted)
+
+    def appendField(self, name, field_type):
+        row = len(self.names)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.names.append(name)
+        self.types.append(field_type)
+        self._rows[name] = row
+        self.endInsertRows()
+
+    def setCounts(self, counts):
+        self.counts.update(counts)
+        rows = [self._rows[name] for name in counts if name in self._rows]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), self.DISTINCT), self.index(max(rows), self.DISTINCT))
+
+
+class FieldTypeDelegate(QStyledItemDelegate):
+    """edits the data type column with a combo box, only while a cell is being edited"""
+
+    def createEditor(self, parent, option, index):
+        editor = QComboBox(parent)
+        editor.addItems(FIELD_TYPES)
+        # commit as soon as a type is picked
+        editor.activated.connect(lambda *args: (self.commitData.emit(editor), self.closeEditor.emit(editor)))
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(index.data(QtCore.Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), QtCore.Qt.EditRole)
+
+
 class OptionsDialog(QDialog):
     def __init__(self, layer, parent=None, default_hidden=False):
         super(OptionsDialog, self).__init__(parent)
         self.layer = layer
+        # share the widget's configuration so it sees the changes without reading them back
+        self.config = getattr(parent, 'config', None)
+        if self.config is None:
+            self.config = FilterConfig.load(layer)
+        self._tasks = []
         self.setWindowTitle("Options...")
         self.setMinimumWidth(400)
         self.setMinimumHeight(300)
@@ -153,133 +861,206 @@ class OptionsDialog(QDialog):
         self.mode_label = QLabel("UI Mode:")
         self.mode_combo = QComboBox()
         self.mode_combo.addItems(["Classic", "Spacious"])
-        current_mode = self.layer.customProperty(WIDGET_SETTING_PREFIX % "UI_MODE", "Classic")
-        self.mode_combo.setCurrentText(current_mode)
+        self.mode_combo.setCurrentText(self.config.ui_mode)
         self.mode_layout.addWidget(self.mode_label)
         self.mode_layout.addWidget(self.mode_combo)
+        # what counts the matching features, DuckDB only when it is installed
+        self.engine_label = QLabel("Engine:")
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItems(["Provider", "DuckDB"] if duckdb_available() else ["Provider"])
+        self.engine_combo.setCurrentText(LABEL_FOR_ENGINE[self.config.engine])
+        self.mode_layout.addWidget(self.engine_label)
+        self.mode_layout.addWidget(self.engine_combo)
         self.layout.addLayout(self.mode_layout)
 
+        # Search
+        self.search = QLineEdit()
+        self.search.setPlaceholderText("Search fields...")
+        self.layout.addWidget(self.search)
+
         # Fields Table
-        self.table = QTableWidget()
         db = self.layer.dataProvider()
         fields = db.fields()
-        self.table.setColumnCount(2)
-        self.table.setRowCount(len(fields))
-        self.table.setHorizontalHeaderLabels(["Field", "Data Type"])
-        self.table.horizontalHeader().setStretchLastSection(True)
-
-        self.field_combos = {}
-
-        slider_names = self.layer.customProperty(WIDGET_SETTING_PREFIX % SLIDER_LIST_CONFIG_NAME, None)
-        active_sliders = set(slider_names.split("###")) if slider_names is not None else None
-
-        for i, field in enumerate(fields):
+        active_sliders = set(self.config.fields) if self.config.fields is not None else None
+        names = []
+        types = []
+        for field in fields:
             field_name = field.name()
-            item = QTableWidgetItem(field_name)
-            item.setFlags(item.flags() & ~QtCore.Qt.ItemIsEditable)
-            self.table.setItem(i, 0, item)
-
-            combo = QComboBox()
-            combo.addItems(["Hidden/Ignore", "Number", "Date", "Category"])
+            names.append(field_name)
 
             # Read existing coercion property or determine default
-            coerced_setting = self.layer.customProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + field_name), None)
-
-            if coerced_setting:
-                if coerced_setting == "HIDDEN":
-                    combo.setCurrentText("Hidden/Ignore")
-                elif coerced_setting == "NUMBER":
-                    combo.setCurrentText("Number")
-                elif coerced_setting == "DATE":
-                    combo.setCurrentText("Date")
-                elif coerced_setting == "CATEGORY":
-                    combo.setCurrentText("Category")
+            coerced_setting = self.config.coerce.get(field_name)
+            if coerced_setting in TYPE_FOR_COERCION:
+                types.append(TYPE_FOR_COERCION[coerced_setting])
+            elif active_sliders is not None and field_name not in active_sliders:
+                types.append("Hidden/Ignore")
+            elif default_hidden:
+                types.append("Hidden/Ignore")
+            elif field.isNumeric():
+                types.append("Number")
+            elif (hasattr(field, 'isDateOrTime') and field.isDateOrTime()) or field.type() in [QtCore.QVariant.Date, QtCore.QVariant.DateTime]:
+                types.append("Date")
             else:
-                if active_sliders is not None and field_name not in active_sliders:
-                    combo.setCurrentText("Hidden/Ignore")
-                elif default_hidden:
-                    combo.setCurrentText("Hidden/Ignore")
-                else:
-                    # Default Logic
-                    if field.isNumeric():
-                        combo.setCurrentText("Number")
-                    elif (hasattr(field, 'isDateOrTime') and field.isDateOrTime()) or field.type() in [QtCore.QVariant.Date, QtCore.QVariant.DateTime]:
-                        combo.setCurrentText("Date")
-                    else:
-                        # Default string etc to Category, we will show warning later if too many
-                        combo.setCurrentText("Category")
-
-            # Connect combo change event to check category size
-            combo.currentTextChanged.connect(lambda text, fname=field_name, c=combo: self.check_category_size(text, fname, c))
-
-            self.table.setCellWidget(i, 1, combo)
-            self.field_combos[field_name] = combo
-
+                # Default string etc to Category, the distinct column flags the ones that are too large
+                types.append("Category")
+
+        # fields added by joins, filtered through their join layer
+        for field_name, join, field in joined_fields(self.layer):
+            names.append(field_name)
+            coerced_setting = self.config.coerce.get(field_name)
+            if coerced_setting in ("NUMBER", "CATEGORY", "HIDDEN"):
+                types.append(TYPE_FOR_COERCION[coerced_setting])
+            elif active_sliders is not None and field_name not in active_sliders or default_hidden:
+                types.append("Hidden/Ignore")
+            else:
+                types.append("Number" if field.isNumeric() else "Category")
+
+        # expressions filtered on like fields, listed after them
+        for expression_text in self.config.expressions:
+            names.append(expression_text)
+            types.append("Number" if active_sliders is None or expression_text in active_sliders else "Hidden/Ignore")
+
+        layer_id = self.layer.id()
+        counts = dict((name, CATEGORY_SIZE_CACHE[(layer_id, name)]) for name in names if (layer_id, name) in CATEGORY_SIZE_CACHE)
+        self.model = FieldTypeModel(names, types, counts, self)
+        self.model.on_uncounted_categories = self.count_categories
+
+        self.proxy = QtCore.QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.model)
+        self.proxy.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.proxy.setFilterKeyColumn(FieldTypeModel.NAME)
+        self.proxy.setSortRole(QtCore.Qt.UserRole)
+        self.search.textChanged.connect(self.proxy.setFilterFixedString)
+
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.setItemDelegateForColumn(FieldTypeModel.TYPE, FieldTypeDelegate(self.table))
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.table.setEditTriggers(QAbstractItemView.AllEditTriggers)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
         self.layout.addWidget(self.table)
 
+        # Bulk type assignment
+        self.bulk_layout = QHBoxLayout()
+        self.bulk_combo = QComboBox()
+        self.bulk_combo.addItems(FIELD_TYPES)
+        self.bulk_button = QPushButton("Apply to Selected")
+        self.bulk_button.setToolTip("Sets the data type of the selected fields, or of every field shown if none are selected")
+        self.bulk_button.clicked.connect(self.on_bulk_assign)
+        self.bulk_layout.addWidget(QLabel("Set type:"))
+        self.bulk_layout.addWidget(self.bulk_combo)
+        self.bulk_layout.addWidget(self.bulk_button)
+        self.layout.addLayout(self.bulk_layout)
+
+        # Expression sliders, e.g. on $area
+        self.expression_layout = QHBoxLayout()
+        self.expression_edit = QLineEdit()
+        self.expression_edit.setPlaceholderText("Expression, e.g. $area")
+        self.expression_button = QPushButton("Add Expression")
+        self.expression_button.setToolTip("Adds a slider on the value of an expression, computed once per feature")
+        self.expression_button.clicked.connect(self.on_add_expression)
+        self.expression_layout.addWidget(self.expression_edit)
+        self.expression_layout.addWidget(self.expression_button)
+        self.layout.addLayout(self.expression_layout)
+
         # Dialog Buttons
         self.buttonBox = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         self.buttonBox.accepted.connect(self.accept)
         self.buttonBox.rejected.connect(self.reject)
         self.layout.addWidget(self.buttonBox)
 
-    def check_category_size(self, text, field_name, combo):
-        if text == "Category":
-            try:
-                # Try to get unique values count
-                # Note: For large layers this could be slow, but it's requested functionality
-                idx = self.layer.dataProvider().fieldNameIndex(field_name)
-                unique_values = self.layer.uniqueValues(idx)
-                if len(unique_values) > 10:
-                    reply = QMessageBox.warning(self, "Warning", f"Are you sure? There are {len(unique_values)} distinct items!",
-                                                QMessageBox.Yes | QMessageBox.No)
-                    if reply == QMessageBox.No:
-                        # Reset to previous or Hidden
-                        combo.blockSignals(True)
-                        combo.setCurrentText("Hidden/Ignore")
-                        combo.blockSignals(False)
-            except Exception as e:
-                pass
+        # sizes of the categories already chosen
+        self.model.requestCounts([name for name, t in zip(names, types) if t == "Category"])
+
+    def selected_rows(self):
+        """source rows of the selected fields, or of all the fields the search shows if none are selected"""
+        indexes = self.table.selectionModel().selectedRows()
+        if not indexes:
+            indexes = [self.proxy.index(row, 0) for row in range(self.proxy.rowCount())]
+        return [self.proxy.mapToSource(index).row() for index in indexes]
+
+    def on_bulk_assign(self):
+        self.model.setTypes(self.selected_rows(), self.bulk_combo.currentText())
+
+    def on_add_expression(self):
+        text = self.expression_edit.text().strip()
+        if not text or text in self.model.names:
+            return
+        expression = QgsExpression(text)
+        if expression.hasParserError():
+            QMessageBox.warning(self, "Add Expression", expression.parserErrorString())
+            return
+        self.model.appendField(text, "Number")
+        self.expression_edit.setText("")
+
+    def count_categories(self, field_names):
+        task = CategorySizeTask(self.layer, field_names, done=self.on_categories_counted)
+        self._tasks.append(task)
+        QgsApplication.taskManager().addTask(task)
+
+    def on_categories_counted(self, task):
+        if task in self._tasks:
+            self._tasks.remove(task)
+        layer_id = self.layer.id()
+        for name, count in task.counts.items():
+            CATEGORY_SIZE_CACHE[(layer_id, name)] = count
+        self.model.setCounts(task.counts)
+
+    def _cancel_counts(self):
+        for task in self._tasks:
+            task.done = None
+            task.cancel()
+        self._tasks = []
+
+    def reject(self):
+        self._cancel_counts()
+        super(OptionsDialog, self).reject()
 
     def accept(self):
+        self._cancel_counts()
+
         # Save mode
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % "UI_MODE", self.mode_combo.currentText())
+        self.config.ui_mode = self.mode_combo.currentText()
+        self.config.engine = ENGINE_FOR_LABEL.get(self.engine_combo.currentText(), "provider")
 
         # Save fields
+        field_names = set(field.name() for field in self.layer.dataProvider().fields())
+        field_names.update(name for name, _, _ in joined_fields(self.layer))
         sliders = []
-        for field_name, combo in self.field_combos.items():
-            val = combo.currentText()
-            if val == "Hidden/Ignore":
-                self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + field_name), "HIDDEN")
-            elif val == "Number":
-                self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + field_name), "NUMBER")
-                sliders.append(field_name)
-            elif val == "Date":
-                self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + field_name), "DATE")
-                sliders.append(field_name)
-            elif val == "Category":
-                self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + field_name), "CATEGORY")
+        expressions = []
+        for field_name, field_type in zip(self.model.names, self.model.types):
+            coercion = COERCION_FOR_TYPE[field_type]
+            if field_name not in field_names:
+                # an expression, dropped once hidden
+                if coercion != "HIDDEN":
+                    expressions.append(field_name)
+                    sliders.append(field_name)
+                continue
+            self.config.coerce[field_name] = coercion
+            if coercion != "HIDDEN":
                 sliders.append(field_name)
 
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % SLIDER_LIST_CONFIG_NAME, "###".join(sliders))
+        self.config.expressions = expressions
+        self.config.fields = sliders
+        self.config.save(self.layer)
         super(OptionsDialog, self).accept()
         if hasattr(self.parent(), 'on_options_closed'):
             self.parent().on_options_closed()
 
 
-class RangeSlider(QWidget):
+class RangeSlider(FilterWidget):
     def __init__(self, parent, field_name, fmin, fmax, is_date_or_time=False, is_numeric=False, is_spacious=False):
         if not isinstance(fmin, numbers.Number) or not isinstance(fmax, numbers.Number):
           raise ValueError("Min or Max is not a number")
         self.is_date_or_time = is_date_or_time
         self.is_numeric = is_numeric
-        QWidget.__init__(self)
-        self.parent = parent
-        self.field_name = field_name
+        FilterWidget.__init__(self, parent, field_name, is_spacious)
         self.fmin = fmin
         self.fmax = fmax
-        self._dirty = False
-        self.slider = QRangeSlider()
+        self.slider = QPaintedRangeSlider()
         self.slider.setDrawValues(True, self)
         self.slider.setFixedHeight(24 if is_spacious else 16)
         self.slider.startValueChanged.connect(self.on_value_changed)
@@ -290,20 +1071,10 @@ class RangeSlider(QWidget):
 
         #self.on_value_changed()
 
-        layout = QVBoxLayout() if is_spacious else QHBoxLayout()
-        label = QLabel(field_name)
-        label.setToolTip(field_name)
-        label.setFixedWidth(120 if is_spacious else 60)
-        layout.addWidget(label)
+        layout = self._labelledLayout()
         layout.addWidget(self.slider)
-
         if is_spacious:
             layout.setContentsMargins(0, 5, 0, 10)
-        else:
-            layout.setContentsMargins(0, 0, 0, 0)
-        self.setLayout(layout)
-
-        self.installEventFilter(self)
 
     def pretty(self, slider_num):
         num = (float(slider_num)/self.slider.max()) * (self.fmax - self.fmin) + self.fmin
@@ -355,59 +1126,11 @@ class RangeSlider(QWidget):
         return pretty_out
 
     def getQueryValue(self, slider_num):
-        num = (float(slider_num)/self.slider.max()) * (self.fmax - self.fmin) + self.fmin
-
-        if self.is_date_or_time and not self.is_numeric:
-            msecs = int(num) if abs(num) > 30000000000 else int(num * 1000)
-            dt = QDateTime.fromMSecsSinceEpoch(msecs)
-            return "'" + dt.toString("yyyy-MM-dd HH:mm:ss") + "'"
-
-        if self.fmax == self.fmin:
-            return str(self.fmax)
-
-        if num == self.fmax:
-          if self.fmax - self.fmin > 10:
-            return str(math.ceil(num))
-          else:
-            num += 0.01
-            return str(num)
-        elif self.fmax - self.fmin > 10:
-            return str(int(num))
-        else:
-            return str(num)
-
+        return range_query_value(slider_num, self.slider.max(), self.fmin, self.fmax, self.is_date_or_time, self.is_numeric)
 
-    def eventFilter(self, source, event):
-        # handle right click removal of features to filter
-        if (event.type() == QtCore.QEvent.ContextMenu and
-            source is self):
-            menu = QMenu()
-            action_hide = menu.addAction('Hide')
-            action_number = menu.addAction('Treat as Number')
-            action_date = menu.addAction('Treat as Date')
-            action_category = menu.addAction('Treat as Category')
-            menu.addSeparator()
-            action_options = menu.addAction('Options...')
-
-            selected_action = menu.exec_(event.globalPos())
-            if selected_action == action_hide:
-                if hasattr(self.parent, 'on_coerce_slider_hide'):
-                    self.parent.on_coerce_slider_hide(self)
-            elif selected_action == action_number:
-                if hasattr(self.parent, 'on_coerce_slider_number'):
-                    self.parent.on_coerce_slider_number(self)
-            elif selected_action == action_date:
-                if hasattr(self.parent, 'on_coerce_slider_date'):
-                    self.parent.on_coerce_slider_date(self)
-            elif selected_action == action_category:
-                if hasattr(self.parent, 'on_coerce_slider_category'):
-                    self.parent.on_coerce_slider_category(self)
-            elif selected_action == action_options:
-                if hasattr(self.parent, 'on_options_menu'):
-                    self.parent.on_options_menu()
 
-            return True
-        return False #super(DataRangeSliders, self).eventFilter(source, event)
+    def interactionTime(self):
+        return self.slider.interactionTime()
 
     def _getStartEndValuesStr(self):
         return (self.getQueryValue(self.slider.start()), self.getQueryValue(self.slider.end()))
@@ -417,10 +1140,27 @@ class RangeSlider(QWidget):
           return ""
 
         (start_actual_val, end_actual_val) = self._getStartEndValuesStr()
-        filter_clause1 = '"%s" >= %s' % (self.field_name, start_actual_val)
-        filter_clause2 = '"%s" <= %s' % (self.field_name, end_actual_val)
-        filter_clause = filter_clause1 + ' AND ' + filter_clause2
-        return filter_clause
+        return range_filter_clause(self.field_name, start_actual_val, end_actual_val)
+
+    def getState(self):
+        return {"start": self.slider.start(), "end": self.slider.end(), "dirty": self._dirty}
+
+    def setState(self, state):
+        """restores getState() output without notifying the parent"""
+        self.slider.blockSignals(True)
+        self.slider.setRange(state.get("start", 0), state.get("end", self.slider.max()))
+        self.slider.blockSignals(False)
+        self._dirty = state.get("dirty", False)
+
+    def setStats(self, fmin, fmax):
+        """moves the ends of the scale, e.g. after the layer was edited"""
+        state = remap_range_state(self.getState(), self.slider.max(), self.fmin, self.fmax, fmin, fmax)
+        self.fmin = fmin
+        self.fmax = fmax
+        self.slider.setEnabled(fmin != fmax)
+        self.setState(state)
+        self.slider.invalidateLabels()
+        self.slider.update()
 
     def on_value_changed(self):
         if self._dirty == False:
@@ -428,7 +1168,256 @@ class RangeSlider(QWidget):
           self._dirty = True
         self.parent.on_slider_changed(self)
 
-SLIDER_LIST_CONFIG_NAME = "!!SLIDERS!!"
+# the features in view are updated this long after the map extent last changed, in milliseconds
+EXTENT_INTERVAL_MS = 200
+# while a filter is dragged its matches are counted at most this often, in milliseconds
+MATCH_COUNT_INTERVAL_MS = 100
+# while a filter is dragged its position is saved to the layer at most this often, in milliseconds
+SAVE_INTERVAL_MS = 1000
+# follow mode reads a growing file at most this often, in milliseconds
+FOLLOW_INTERVAL_MS = 500
+
+# configurations with more filters than this are shown in a FilterListView
+VIRTUAL_LIST_THRESHOLD = 30
+# tallest the scrolling filter list grows before it scrolls, in pixels
+VIRTUAL_LIST_MAX_HEIGHT = 320
+
+
+class FilterEntry(object):
+    """
+    One filter kept as plain data, for FilterListView.
+
+    Rows that are scrolled out of view have no widget at all, only their
+    entry. When a row comes into view the entry builds a RangeSlider or
+    CategoryFilterWidget as its editor and acts as that editor's parent:
+    every change the editor reports is recorded in the entry and passed on
+    to the owning DataLayerRangeFilterWidget as if the entry had changed.
+    """
+
+    def __init__(self, owner, field_name, kind, is_spacious=False, fmin=None, fmax=None, is_date_or_time=False, is_numeric=False, values=None, counts=None, like="LIKE", expression=None, joined=None):
+        if kind == 'range' and (not isinstance(fmin, numbers.Number) or not isinstance(fmax, numbers.Number)):
+            raise ValueError("Min or Max is not a number")
+        self.owner = owner
+        self.field_name = field_name
+        self.kind = kind
+        self.is_spacious = is_spacious
+        self.fmin = fmin
+        self.fmax = fmax
+        self.is_date_or_time = is_date_or_time
+        self.is_numeric = is_numeric
+        self.values = list(values) if values is not None else []
+        self.counts = counts
+        self.like = like
+        self.expression = expression
+        self.joined = joined
+        if kind == 'range':
+            self.state = {"start": 0, "end": SLIDER_STEPS, "dirty": False}
+        elif kind == 'text':
+            self.state = {"text": "", "dirty": False}
+        else:
+            self.state = {"unchecked": [], "dirty": False}
+        self._interaction_time = None
+
+    def rowHeight(self):
+        if self.kind == 'range':
+            return 55 if self.is_spacious else 18
+        if self.kind == 'text':
+            return 46 if self.is_spacious else 22
+        if len(self.values) > LARGE_CATEGORY_THRESHOLD:
+            return 150 if self.is_spacious else 84
+        return 100 if self.is_spacious else 42
+
+    def createEditor(self):
+        if self.kind == 'range':
+            editor = RangeSlider(self, self.field_name, self.fmin, self.fmax, self.is_date_or_time, self.is_numeric, is_spacious=self.is_spacious)
+        elif self.kind == 'text':
+            editor = TextFilterWidget(self, self.field_name, self.like, is_spacious=self.is_spacious)
+        else:
+            editor = category_filter_widget(self, self.field_name, self.values, self.counts, is_spacious=self.is_spacious)
+        editor.setState(self.state)
+        return editor
+
+    def getRangeFilter(self):
+        if not self.state["dirty"]:
+            return ""
+        if self.kind == 'range':
+            start = range_query_value(self.state["start"], SLIDER_STEPS, self.fmin, self.fmax, self.is_date_or_time, self.is_numeric)
+            end = range_query_value(self.state["end"], SLIDER_STEPS, self.fmin, self.fmax, self.is_date_or_time, self.is_numeric)
+            return range_filter_clause(self.field_name, start, end)
+        if self.kind == 'text':
+            return text_filter_clause(self.field_name, self.state["text"], self.like) if self.state["text"] else ""
+        return category_clause(self.field_name, self.values, self.state["unchecked"])
+
+    def getState(self):
+        return self.state
+
+    def setState(self, state):
+        self.state = dict(state)
+
+    def setStats(self, fmin, fmax):
+        self.state = remap_range_state(self.state, SLIDER_STEPS, self.fmin, self.fmax, fmin, fmax)
+        self.fmin = fmin
+        self.fmax = fmax
+
+    def setValues(self, values, counts=None):
+        self.values = list(values)
+        self.counts = counts
+
+    def interactionTime(self):
+        return self._interaction_time
+
+    # the parent interface the filter widgets talk to
+
+    def on_slider_changed(self, editor):
+        self.state = editor.getState()
+        self._interaction_time = editor.interactionTime()
+        self.owner.on_slider_changed(self)
+
+    def showFilterMenu(self, editor, pos):
+        self.owner.showFilterMenu(self, pos)
+
+
+class FilterListModel(QtCore.QAbstractListModel):
+    """list model over FilterEntry objects"""
+
+    def __init__(self, parent=None):
+        super(FilterListModel, self).__init__(parent)
+        self.entries = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entries[index.row()]
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+            return entry.field_name
+        if role == QtCore.Qt.SizeHintRole:
+            return QtCore.QSize(0, entry.rowHeight())
+        return None
+
+    def flags(self, index):
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsEditable
+
+    def append(self, entry):
+        row = len(self.entries)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.entries.append(entry)
+        self.endInsertRows()
+
+    def remove(self, entry):
+        row = self.entries.index(entry)
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.entries[row]
+        self.endRemoveRows()
+
+    def setEntries(self, entries):
+        self.beginResetModel()
+        self.entries = list(entries)
+        self.endResetModel()
+
+
+class FilterItemDelegate(QStyledItemDelegate):
+    """
+    Paints rows without editors as a label and an empty track, and builds
+    the real filter widget when the view opens an editor on a row.
+    """
+
+    def sizeHint(self, option, index):
+        return index.data(QtCore.Qt.SizeHintRole)
+
+    def paint(self, painter, option, index):
+        entry = index.model().entries[index.row()]
+        rect = option.rect
+        label_width = 120 if entry.is_spacious else 60
+        painter.save()
+        painter.setPen(option.palette.color(QtGui.QPalette.Text))
+        painter.drawText(rect.adjusted(0, 0, -(rect.width() - label_width), 0), QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter, entry.field_name)
+        if entry.kind == 'range':
+            track = rect.adjusted(label_width, 2, 0, -2)
+        else:
+            track = rect.adjusted(label_width, 0, 0, 0)
+        painter.fillRect(track, QtGui.QColor('#e6e6e6'))
+        painter.restore()
+
+    def createEditor(self, parent, option, index):
+        editor = index.model().entries[index.row()].createEditor()
+        editor.setParent(parent)
+        editor.setAutoFillBackground(True)
+        return editor
+
+    def setEditorData(self, editor, index):
+        # entries hand their state to the editor when it is created
+        pass
+
+    def setModelData(self, editor, model, index):
+        # the entry already recorded every change as it happened
+        pass
+
+    def updateEditorGeometry(self, editor, option, index):
+        editor.setGeometry(option.rect)
+
+
+class FilterListView(QListView):
+    """
+    Scrolling list of filters that keeps editors open only for visible rows.
+
+    Opening a layer with hundreds of configured fields creates one
+    FilterEntry per field and only as many widgets as fit on screen; as the
+    list scrolls, editors of rows that leave the viewport are closed and new
+    ones are built for rows that enter it.
+    """
+
+    def __init__(self, parent=None):
+        super(FilterListView, self).__init__(parent)
+        self.setModel(FilterListModel(self))
+        self.setItemDelegate(FilterItemDelegate(self))
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setSpacing(1)
+        self._open_rows = set()
+        self.verticalScrollBar().valueChanged.connect(self._sync_editors)
+        self.model().rowsInserted.connect(self._on_rows_changed)
+        self.model().rowsRemoved.connect(self._on_rows_changed)
+        self.model().modelReset.connect(self._on_rows_changed)
+
+    def _on_rows_changed(self, *args):
+        # row numbers shift, so start from a clean slate
+        for row in self._open_rows:
+            self.closePersistentEditor(self.model().index(row))
+        self._open_rows = set()
+        total = sum(e.rowHeight() + 2 for e in self.model().entries)
+        self.setFixedHeight(min(total + 2 * self.frameWidth(), VIRTUAL_LIST_MAX_HEIGHT))
+        QtCore.QTimer.singleShot(0, self._sync_editors)
+
+    def resizeEvent(self, event):
+        super(FilterListView, self).resizeEvent(event)
+        self._sync_editors()
+
+    def _visible_rows(self):
+        model = self.model()
+        if model.rowCount() == 0:
+            return set()
+        rect = self.viewport().rect()
+        first = self.indexAt(rect.topLeft())
+        last = self.indexAt(rect.bottomLeft())
+        if not first.isValid():
+            return set()
+        end = last.row() if last.isValid() else model.rowCount() - 1
+        return set(range(first.row(), end + 1))
+
+    def _sync_editors(self, *args):
+        visible = self._visible_rows()
+        model = self.model()
+        for row in self._open_rows - visible:
+            self.closePersistentEditor(model.index(row))
+        for row in visible - self._open_rows:
+            self.openPersistentEditor(model.index(row))
+        self._open_rows = visible
+
+
 class DataLayerRangeFilterWidget(QWidget):
 
     def __init__(self, layer):
@@ -442,26 +1431,92 @@ class DataLayerRangeFilterWidget(QWidget):
         self.layer = layer
         self.sliders = []
         self.layout = layout
+        # scrolling FilterListView holding FilterEntry objects, for layers with many filters
+        self._filter_list = None
+        self._render_started = None
+        # how the last filter reached the data, see _filter_strategy; interaction latencies are reported per strategy
+        self.filter_strategy = 'subset'
+
+        # field name -> (kind, stats) of every filter placed, saved with the project so it can be rebuilt without scanning
+        self._stats = {}
+        # field name -> (coercion, spacious) each live filter was built with, to tell which ones a config change affects
+        self._built_with = {}
+        # field name -> FieldStats kept up to date as the layer is edited
+        self._field_stats = {}
+        # field name -> (min, max) read ahead for the range fields about to be scanned
+        self._prefetched_ranges = {}
+        # field name -> distinct values read ahead for the text fields, None when there are too many
+        self._prefetched_values = {}
+        # [data source uri, Parquet file or None, (size, mtime) read, ParquetFooter]
+        self._parquet = None
+        # range filtered columns held in memory once a filter is moved, and the task loading them
+        self._store = None
+        self._store_task = None
+        # number of features in the layer whatever its filter, counted when first needed
+        self._total = None
+        # a match count is due once MATCH_COUNT_INTERVAL_MS have passed
+        self._count_pending = False
+        # the filter positions are saved once SAVE_INTERVAL_MS have passed, or before the project is written
+        self._save_pending = False
+        # field name -> TrigramIndex of each text filtered field, and the tasks building them
+        self._text_indexes = {}
+        self._text_index_tasks = {}
+        # expression text -> ColumnStore of its values per feature for each expression slider, the tasks
+        # computing them, and ((low, high), clause) of the last filter composed from each
+        self._expression_columns = {}
+        self._expression_tasks = {}
+        self._expression_clauses = {}
+        # field name -> (target key field, JoinTable) of each filter on a joined field, ((state), clause)
+        # of the last filter composed from each, and the join layers watched for edits by id
+        self._join_tables = {}
+        self._join_clauses = {}
+        self._join_layers = {}
+        self._join_refresh_pending = False
+        # features in the visible map extent with their values, the task indexing them, and
+        # field name -> FieldStats of the features in view
+        self._extent = None
+        self._extent_task = None
+        self._extent_stats = {}
+        self._extent_pending = False
+        # fields whose statistics in view an edit changed, shown once the batch of edits is done
+        self._extent_edited = set()
+        # [data source uri, how its subset strings name the feature id]
+        self._fid_column = None
+        # [data source uri, DuckDbEngine or None] once the DuckDB engine was asked for
+        self._duckdb = None
+        # the EngineCountTask under way, and (subset string, (count, total)) of the last one
+        self._count_task = None
+        self._engine_count = None
+        # (fid, field name) -> value as last edited, until the edits are committed
+        self._edit_values = {}
+        # (operation, fid, field name, value) not yet applied to the statistics
+        self._queued_edits = []
+        # fields edited since the last commit
+        self._touched = set()
+        # follow mode: reader of the rows appended to the layer's file, and the watcher on it
+        self._tail = None
+        self._watcher = None
+        self._follow_pending = False
+        # configured fields whose filters are built the first time the widget is shown
+        self._pending_slider_names = None
+        self._layer_tree_node = None
 
         db = self.layer.dataProvider()
-        # TURN OFF ALL FILTERING prior to analyzing the data
-        # TODO: take whatever filter already exists on the data now and make sure those are
-        # honoured.
-        db.setSubsetString("")
-
-        slider_names = self.layer.customProperty(WIDGET_SETTING_PREFIX % SLIDER_LIST_CONFIG_NAME, None)
-        schema_version = self.layer.customProperty(WIDGET_SETTING_PREFIX % "SCHEMA_VERSION", None)
-
-        if slider_names is not None:
-            if schema_version is None:
-                # Old version: force classic UI to prevent layout breakage
-                self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % "UI_MODE", "Classic")
-                self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % "SCHEMA_VERSION", "2")
-
-            slider_names = slider_names.split("###")
-            for name in slider_names:
-                self._add_filter(name)
+        # read once here, written back through self.config.save()
+        self.config = FilterConfig.load(self.layer)
+
+        if self.config.fields is not None:
+            # Already configured (e.g. project load): don't touch the data until the widget is
+            # shown or the layer is made visible, but keep the last filter applied meanwhile.
+            self._pending_slider_names = list(self.config.fields)
+            self._apply_saved_filter()
+            self._watch_layer_visibility()
         else:
+            # TURN OFF ALL FILTERING prior to analyzing the data
+            # TODO: take whatever filter already exists on the data now and make sure those are
+            # honoured.
+            db.setSubsetString("")
+
             # First time user is setting up this layer
             msg_box = QMessageBox()
             msg_box.setWindowTitle("Setup Range Filters")
@@ -470,8 +1525,6 @@ class DataLayerRangeFilterWidget(QWidget):
             btn_auto = msg_box.addButton("Auto-Pick", QMessageBox.ActionRole)
             msg_box.exec_()
 
-            self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % "SCHEMA_VERSION", "2")
-
             if msg_box.clickedButton() == btn_select:
                 # Let user configure manually
                 dialog = OptionsDialog(self.layer, self, default_hidden=True)
@@ -481,43 +1534,123 @@ class DataLayerRangeFilterWidget(QWidget):
                 # which adds the sliders to the layout, so we don't need to do anything here.
             else:
                 # Auto pick
-                for field in db.fields():
-                    QgsMessageLog.logMessage("Adding slider for field %s" % field.name(), 'Range Filter Plugin', level=Qgis.Warning)
-                    self._add_filter(field.name())
+                QgsMessageLog.logMessage("Adding sliders for %d fields" % len(db.fields()), 'Range Filter Plugin', level=Qgis.Warning)
+                self._add_filters([field.name() for field in db.fields()])
 
-        QgsMessageLog.logMessage("DONE adding sliders", 'Range Filter Plugin', level=Qgis.Warning)
-        self._save_sliders()
+            QgsMessageLog.logMessage("DONE adding sliders", 'Range Filter Plugin', level=Qgis.Warning)
+            self._save_sliders()
+
+        TRACER.set_budget(self.layer.id(), self.config.latency_budget_ms)
+
+        # time from applying a filter until the map canvas has finished redrawing
+        canvas = _map_canvas()
+        if canvas is not None:
+            canvas.mapCanvasRefreshed.connect(self._on_canvas_refreshed)
+            canvas.extentsChanged.connect(self._on_extent_changed)
+
+        self._watch_edits()
 
         # cleanup handling
         self.layer.willBeDeleted.connect(self.onLayerRemoved)
+        QgsProject.instance().writeProject.connect(self._flush_filter_state)
         self.installEventFilter(self)
 
     def onLayerRemoved(self):
+      self._flush_filter_state()
+      try:
+          QgsProject.instance().writeProject.disconnect(self._flush_filter_state)
+      except (TypeError, RuntimeError):
+          pass # not connected
+      self._unwatch_layer_visibility()
+      self._unwatch_join_layers()
+      self._drop_extent()
+      self._stop_following()
+      self._drop_store()
+      self._close_engine()
       self.layer = None
 
+    def _apply_saved_filter(self):
+        """re-applies the subset string the widget last set, without building any filters"""
+        saved = self.config.last_filter
+        db = self.layer.dataProvider()
+        if saved is not None and db.subsetString() != saved:
+            db.setSubsetString(saved)
+
+    def _watch_layer_visibility(self):
+        root = QgsProject.instance().layerTreeRoot()
+        self._layer_tree_node = root.findLayer(self.layer.id()) if root is not None else None
+        if self._layer_tree_node is not None:
+            self._layer_tree_node.visibilityChanged.connect(self._on_layer_visibility_changed)
+
+    def _unwatch_layer_visibility(self):
+        if self._layer_tree_node is not None:
+            try:
+                self._layer_tree_node.visibilityChanged.disconnect(self._on_layer_visibility_changed)
+            except (TypeError, RuntimeError):
+                pass # node already gone
+            self._layer_tree_node = None
+
+    def _on_layer_visibility_changed(self, *args):
+        if self._layer_tree_node is not None and self._layer_tree_node.isVisible():
+            self._ensure_built()
+
+    def showEvent(self, event):
+        QWidget.showEvent(self, event)
+        self._ensure_built()
+
+    def _ensure_built(self):
+        """scans the data and builds the filters that were deferred at construction"""
+        if self._pending_slider_names is None or self.layer is None:
+            return
+        slider_names = self._pending_slider_names
+        self._pending_slider_names = None
+        self._unwatch_layer_visibility()
+
+        snapshot = self._load_snapshot()
+        with PERF.timed('deferred_build', {'layer': self.layer.name(), 'restored': snapshot is not None}):
+            if snapshot is not None:
+                # the saved filter is already applied and matches the restored positions
+                stats, states = snapshot
+                self._add_filters(slider_names, stats)
+                for slider in self.sliders:
+                    if slider.field_name in states:
+                        slider.setState(states[slider.field_name])
+            else:
+                # TURN OFF ALL FILTERING prior to analyzing the data
+                self.layer.dataProvider().setSubsetString("")
+                self.config.last_filter = ""
+                self._add_filters(slider_names)
+        QgsMessageLog.logMessage("DONE adding sliders", 'Range Filter Plugin', level=Qgis.Warning)
+        self._save_sliders()
+        if self.config.follow:
+            self.setFollowing(True)
+        self._refresh_extent()
+
+        current_width = self.width()
+        self.adjustSize()
+        self.resize(current_width, self.height())
+        self.updateGeometry()
+
     def on_options_menu(self):
         dialog = OptionsDialog(self.layer, self)
         dialog.exec_()
 
     def on_options_closed(self):
-        # Clear existing layout and sliders
-        for slider in self.sliders:
-            self.layout.removeWidget(slider)
-            slider.deleteLater()
-        self.sliders = []
+        self._pending_slider_names = None
+        self._unwatch_layer_visibility()
 
-        # Reload
-        slider_names = self.layer.customProperty(WIDGET_SETTING_PREFIX % SLIDER_LIST_CONFIG_NAME, None)
-        if slider_names is not None:
-            slider_names = slider_names.split("###")
-            for name in slider_names:
-                self._add_filter(name)
+        if self.config.fields is not None:
+            field_names = list(self.config.fields)
         else:
             db = self.layer.dataProvider()
-            for field in db.fields():
-                self._add_filter(field.name())
+            field_names = [field.name() for field in db.fields()]
+        with PERF.timed('rebuild', {'layer': self.layer.name()}):
+            self._reconcile(field_names)
         self._save_sliders()
         self.on_slider_changed(None)
+        # the filtered fields may have changed
+        self._drop_extent()
+        self._refresh_extent()
 
         current_width = self.width()
         self.adjustSize()
@@ -531,30 +1664,626 @@ class DataLayerRangeFilterWidget(QWidget):
         #QgsMessageLog.logMessage("Event %d" % event.type(), 'Range Filter Plugin', level=Qgis.Warning)
         db = self.layer.dataProvider()
         db.setSubsetString("")
+        self._unwatch_edits()
+        self._unwatch_join_layers()
+        self._drop_extent()
+        self._stop_following()
+        self._drop_store()
+        self._close_engine()
       return False
 
+    # statistics maintenance while the layer is edited
+
+    def _edit_signals(self):
+        signals = [(self.layer.attributeValueChanged, self._on_attribute_value_changed),
+                   (self.layer.featureAdded, self._on_feature_added),
+                   (self.layer.featuresDeleted, self._on_features_deleted),
+                   (self.layer.committedAttributeValuesChanges, self._on_edits_committed),
+                   (self.layer.afterCommitChanges, self._on_edits_committed),
+                   (self.layer.afterRollBack, self._on_edits_rolled_back)]
+        if hasattr(self.layer, 'geometryChanged'):
+            signals.append((self.layer.geometryChanged, self._on_geometry_changed))
+        return signals
+
+    def _watch_edits(self):
+        if not hasattr(self.layer, 'attributeValueChanged'):
+            return # not a vector layer
+        for signal, slot in self._edit_signals():
+            signal.connect(slot)
+
+    def _unwatch_edits(self):
+        if not hasattr(self.layer, 'attributeValueChanged'):
+            return
+        for signal, slot in self._edit_signals():
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass # never connected
+
+    def _stat_value(self, field_name, value):
+        if self._field_stats[field_name].kind == 'range':
+            return to_timestamp(value)
+        return value
+
+    def _queue_edit(self, op, fid, field_name, value=None):
+        self._queued_edits.append((op, fid, field_name, value))
+        if len(self._queued_edits) == 1:
+            # one pass once the current batch of edits (e.g. a field calculation) is done
+            QtCore.QTimer.singleShot(0, self._flush_edits)
+
+    def _on_attribute_value_changed(self, fid, idx, value):
+        self._drop_expression_columns()
+        fields = self.layer.dataProvider().fields()
+        if 0 <= idx < len(fields) and fields[idx].name() in self._field_stats:
+            self._queue_edit('change', fid, fields[idx].name(), value)
+            self._change_in_view(fid, fields[idx].name(), value)
+
+    def _on_feature_added(self, fid):
+        self._on_data_edited()
+        if not self._field_stats:
+            return
+        feature = self.layer.getFeature(fid)
+        for name in self._field_stats:
+            self._queue_edit('add', fid, name, feature.attribute(name))
+
+    def _on_features_deleted(self, fids):
+        self._on_data_edited()
+        for fid in fids:
+            for name in self._field_stats:
+                self._queue_edit('delete', fid, name)
+
+    def _on_geometry_changed(self, fid, geometry):
+        self._on_data_edited()
+
+    def _change_in_view(self, fid, field_name, value):
+        """brings the features in view up to date with an edited value, without indexing them again"""
+        if self._extent is None:
+            if self._extent_task is not None:
+                # the values being read may predate the edit
+                self._drop_extent()
+                self._on_extent_changed()
+            return
+        stats = self._extent_stats.get(field_name)
+        if stats is None or not self._extent.change(stats, field_name, fid, self._stat_value(field_name, value)):
+            return
+        self._extent_edited.add(field_name)
+        if len(self._extent_edited) == 1:
+            # the filters follow once the current batch of edits is done
+            QtCore.QTimer.singleShot(0, self._show_extent_edits)
+
+    def _show_extent_edits(self):
+        edited, self._extent_edited = self._extent_edited, set()
+        if self.layer is not None and self._extent is not None:
+            self._show_extent_stats(edited)
+
+    def _on_data_edited(self):
+        """drops what was computed from the features as they were: expression values, their count and the features in view"""
+        self._total = None
+        self._drop_expression_columns()
+        if self._extent is not None or self._extent_task is not None:
+            self._drop_extent()
+            self._on_extent_changed()
+
+    def _committed_values(self, fids):
+        """:return: fid -> {field name: value} as stored in the data source"""
+        if not fids:
+            return {}
+        loader = loader_for(self.layer, list(self._field_stats), fids=fids, committed=True)
+        values = {}
+        for chunk in loader.chunks():
+            for i in range(chunk.size):
+                values[chunk.fids[i]] = dict((name, self._stat_value(name, column.get(i)))
+                                             for name, column in chunk.columns.items())
+        return values
+
+    def _flush_edits(self):
+        """applies the queued edits to the statistics, and the statistics to the filters"""
+        edits, self._queued_edits = self._queued_edits, []
+        if self.layer is None or not edits:
+            return
+        self._drop_store()
+        with PERF.timed('edit_stats', {'edits': len(edits)}):
+            # features edited for the first time since the last commit: look up what they held before
+            first_edits = set(fid for op, fid, name, _ in edits
+                              if op != 'add' and fid >= 0 and (fid, name) not in self._edit_values)
+            committed = self._committed_values(first_edits)
+
+            changed = set()
+            for op, fid, name, value in edits:
+                stats = self._field_stats.get(name)
+                if stats is None:
+                    continue
+                self._touched.add(name)
+                key = (fid, name)
+                if op == 'add':
+                    value = self._stat_value(name, value)
+                    if stats.add(value):
+                        changed.add(name)
+                    self._edit_values[key] = value
+                    continue
+                known = key in self._edit_values or name in committed.get(fid, {})
+                old = self._edit_values[key] if key in self._edit_values else committed.get(fid, {}).get(name)
+                if op == 'change':
+                    value = self._stat_value(name, value)
+                    self._edit_values[key] = value
+                    if not known:
+                        stats.remove_unknown()
+                        if stats.add(value):
+                            changed.add(name)
+                    elif stats.change(old, value):
+                        changed.add(name)
+                else:
+                    self._edit_values.pop(key, None)
+                    if not known:
+                        stats.remove_unknown()
+                    elif stats.remove(old):
+                        changed.add(name)
+
+            stale = [name for name, stats in self._field_stats.items() if stats.stale]
+            if stale:
+                self._rescan_stats(stale)
+            self._apply_stats(changed.union(stale))
+        PERF.incr('edits_applied', len(edits))
+
+    def _rescan_stats(self, field_names):
+        """scans fields whose statistics an edit left unknown"""
+        PERF.incr('stats_rescans', len(field_names))
+        db = self.layer.dataProvider()
+        # statistics are taken over all the data
+        with unfiltered(self.layer):
+            self._prefetch_stats(field_names)
+            for name in field_names:
+                stats = self._field_stats[name]
+                idx = db.fieldNameIndex(name)
+                if stats.kind == 'range':
+                    is_date_or_time = self._stats[name][1].get('is_date_or_time', False)
+                    stats.fmin, stats.fmax = self._scan_range(db.fields()[idx], is_date_or_time, self.config.coerce.get(name))
+                else:
+                    stats.values = self._unique_values(name, idx)
+                stats.counts = None
+                stats.stale = False
+            self._clear_prefetched()
+
+    def _apply_stats(self, field_names):
+        if not field_names:
+            return
+        for slider in self.sliders:
+            name = slider.field_name
+            if name not in field_names:
+                continue
+            stats = self._field_stats[name]
+            saved = self._stats[name][1]
+            if stats.kind == 'range':
+                saved['fmin'], saved['fmax'] = stats.fmin, stats.fmax
+            else:
+                saved['values'] = list(stats.values)
+                saved.pop('counts', None) # no longer up to date
+                CATEGORY_SIZE_CACHE[(self.layer.id(), name)] = len(stats.values)
+        if not self.config.extent_only:
+            # otherwise the filters show the statistics of the features in view
+            self._show_stats(dict((name, self._field_stats[name]) for name in field_names if name in self._field_stats))
+
+    def _show_stats(self, stats_by_name):
+        """
+        sets the filters' ranges and values to those of stats_by_name, field name -> FieldStats
+
+        :return: True if that changed the filter, which was then applied again
+        """
+        for slider in self.sliders:
+            stats = stats_by_name.get(slider.field_name)
+            if stats is None:
+                continue
+            if stats.kind == 'range':
+                slider.setStats(stats.fmin, stats.fmax)
+            else:
+                slider.setValues(stats.values)
+        if self._filter_list is not None:
+            self._filter_list._on_rows_changed()
+        if self._compose_filter() != self.config.last_filter:
+            self.on_slider_changed(None)
+            return True
+        return False
+
+    # statistics and match counts of the features in the visible map extent
+
+    def isExtentOnly(self):
+        return self.config.extent_only
+
+    def on_extent_menu(self):
+        self.setExtentOnly(not self.isExtentOnly())
+
+    def setExtentOnly(self, extent_only):
+        self.config.extent_only = extent_only
+        self.config.save(self.layer)
+        if extent_only:
+            self._refresh_extent()
+            return
+        self._drop_extent()
+        # back to the statistics of the whole layer
+        if not self._show_stats(self._field_stats):
+            self._update_match_count()
+
+    def _visible_extent(self):
+        """:return: the map canvas extent in the layer's coordinates, or None outside the QGIS desktop"""
+        canvas = _map_canvas()
+        if canvas is None:
+            return None
+        return canvas.mapSettings().mapToLayerCoordinates(self.layer, canvas.extent())
+
+    def _on_extent_changed(self):
+        if self.config.extent_only and not self._extent_pending:
+            # a pan or zoom changes the extent several times, follow where it ends
+            self._extent_pending = True
+            QtCore.QTimer.singleShot(EXTENT_INTERVAL_MS, self._refresh_extent)
+
+    def _refresh_extent(self):
+        """brings the statistics of the features in view up to date with the map extent, from what entered and left it"""
+        self._extent_pending = False
+        if self.layer is None or not self.config.extent_only:
+            return
+        if self._extent is None:
+            self._load_extent_index()
+            return
+        extent = self._visible_extent()
+        if extent is None:
+            return
+        with PERF.timed('extent_stats'):
+            entered, left = self._extent.move(extent)
+            changed = self._extent.update(self._extent_stats, entered, left)
+        PERF.incr('extent_features_entered', len(entered))
+        PERF.incr('extent_features_left', len(left))
+        self._show_extent_stats(changed)
+
+    def _show_extent_stats(self, changed):
+        """shows the statistics in view of the fields named in changed, and the features in view that match"""
+        # nothing of a field in view: the filter keeps what it showed
+        shown = dict((name, stats) for name, stats in self._extent_stats.items()
+                     if name in changed and (stats.fmin is not None if stats.kind == 'range' else stats.values))
+        if not self._show_stats(shown):
+            self._update_match_count()
+
+    def _load_extent_index(self):
+        """starts indexing the features and values of the filtered fields, unless too many or already on the way"""
+        if self._extent_task is not None or self.layer is None:
+            return
+        names = list(self._field_stats)
+        if not 0 < self._feature_total() * max(1, len(names)) <= IN_MEMORY_VALUE_LIMIT:
+            return
+        range_names = [name for name in names if self._field_stats[name].kind == 'range']
+        with unfiltered(self.layer):
+            self._extent_task = ExtentIndexTask(self.layer, names, range_names, done=self._on_extent_index_loaded)
+        QgsApplication.taskManager().addTask(self._extent_task)
+
+    def _on_extent_index_loaded(self, task):
+        if task is not self._extent_task:
+            return # dropped while loading
+        self._extent_task = None
+        if task.tracker is None:
+            return
+        self._extent = task.tracker
+        # with a multiset, features leaving the view never leave the statistics unknown
+        self._extent_stats = dict((name, FieldStats(stats.kind, counts={})) for name, stats in self._field_stats.items())
+        self._refresh_extent()
+
+    def _drop_extent(self):
+        if self._extent_task is not None:
+            self._extent_task.cancel()
+        self._extent_task = None
+        self._extent = None
+        self._extent_stats = {}
+        self._extent_edited = set()
+
+    # follow mode, for delimited text layers whose file keeps growing
+
+    def _follow_source(self):
+        """:return: the parsed source of a delimited text layer read from a local file, or None"""
+        db = self.layer.dataProvider()
+        if not hasattr(db, 'name') or db.name() != 'delimitedtext':
+            return None
+        source = delimited_text_source(db.dataSourceUri())
+        if source is None or not os.path.isfile(source['path']):
+            return None
+        return source
+
+    def isFollowing(self):
+        return self._tail is not None
+
+    def on_follow_menu(self):
+        self.setFollowing(not self.isFollowing())
+
+    def setFollowing(self, follow):
+        source = self._follow_source() if follow else None
+        if follow and source is None:
+            QMessageBox.information(None, "Follow File", "Follow mode needs a delimited text layer read from a local file.")
+            return
+        self._stop_following()
+        self.config.follow = follow
+        self.config.save(self.layer)
+        if not follow:
+            return
+        self._tail = TailReader.for_source(source, [field.name() for field in self.layer.dataProvider().fields()])
+        self._tail.start()
+        self._watcher = QtCore.QFileSystemWatcher([source['path']])
+        self._watcher.fileChanged.connect(self._on_followed_file_changed)
+
+    def _stop_following(self):
+        if self._watcher is not None:
+            self._watcher.fileChanged.disconnect(self._on_followed_file_changed)
+            self._watcher.deleteLater()
+        self._watcher = None
+        self._tail = None
+
+    def _on_followed_file_changed(self, path):
+        if self._watcher is not None and path not in self._watcher.files() and os.path.exists(path):
+            # replaced rather than appended to: keep watching the new file
+            self._watcher.addPath(path)
+        if not self._follow_pending:
+            # appends tend to come in bursts, read them together
+            self._follow_pending = True
+            QtCore.QTimer.singleShot(FOLLOW_INTERVAL_MS, self._read_followed_file)
+
+    def _parse_followed(self, field_name, text):
+        """converts the text of an appended row to the kind of value the field's statistics hold"""
+        if text is None or text == '':
+            return None
+        stats = self._field_stats[field_name]
+        if stats.kind == 'category':
+            if any(isinstance(v, numbers.Number) for v in stats.values):
+                try:
+                    return int(text)
+                except ValueError:
+                    try:
+                        return float(text)
+                    except ValueError:
+                        return text
+            return text
+        try:
+            return float(text)
+        except ValueError:
+            pass
+        try:
+            return datetime.datetime.fromisoformat(text.strip()).timestamp()
+        except ValueError:
+            return text # not comparable, FieldStats ignores it
+
+    def _may_match(self, row):
+        """False only if the row certainly fails the current filter; unparseable values count as matches"""
+        for slider in self.sliders:
+            state = slider.getState()
+            if not state.get("dirty"):
+                continue
+            name = slider.field_name
+            value = self._parse_followed(name, row.get(name))
+            if self._field_stats[name].kind == 'category':
+                unchecked = set(str(v) for v in state.get("unchecked", []))
+                if str(value) in unchecked or (value is None and "None" in unchecked):
+                    return False
+                continue
+            if value is None:
+                return False # NULL fails a range
+            if not isinstance(value, numbers.Number):
+                continue
+            # one step of slack either way, so rounding in the subset string never hides a row
+            step = (slider.fmax - slider.fmin) / float(SLIDER_STEPS)
+            low = slider.fmin + state["start"] * step - step
+            high = slider.fmin + state["end"] * step + step
+            if not low <= value <= high:
+                return False
+        return True
+
+    def _read_followed_file(self):
+        self._follow_pending = False
+        if self._tail is None or self.layer is None:
+            return
+        rows, truncated = self._tail.read_appended()
+        if truncated:
+            # rewritten from scratch: scan it again
+            self._drop_store()
+            self._rescan_stats(list(self._field_stats))
+            self._tail.start()
+            self._apply_stats(set(self._field_stats))
+            self._reload_followed()
+            return
+        if not rows:
+            return
+        with PERF.timed('follow', {'rows': len(rows)}):
+            changed = set()
+            for row in rows:
+                for name, stats in self._field_stats.items():
+                    if stats.add(self._parse_followed(name, row.get(name))):
+                        changed.add(name)
+            self._append_followed(self._tail.row_lines, rows)
+            visible = any(self._may_match(row) for row in rows)
+            db = self.layer.dataProvider()
+            applied = db.subsetString()
+            self._apply_stats(changed)
+            # a new subset string makes the provider read the file again by itself
+            if visible and db.subsetString() == applied:
+                self._reload_followed()
+        PERF.incr('follow_rows', len(rows))
+
+    def _append_followed(self, fids, rows):
+        """
+        adds rows appended to the followed file to the in-memory columns and text indexes, rather than loading them again
+
+        :param fids: the ids the provider gives the rows
+        """
+        if self._store_task is not None or self._text_index_tasks:
+            # the load may or may not have read them
+            self._drop_store()
+            return
+        if self._total is not None:
+            self._total += len(fids)
+        self._engine_count = None
+        self._drop_expression_columns()
+        if self._store is not None:
+            names = self._store.names + list(self._store.categories)
+            self._store.append(fids, dict((name, [self._parse_followed(name, row.get(name)) for row in rows]) for name in names))
+        for name, index in self._text_indexes.items():
+            index.add(fids, [row.get(name) or None for row in rows])
+        self._count_matches_later()
+
+    def _reload_followed(self):
+        """re-reads the layer's file, so appended rows show on the map"""
+        PERF.incr('follow_reloads')
+        self.layer.reload()
+        self.layer.triggerRepaint()
+
+    def _on_edits_committed(self, *args):
+        self._flush_edits()
+        # the data source holds the edited values now
+        self._edit_values = {}
+        self._touched = set()
+        if self.layer is not None and self.sliders:
+            self._save_sliders()
+
+    def _on_edits_rolled_back(self):
+        self._drop_store()
+        self._queued_edits = []
+        self._edit_values = {}
+        touched = [name for name in self._touched if name in self._field_stats]
+        self._touched = set()
+        if touched:
+            self._rescan_stats(touched)
+            self._apply_stats(set(touched))
+
+    def _reconcile(self, field_names):
+        """
+        brings the filters in line with field_names. Filters whose field is still wanted and
+        whose coercion and layout did not change keep their widget, state and statistics; only
+        new or changed fields are scanned.
+        """
+        is_spacious = self.config.is_spacious()
+        live = dict((slider.field_name, slider) for slider in self.sliders)
+        keep = dict((name, live[name]) for name in field_names
+                    if name in live and self._built_with.get(name) == (self.config.coerce.get(name), is_spacious))
+        to_scan = [name for name in field_names if name not in keep]
+        PERF.incr('filters_kept', len(keep))
+        PERF.incr('filters_scanned', len(to_scan))
+
+        db = self.layer.dataProvider()
+        if to_scan and hasattr(db, 'subsetString') and db.subsetString():
+            # statistics are taken over all the data; on_slider_changed puts the filter back
+            db.setSubsetString("")
+
+        if (len(field_names) > VIRTUAL_LIST_THRESHOLD) != (self._filter_list is not None):
+            # switching between plain widgets and the scrolling list: place the kept filters
+            # again from their statistics instead of scanning them
+            states = dict((name, slider.getState()) for name, slider in keep.items())
+            saved_stats = dict((name, {"kind": self._stats[name][0], "stats": self._stats[name][1]}) for name in keep)
+            self._clear_filters()
+            self._add_filters(field_names, saved_stats)
+            for slider in self.sliders:
+                if slider.field_name in states:
+                    slider.setState(states[slider.field_name])
+            return
+
+        for slider in list(self.sliders):
+            if keep.get(slider.field_name) is not slider:
+                self._drop_filter(slider)
+        self._prefetch_stats(to_scan)
+        for name in to_scan:
+            self._add_filter(name)
+        self._clear_prefetched()
+
+        # configured order
+        order = dict((name, i) for i, name in enumerate(field_names))
+        self.sliders.sort(key=lambda slider: order[slider.field_name])
+        if self._filter_list is not None:
+            self._filter_list.model().setEntries(self.sliders)
+        else:
+            for widget in self.sliders:
+                self.layout.removeWidget(widget)
+                self.layout.addWidget(widget)
+
+    def _drop_filter(self, slider):
+        self.sliders.remove(slider)
+        self._stats.pop(slider.field_name, None)
+        self._built_with.pop(slider.field_name, None)
+        self._field_stats.pop(slider.field_name, None)
+        self._expression_clauses.pop(slider.field_name, None)
+        self._join_clauses.pop(slider.field_name, None)
+        self._join_tables.pop(slider.field_name, None)
+        if self._filter_list is not None:
+            self._filter_list.model().remove(slider)
+        else:
+            self.layout.removeWidget(slider)
+            slider.deleteLater()
+
     def _save_sliders(self):
         slider_names = [slider.field_name for slider in self.sliders]
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % SLIDER_LIST_CONFIG_NAME, "###".join(slider_names))
+        self.config.fields = slider_names
+
+        # statistics snapshot, so the next project load can skip the scan
+        stats = {}
+        for name in slider_names:
+            kind, field_stats = self._stats[name]
+            try:
+                stats[name] = json.loads(json.dumps({"kind": kind, "stats": field_stats}))
+            except (TypeError, ValueError):
+                pass # values that don't serialize are scanned again next time
+        self.config.stats = {"fingerprint": source_fingerprint(self.layer), "fields": stats}
+        self._save_filter_state()
+
+    def _save_filter_state(self):
+        states = {}
+        for slider in self.sliders:
+            state = slider.getState()
+            if state.get("dirty"):
+                try:
+                    states[slider.field_name] = json.loads(json.dumps(state))
+                except (TypeError, ValueError):
+                    pass
+        self.config.states = states
+        self.config.save(self.layer)
+
+    def _save_filter_state_later(self):
+        if not self._save_pending:
+            # each save marks the project modified, a drag is saved where it comes to rest
+            self._save_pending = True
+            QtCore.QTimer.singleShot(SAVE_INTERVAL_MS, self._flush_filter_state)
+
+    def _flush_filter_state(self, *args):
+        """saves the filter positions still waiting for the timer, e.g. as the project is written"""
+        if self._save_pending and self.layer is not None:
+            self._save_pending = False
+            self._save_filter_state()
+
+    def _load_snapshot(self):
+        """:return: (stats, states) saved for this layer, or None if missing or the source has changed since"""
+        saved = self.config.stats
+        if not saved or saved.get("fingerprint") != source_fingerprint(self.layer):
+            return None
+        return saved.get("fields", {}), self.config.states
 
     def _add_filter(self, field_name):
+        if field_name in self.config.expressions:
+            self._add_expression_filter(field_name)
+            return
         db = self.layer.dataProvider()
         i = db.fieldNameIndex(field_name)
+        if i == -1 and self._joined_field(field_name) is not None:
+            self._add_join_filter(field_name)
+            return
         if i != -1:
           field = db.fields()[i]
 
           # retrieve coercion setting if exists
-          coerced_setting = self.layer.customProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + field_name), None)
+          coerced_setting = self.config.coerce.get(field_name)
 
           if coerced_setting == "HIDDEN":
               return
 
-          ui_mode = self.layer.customProperty(WIDGET_SETTING_PREFIX % "UI_MODE", "Classic")
-          is_spacious = (ui_mode == "Spacious")
+          is_spacious = self.config.is_spacious()
+
+          if coerced_setting == "TEXT":
+              self._place_filter(field_name, 'text', is_spacious, like=self._like_operator())
+              return
 
           is_date_or_time = False
           is_numeric = False
           is_category = False
+          unique_values = None
 
           if coerced_setting == "DATE":
               is_date_or_time = True
@@ -569,8 +2298,10 @@ class DataLayerRangeFilterWidget(QWidget):
               elif (hasattr(field, 'isDateOrTime') and field.isDateOrTime()) or field.type() in [QtCore.QVariant.Date, QtCore.QVariant.DateTime]:
                   is_date_or_time = True
               else:
+                  if field_name in self._prefetched_values and self._prefetched_values[field_name] is None:
+                      return # read ahead, and far more than 10 values
                   # Check unique values count for auto-category
-                  unique_values = self.layer.uniqueValues(i)
+                  unique_values = self._unique_values(field_name, i)
                   if 1 < len(unique_values) < 10:
                       is_category = True
                   else:
@@ -578,94 +2309,947 @@ class DataLayerRangeFilterWidget(QWidget):
                       return
 
           if is_category:
-              unique_values = self.layer.uniqueValues(i)
+              if unique_values is None:
+                  unique_values = self._unique_values(field_name, i)
               try:
-                  widget = CategoryFilterWidget(self, field_name, unique_values, is_spacious=is_spacious)
-                  self.layout.addWidget(widget)
-                  widget.show()
-                  self.sliders.append(widget) # re-use sliders array for generic widgets
+                  if len(unique_values) > LARGE_CATEGORY_THRESHOLD:
+                      self._place_filter(field_name, 'category', is_spacious, values=unique_values,
+                                         counts=self._category_counts(field_name, unique_values))
+                  else:
+                      self._place_filter(field_name, 'category', is_spacious, values=unique_values)
               except Exception as e:
                   QgsMessageLog.logMessage("Error for category fieldname %s: %s" % (field_name, str(e)), 'Range Filter Plugin', level=Qgis.Warning)
           else:
-              field_max = self.layer.aggregate(QgsAggregateCalculator.Max, field.name())[0]
-              field_min = self.layer.aggregate(QgsAggregateCalculator.Min, field.name())[0]
-
-              if is_date_or_time:
-                  # convert to timestamp (epoch seconds) for slider
-                  import datetime
-                  def _to_timestamp(val):
-                      if hasattr(val, 'toMSecsSinceEpoch'):
-                          return val.toMSecsSinceEpoch() / 1000.0
-                      elif type(val) is QtCore.QDate:
-                          return QtCore.QDateTime(val).toMSecsSinceEpoch() / 1000.0
-                      elif hasattr(val, 'toPython'):
-                          return val.toPython().timestamp()
-                      elif type(val) is datetime.date:
-                          return datetime.datetime(val.year, val.month, val.day).timestamp()
-                      elif type(val) is datetime.datetime:
-                          return val.timestamp()
-                      return val
-
-                  field_max = _to_timestamp(field_max)
-                  field_min = _to_timestamp(field_min)
-              elif coerced_setting is not None:
-                  # ensure field max/min are numbers in case they were natively dates but forced to numbers
-                  if hasattr(field_max, 'toMSecsSinceEpoch') or type(field_max) in [QtCore.QDate, QtCore.QDateTime] or hasattr(field_max, 'toPython'):
-                      import datetime
-                      def _to_timestamp(val):
-                          if hasattr(val, 'toMSecsSinceEpoch'):
-                              return val.toMSecsSinceEpoch() / 1000.0
-                          elif type(val) is QtCore.QDate:
-                              return QtCore.QDateTime(val).toMSecsSinceEpoch() / 1000.0
-                          elif hasattr(val, 'toPython'):
-                              return val.toPython().timestamp()
-                          elif type(val) is datetime.date:
-                              return datetime.datetime(val.year, val.month, val.day).timestamp()
-                          elif type(val) is datetime.datetime:
-                              return val.timestamp()
-                          return val
-                      field_max = _to_timestamp(field_max)
-                      field_min = _to_timestamp(field_min)
+              field_min, field_max = self._scan_range(field, is_date_or_time, coerced_setting)
 
               try:
-                # Add spacing option to RangeSlider if needed? Will do in next step.
-                slider = RangeSlider(self, field_name, field_min, field_max, is_date_or_time, field.isNumeric(), is_spacious=is_spacious)
-                self.layout.addWidget(slider)
-                slider.show()
-                self.sliders.append(slider)
+                self._place_filter(field_name, 'range', is_spacious, fmin=field_min, fmax=field_max,
+                                   is_date_or_time=is_date_or_time, is_numeric=field.isNumeric())
               except ValueError as v:
                 QgsMessageLog.logMessage("Error for fieldname %s: %s" % (field_name, str(v)), 'Range Filter Plugin', level=Qgis.Warning)
 
+    def _add_expression_filter(self, expression_text):
+        """places a slider on the value of an expression; its range is known once the values are computed"""
+        expression = QgsExpression(expression_text)
+        if expression.hasParserError():
+            QgsMessageLog.logMessage("Error for expression %s: %s" % (expression_text, expression.parserErrorString()), 'Range Filter Plugin', level=Qgis.Warning)
+            return
+        self._place_filter(expression_text, 'range', self.config.is_spacious(), fmin=0, fmax=0,
+                           is_date_or_time=False, is_numeric=True, expression=expression_text)
+
+    def _add_join_filter(self, field_name):
+        """places a filter on a field added by a join, with its statistics read from the join layer"""
+        coerced_setting = self.config.coerce.get(field_name)
+        if coerced_setting == "HIDDEN":
+            return
+        _, field = self._joined_field(field_name)
+        _, table = self._join_table(field_name)
+        is_spacious = self.config.is_spacious()
+        if field.isNumeric() and coerced_setting != "CATEGORY":
+            bounds = table.range()
+            if bounds is None:
+                return # nothing but NULLs
+            self._place_filter(field_name, 'range', is_spacious, fmin=bounds[0], fmax=bounds[1],
+                               is_date_or_time=False, is_numeric=True, joined=field.name())
+            return
+        values = self._joined_values(table)
+        if coerced_setting != "CATEGORY" and not 1 < len(values) - 1 < 10:
+            return # as for fields of the layer itself, NULL aside
+        self._place_filter(field_name, 'category', is_spacious, values=values, joined=field.name())
+
+    def _joined_values(self, table):
+        """:return: the distinct values of a joined field, with NULL for the features no row is joined to"""
+        values = table.distinct_values()
+        if not any(value_key(v) is None for v in values):
+            values.append(None)
+        return values
+
+    def _category_counts(self, field_name, values):
+        """:return: the number of features with each of values, from one grouped query or scan"""
+        found = None
+        engine = self._duckdb_engine()
+        if engine is not None:
+            try:
+                with PERF.timed('value_counts', {'field': field_name, 'engine': 'duckdb'}):
+                    found = engine.value_counts(field_name)
+            except EngineError as e:
+                self._engine_failed(e)
+        if found is None:
+            loader = loader_for(self.layer, [field_name])
+            with PERF.timed('value_counts', {'field': field_name}):
+                if isinstance(loader, SqliteLoader):
+                    found = loader.value_counts(field_name)
+                else:
+                    found = value_counts(loader, field_name)
+        return [found.get(value_key(v), 0) for v in values]
+
+    def _scan_range(self, field, is_date_or_time, coerced_setting):
+        """:return: (min, max) of a range field, as numbers"""
+        if field.name() in self._prefetched_ranges:
+            field_min, field_max = self._prefetched_ranges.pop(field.name())
+        else:
+            with PERF.timed('aggregate', {'field': field.name()}):
+                field_max = self.layer.aggregate(QgsAggregateCalculator.Max, field.name())[0]
+                field_min = self.layer.aggregate(QgsAggregateCalculator.Min, field.name())[0]
+
+        if is_date_or_time:
+            # convert to timestamp (epoch seconds) for slider
+            return to_timestamp(field_min), to_timestamp(field_max)
+        elif coerced_setting is not None:
+            # ensure field max/min are numbers in case they were natively dates but forced to numbers
+            if hasattr(field_max, 'toMSecsSinceEpoch') or type(field_max) in [QtCore.QDate, QtCore.QDateTime] or hasattr(field_max, 'toPython'):
+                return to_timestamp(field_min), to_timestamp(field_max)
+        return field_min, field_max
+
+    def _place_filter(self, field_name, kind, is_spacious, **stats):
+        """adds a filter as a widget, or as a FilterEntry when the scrolling list is in use"""
+        self._stats[field_name] = (kind, stats)
+        if kind == 'category':
+            CATEGORY_SIZE_CACHE[(self.layer.id(), field_name)] = len(stats['values'])
+        self._built_with[field_name] = (self.config.coerce.get(field_name), is_spacious)
+        if kind == 'text':
+            # nothing to keep up to date, matches come from the index
+            self._load_text_index(field_name)
+        elif stats.get('expression'):
+            # nor for an expression, computed again after edits
+            self._load_expression_column(field_name)
+        elif stats.get('joined'):
+            pass # nor for a joined field, whose values are in the join layer
+        else:
+            # categories counted as their values were read keep the counts, so a value whose last feature
+            # is edited away leaves the list; the others, and every range field, hold none, so removing a
+            # range's minimum or maximum marks it stale, to be scanned again by _rescan_stats
+            counts = stats.get('counts')
+            if counts is not None:
+                counts = dict((value_key(value), n) for value, n in zip(stats['values'], counts))
+            self._field_stats[field_name] = FieldStats(kind, fmin=stats.get('fmin'), fmax=stats.get('fmax'),
+                                                       values=stats.get('values'), counts=counts)
+        if self._filter_list is not None:
+            entry = FilterEntry(self, field_name, kind, is_spacious, **stats)
+            self._filter_list.model().append(entry)
+            self.sliders.append(entry)
+            return
+        if kind == 'category':
+            widget = category_filter_widget(self, field_name, stats['values'], stats.get('counts'), is_spacious=is_spacious)
+        elif kind == 'text':
+            widget = TextFilterWidget(self, field_name, stats['like'], is_spacious=is_spacious)
+        else:
+            widget = RangeSlider(self, field_name, stats['fmin'], stats['fmax'], stats['is_date_or_time'], stats['is_numeric'], is_spacious=is_spacious)
+        self.layout.addWidget(widget)
+        widget.show()
+        self.sliders.append(widget) # re-use sliders array for generic widgets
+
+    def _add_filters(self, field_names, saved_stats=None):
+        """
+        adds filters for the given fields, switching to a scrolling list for wide configurations
+
+        :param saved_stats: statistics snapshot by field name; fields found in it are not scanned
+        """
+        if len(field_names) > VIRTUAL_LIST_THRESHOLD and self._filter_list is None:
+            self._filter_list = FilterListView()
+            self.layout.addWidget(self._filter_list)
+        is_spacious = self.config.is_spacious()
+        self._prefetch_stats([name for name in field_names if not saved_stats or name not in saved_stats])
+        for name in field_names:
+            saved = saved_stats.get(name) if saved_stats else None
+            if saved is None:
+                self._add_filter(name)
+                continue
+            try:
+                self._place_filter(name, saved["kind"], is_spacious, **saved["stats"])
+            except ValueError as v:
+                QgsMessageLog.logMessage("Error for fieldname %s: %s" % (name, str(v)), 'Range Filter Plugin', level=Qgis.Warning)
+        self._clear_prefetched()
+
+    def _prefetch_stats(self, field_names):
+        """
+        reads ahead the min/max of the numeric fields among field_names, for _scan_range, and
+        the distinct values of the text ones, for _unique_values: with the DuckDB engine when
+        it is on, from the footer of a Parquet file, or, for a GeoPackage or SpatiaLite layer
+        that can be read directly, on worker threads when there are many fields to scan and
+        else in a single query. Other providers aggregate each field themselves.
+        """
+        db = self.layer.dataProvider()
+        names = []
+        text_names = []
+        for name in field_names:
+            idx = db.fieldNameIndex(name)
+            if idx == -1:
+                continue
+            field = db.fields()[idx]
+            coerced = self.config.coerce.get(name)
+            if field.isNumeric():
+                if coerced in (None, "NUMBER"):
+                    names.append(name)
+            elif coerced == "CATEGORY" or coerced is None and not (
+                    (hasattr(field, 'isDateOrTime') and field.isDateOrTime())
+                    or field.type() in [QtCore.QVariant.Date, QtCore.QVariant.DateTime]):
+                text_names.append(name)
+        engine = self._duckdb_engine()
+        if engine is not None and (names or text_names):
+            try:
+                with PERF.timed('prefetch_stats', {'fields': len(names) + len(text_names), 'engine': 'duckdb'}):
+                    ranges, values = engine.stats(names, text_names)
+                self._prefetched_ranges = dict((name, found) for name, found in ranges.items()
+                                               if all(isinstance(v, numbers.Number) for v in found))
+                self._prefetched_values = dict((name, found if len(found) <= CATEGORY_COUNT_LIMIT else None)
+                                               for name, found in values.items())
+                return
+            except EngineError as e:
+                self._engine_failed(e)
+        footer = self._parquet_footer()
+        if footer is not None:
+            with PERF.timed('prefetch_stats', {'fields': len(names)}):
+                for name in names:
+                    found = footer.column_range(name)
+                    if found is not None and all(isinstance(v, numbers.Number) for v in found):
+                        self._prefetched_ranges[name] = found
+            names = [name for name in names if name not in self._prefetched_ranges]
+        if len(names) + len(text_names) >= PARALLEL_MIN_FIELDS and self._prefetch_parallel(names, text_names):
+            return
+        if footer is not None or len(names) < 2:
+            return # the provider's own aggregate is as quick for a single field
+        loader = loader_for(self.layer, names)
+        if isinstance(loader, SqliteLoader):
+            with PERF.timed('prefetch_stats', {'fields': len(names)}):
+                self._prefetched_ranges = loader.min_max(names)
+
+    def _prefetch_parallel(self, names, text_names):
+        """
+        scans the fields of a GeoPackage or SpatiaLite table on WORKERS threads, each reading a share of the rows
+
+        :return: False for other layers, which a scan per worker would only read several times over
+        """
+        fields = names + text_names
+        loader = loader_for(self.layer, fields)
+        if not isinstance(loader, SqliteLoader):
+            return False
+        loaders = loader.split(WORKERS)
+        with PERF.timed('prefetch_stats', {'fields': len(fields), 'workers': len(loaders)}):
+            summaries = parallel_summaries(loaders, CATEGORY_COUNT_LIMIT)
+        for name in names:
+            found = summaries[name].range() if name in summaries else None
+            if found is not None:
+                self._prefetched_ranges[name] = found
+        for name in text_names:
+            if name in summaries:
+                values = summaries[name].values
+                self._prefetched_values[name] = None if values is None else list(values)
+        return True
+
+    def _unique_values(self, field_name, idx):
+        """:return: the distinct values of a field, read ahead by _prefetch_stats when possible"""
+        if self._prefetched_values.get(field_name) is not None:
+            return self._prefetched_values.pop(field_name)
+        with PERF.timed('uniqueValues', {'field': field_name}):
+            return list(self.layer.uniqueValues(idx))
+
+    def _clear_prefetched(self):
+        self._prefetched_ranges = {}
+        self._prefetched_values = {}
+
+    def _clear_filters(self):
+        if self._filter_list is not None:
+            self.layout.removeWidget(self._filter_list)
+            self._filter_list.deleteLater()
+            self._filter_list = None
+        else:
+            for slider in self.sliders:
+                self.layout.removeWidget(slider)
+                slider.deleteLater()
+        self.sliders = []
+        self._stats = {}
+        self._built_with = {}
+        self._field_stats = {}
+        self._expression_clauses = {}
+        self._join_clauses = {}
+        self._join_tables = {}
+        self._drop_store()
+
     def on_slider_changed(self, the_slider):
-        text = " AND ".join([w.getRangeFilter() for w in self.sliders if w.getRangeFilter() != ""])
+        layer_id = self.layer.id()
+        composed = set()
+        with PERF.timed('compose_filter'):
+            text = self._compose_filter(composed)
+        self.filter_strategy = self._filter_strategy(composed)
+        if the_slider is not None:
+            # the trace starts at the input event, so composing still counts towards it
+            TRACER.begin(layer_id, self.layer.name(), self.filter_strategy, the_slider.interactionTime())
+        TRACER.mark(layer_id, 'compose')
         db = self.layer.dataProvider()
-        db.setSubsetString(text)
+        with PERF.timed('setSubsetString', {'layer': self.layer.name()}):
+            db.setSubsetString(text)
+        self.config.last_filter = text
+        self._save_filter_state_later()
+        self._count_matches_later()
+        TRACER.mark(layer_id, 'reload')
+        PERF.incr('filter_updates')
+        self._render_started = time.perf_counter()
+
+    def _compose_filter(self, composed=None):
+        """:param composed: set to add the ways other than a plain clause the filters were put in: 'ids', 'semi-join' or 'expression'"""
+        composed = set() if composed is None else composed
+        clauses = []
+        for w in self.sliders:
+            if self._is_expression(w):
+                clause = self._expression_filter(w)
+                if clause:
+                    composed.add(self._expression_clauses[w.field_name][2])
+            elif self._is_joined(w):
+                clause = self._join_filter(w)
+                if clause:
+                    composed.add('semi-join')
+            else:
+                clause = self._text_id_filter(w)
+                if clause:
+                    composed.add('ids')
+                else:
+                    clause = w.getRangeFilter()
+            clauses.append(clause)
+        return " AND ".join([c for c in clauses if c != ""])
+
+    def _filter_strategy(self, composed):
+        """:return: how the filter in force reaches the data, for the latencies reported per strategy"""
+        for strategy in ('semi-join', 'expression', 'ids'):
+            if strategy in composed:
+                return strategy
+        if self._count_engine() is not None:
+            return 'duckdb'
+        if self._store is not None and self._store.can_answer(self._active_ranges(), self._active_categories()):
+            return 'memory'
+        return 'subset'
+
+    def _is_joined(self, slider):
+        return bool(self._stats.get(slider.field_name, (None, {}))[1].get('joined'))
+
+    def _join_filter(self, slider):
+        """:return: the clause of a filter on a joined field, as the join keys of the join layer rows it lets through"""
+        name = slider.field_name
+        state = slider.getState()
+        kind = self._stats[name][0]
+        if kind == 'range':
+            key = self._slider_bounds(slider) if state.get("dirty") else None
+        else:
+            key = frozenset(value_key(v) for v in state.get("unchecked", ())) if state.get("dirty") else None
+        if not key:
+            self._join_clauses.pop(name, None)
+            return ""
+        cached = self._join_clauses.get(name)
+        if cached is not None and cached[0] == key and name in self._join_tables:
+            return cached[1]
+        found = self._join_table(name)
+        if found is None:
+            return "" # the join was removed
+        target_field, table = found
+        with PERF.timed('semi_join', {'field': name, 'rows': len(table)}):
+            if kind == 'range':
+                # NULL is never in range, nor are the features no row is joined to
+                keys = table.keys_between(*key)
+                clause = category_filter_clause(target_field, keys, False)
+            elif None in key:
+                keys = [k for value, found in table.keys_by_value().items() if value_key(value) not in key for k in found]
+                clause = category_filter_clause(target_field, keys, False)
+            else:
+                # NULL is let through, and so are the features no row is joined to: leave out the keys of the others
+                keys = [k for value, found in table.keys_by_value().items() if value_key(value) in key for k in found]
+                clause = category_exclusion_clause(target_field, keys)
+        if len(keys) > ID_FILTER_LIMIT:
+            # no shorter way to put it, the target layer has nothing but its key to go by
+            PERF.incr('long_key_filters')
+        self._join_clauses[name] = (key, clause)
+        return clause
+
+    def _is_expression(self, slider):
+        return bool(self._stats.get(slider.field_name, (None, {}))[1].get('expression'))
+
+    def _expression_filter(self, slider):
+        """:return: the clause of a moved expression slider, as the ids of the features whose value is in range"""
+        name = slider.field_name
+        if not slider.getState().get("dirty"):
+            self._expression_clauses.pop(name, None)
+            return ""
+        column = self._expression_columns.get(name)
+        if column is None:
+            self._load_expression_column(name)
+            column = self._expression_columns.get(name)
+        cached = self._expression_clauses.get(name)
+        if column is None:
+            # being computed again after an edit, the last filter stays until it is done
+            return cached[1] if cached is not None else ""
+        bounds = self._slider_bounds(slider)
+        if cached is not None and cached[0] == bounds:
+            return cached[1]
+        with PERF.timed('expression_select', {'field': name}):
+            fids = column.select({name: bounds})
+        db = self.layer.dataProvider()
+        strategy = 'ids'
+        if len(fids) <= ID_FILTER_LIMIT:
+            clause = self._id_filter(fids)
+        elif hasattr(db, 'name') and db.name() in EXPRESSION_PROVIDERS:
+            # too many to list: the provider evaluates the expression itself
+            clause = "(%s) >= %s AND (%s) <= %s" % (name, bounds[0], name, bounds[1])
+            strategy = 'expression'
+        elif len(column) - len(fids) <= ID_FILTER_LIMIT and len(column) == self._feature_total():
+            # most features are in range: name the others, those out of range or NULL. The column
+            # holds every feature, so none gets through for being missing from it
+            selected = set(fids)
+            clause = self._id_filter([fid for block in column.fids for fid in block if fid not in selected], exclude=True)
+        else:
+            # the provider has no shorter way to put it
+            PERF.incr('long_id_filters')
+            clause = self._id_filter(fids)
+        if clause is None:
+            QgsMessageLog.logMessage("Can't filter %s on %s, its provider has no way to name feature ids" % (self.layer.name(), name), 'Range Filter Plugin', level=Qgis.Warning)
+            clause = ""
+        self._expression_clauses[name] = (bounds, clause, strategy)
+        return clause
+
+    def _text_id_filter(self, slider):
+        """:return: a text filter as the ids of the features it matches, when its index has them and they are few, else None"""
+        if self._stats.get(slider.field_name, (None, None))[0] != 'text' or not slider.getRangeFilter():
+            return None
+        index = self._text_indexes.get(slider.field_name)
+        if index is None or self._duckdb_engine() is not None:
+            return None
+        with PERF.timed('text_search'):
+            fids = index.search(slider.getState()["text"])
+        if len(fids) > ID_FILTER_LIMIT:
+            return None
+        return self._id_filter(fids)
+
+    def _id_filter(self, fids, exclude=False):
+        """
+        :param exclude: let through every feature but fids instead
+        :return: a clause letting through the features fids, or None when the provider's subset strings can't name them
+        """
+        if not len(fids):
+            return "" if exclude else "1 = 0"
+        db = self.layer.dataProvider()
+        if not hasattr(db, 'name'):
+            return None
+        ids = ", ".join(str(fid) for fid in sorted(fids))
+        operator = "NOT IN" if exclude else "IN"
+        if db.name() in EXPRESSION_PROVIDERS:
+            return "$id %s (%s)" % (operator, ids)
+        if db.name() not in ('ogr', 'spatialite'):
+            return None
+        uri = source_uri(db)
+        if self._fid_column is None or self._fid_column[0] != uri:
+            source = sqlite_source(self.layer)
+            if source is not None:
+                column = '"%s"' % source['fid'].replace('"', '""')
+            else:
+                column = 'FID' if db.name() == 'ogr' else None # OGR SQL's special field
+            self._fid_column = [uri, column]
+        column = self._fid_column[1]
+        return "%s %s (%s)" % (column, operator, ids) if column is not None else None
+
+    def _like_operator(self):
+        """:return: the operator matching text without regard to case in the layer's subset strings"""
+        db = self.layer.dataProvider()
+        name = db.name() if hasattr(db, 'name') else None
+        # SQLite and OGR SQL compare with LIKE regardless of case already, and have no ILIKE
+        return "ILIKE" if name in EXPRESSION_PROVIDERS + ('postgres',) else "LIKE"
+
+    def _active_texts(self):
+        """:return: field name -> text searched for, of every text filter in use"""
+        return dict((slider.field_name, slider.getState()["text"]) for slider in self.sliders
+                    if self._stats.get(slider.field_name, (None, None))[0] == 'text' and slider.getRangeFilter())
+
+    def _active_expressions(self):
+        """:return: expression text -> (low, high) of every moved expression slider"""
+        return dict((slider.field_name, self._slider_bounds(slider)) for slider in self.sliders
+                    if self._is_expression(slider) and slider.getState().get("dirty"))
+
+    def _indexed_matches(self, texts, expressions=None):
+        """
+        :return: set of the ids of the features every text filter and expression slider matches,
+            None while an index or expression column is not loaded
+        """
+        matched = None
+        for name, text in texts.items():
+            index = self._text_indexes.get(name)
+            if index is None:
+                self._load_text_index(name)
+                return None
+            with PERF.timed('text_search'):
+                found = index.search(text)
+            matched = set(found) if matched is None else matched.intersection(found)
+        for name, bounds in (expressions or {}).items():
+            column = self._expression_columns.get(name)
+            if column is None:
+                self._load_expression_column(name)
+                return None
+            with PERF.timed('expression_select', {'field': name}):
+                found = column.select({name: bounds})
+            matched = set(found) if matched is None else matched.intersection(found)
+        return matched
+
+    def _slider_bounds(self, slider):
+        """:return: (low, high) of a numeric range filter, as in the subset string"""
+        state = slider.getState()
+        return tuple(float(range_query_value(state[end], SLIDER_STEPS, slider.fmin, slider.fmax, False, True))
+                     for end in ("start", "end"))
+
+    def _active_ranges(self):
+        """:return: field name -> (low, high) of every moved numeric range filter on a field, as in the subset string"""
+        ranges = {}
+        for slider in self.sliders:
+            kind, stats = self._stats.get(slider.field_name, (None, None))
+            if kind != 'range' or not slider.getState().get("dirty") or stats.get('is_date_or_time') \
+                    or stats.get('expression') or stats.get('joined'):
+                continue
+            ranges[slider.field_name] = self._slider_bounds(slider)
+        return ranges
+
+    def _active_categories(self):
+        """:return: field name -> values let through, of every category filter with values unchecked"""
+        categories = {}
+        for slider in self.sliders:
+            kind, stats = self._stats.get(slider.field_name, (None, None))
+            state = slider.getState()
+            if kind != 'category' or not state.get("dirty") or not state.get("unchecked") or stats.get('joined'):
+                continue
+            unchecked = set(value_key(v) for v in state["unchecked"])
+            categories[slider.field_name] = [v for v in self._field_stats[slider.field_name].values if value_key(v) not in unchecked]
+        return categories
+
+    def _count_matches_later(self):
+        if not self._count_pending:
+            # a drag moves the filter many times a second, the count follows where it has got to
+            self._count_pending = True
+            QtCore.QTimer.singleShot(MATCH_COUNT_INTERVAL_MS, self._on_count_due)
+
+    def _on_count_due(self):
+        self._count_pending = False
+        if self.layer is not None:
+            self._update_match_count()
+
+    def _update_match_count(self):
+        """shows how many features the filters let through, counted by DuckDB or in memory, as the widget's tooltip"""
+        if self.config.extent_only and self._extent is not None:
+            self._update_extent_count()
+            return
+        engine = self._count_engine()
+        if engine is not None:
+            self._count_with_engine(engine)
+            return
+        ranges = self._active_ranges()
+        categories = self._active_categories()
+        texts = self._active_texts()
+        expressions = self._active_expressions()
+        indexed = list(texts) + list(expressions)
+        if not ranges and not categories and not indexed or self._filters_left_to_provider(ranges, categories, indexed):
+            # nothing filtered, or date filters, which are left to the provider
+            self.setToolTip("")
+            return
+        matched = self._indexed_matches(texts, expressions) if indexed else None
+        if indexed and matched is None:
+            return # counted once the index or column is loaded
+        if not ranges and not categories:
+            self.setToolTip("%d of %d features match" % (len(matched), self._feature_total()))
+            return
+        if self._store is None or not self._store.can_answer(ranges, categories):
+            self._load_store()
+            return
+        if matched is not None:
+            with PERF.timed('count_in_memory'):
+                count = len(matched.intersection(self._store.select(ranges, categories)))
+            self.setToolTip("%d of %d features match" % (count, len(self._store)))
+            return
+        with PERF.timed('count_in_memory'):
+            count, (skipped, accepted, scanned) = self._store.count(ranges, categories)
+        PERF.incr('blocks_skipped', skipped)
+        PERF.incr('blocks_accepted', accepted)
+        PERF.incr('blocks_scanned', scanned)
+        self.setToolTip("%d of %d features match" % (count, len(self._store)))
+
+    def _count_with_engine(self, engine):
+        """counts in a task, one at a time: a filter changed meanwhile is counted once it is over"""
+        subset = self.config.last_filter
+        if not subset:
+            self.setToolTip("")
+        elif self._engine_count is not None and self._engine_count[0] == subset:
+            self.setToolTip("%d of %d features match" % self._engine_count[1])
+        elif self._count_task is None:
+            self._count_task = EngineCountTask(engine, subset, done=self._on_engine_counted)
+            QgsApplication.taskManager().addTask(self._count_task)
+
+    def _on_engine_counted(self, task):
+        if task is not self._count_task:
+            return # dropped while counting
+        self._count_task = None
+        if task.error is not None:
+            self._engine_failed(task.error)
+        elif task.count is not None:
+            self._engine_count = (task.subset, task.count)
+        if self.layer is not None:
+            self._update_match_count()
+
+    def _update_extent_count(self):
+        """shows how many of the features in view the filters let through"""
+        visible = self._extent.visible
+        if not self.config.last_filter:
+            self.setToolTip("%d features in view" % len(visible))
+            return
+        ids = self.matchingFeatureIds()
+        if ids is None:
+            # counted once the columns are in memory, if they can be
+            self.setToolTip("")
+            self._load_store()
+            return
+        with PERF.timed('count_in_view'):
+            count = len(visible.intersection(ids))
+        self.setToolTip("%d of %d features in view match" % (count, len(visible)))
+
+    def matchingFeatureIds(self):
+        """:return: ids of the features the filters let through, from DuckDB or the in-memory columns, or None if neither can tell"""
+        engine = self._count_engine()
+        if engine is not None:
+            try:
+                with PERF.timed('ids_duckdb'):
+                    return engine.matching_ids(self.config.last_filter)
+            except EngineError as e:
+                self._engine_failed(e)
+        ranges = self._active_ranges()
+        categories = self._active_categories()
+        texts = self._active_texts()
+        expressions = self._active_expressions()
+        indexed = list(texts) + list(expressions)
+        if self._filters_left_to_provider(ranges, categories, indexed):
+            return None
+        matched = self._indexed_matches(texts, expressions) if indexed else None
+        if indexed and matched is None:
+            return None
+        if not ranges and not categories:
+            return sorted(matched) if matched is not None else None
+        if self._store is None or not self._store.can_answer(ranges, categories):
+            return None
+        selected = self._store.select(ranges, categories)
+        return list(selected) if matched is None else [fid for fid in selected if fid in matched]
+
+    def _filters_left_to_provider(self, ranges, categories, indexed=()):
+        """whether a filter in the subset string is neither among ranges, categories nor the text and expression filters indexed"""
+        return any(slider.getRangeFilter() and slider.field_name not in ranges and slider.field_name not in categories
+                   and slider.field_name not in indexed for slider in self.sliders)
+
+    def _engine_source(self):
+        """:return: the file of a layer the DuckDB engine can read, described for relation_sql, or None"""
+        source = self._follow_source()
+        if source is not None:
+            return dict(source, kind='csv') if source['type'] == 'csv' else None
+        path = parquet_path(self.layer)
+        if path is not None:
+            return {'kind': 'parquet', 'path': path}
+        source = sqlite_source(self.layer)
+        return dict(source, kind='sqlite') if source is not None else None
+
+    def _duckdb_engine(self):
+        """:return: the DuckDB engine over the layer's file when it is switched on and can read it, else None"""
+        if self.config.engine != "duckdb" or not duckdb_available() or self.layer is None or self.layer.isModified():
+            return None
+        uri = source_uri(self.layer.dataProvider())
+        if self._duckdb is None or self._duckdb[0] != uri:
+            self._close_engine()
+            source = self._engine_source()
+            self._duckdb = [uri, DuckDbEngine(source) if source is not None else None]
+        return self._duckdb[1]
+
+    def _count_engine(self):
+        """:return: the DuckDB engine when it can run the filter in force, whose expression sliders are in QGIS terms, else None"""
+        return None if self._active_expressions() else self._duckdb_engine()
+
+    def _engine_failed(self, error):
+        """falls back to the provider for as long as the data source stays the same"""
+        QgsMessageLog.logMessage("DuckDB engine switched off for %s: %s" % (self.layer.name(), str(error)), 'Range Filter Plugin', level=Qgis.Warning)
+        self._close_engine()
+        self._duckdb = [source_uri(self.layer.dataProvider()), None]
+
+    def _close_engine(self):
+        if self._count_task is not None:
+            self._count_task.cancel()
+        self._count_task = None
+        self._engine_count = None
+        if self._duckdb is not None and self._duckdb[1] is not None:
+            self._duckdb[1].close()
+        self._duckdb = None
+
+    def _load_store(self):
+        """starts loading the numeric range and the category filtered columns into memory, unless too many or already on the way"""
+        if self._store_task is not None or self.layer is None:
+            return
+        names = [name for name, (kind, stats) in self._stats.items()
+                 if not stats.get('joined') and (kind == 'category' or kind == 'range' and not stats.get('is_date_or_time')
+                                                 and not stats.get('expression'))]
+        if not names or not 0 < self._feature_total() * len(names) <= IN_MEMORY_VALUE_LIMIT:
+            return
+        # the columns hold every feature, whatever filter the provider has in force
+        with unfiltered(self.layer):
+            self._store_task = ColumnStoreTask(self.layer, names, done=self._on_store_loaded)
+        QgsApplication.taskManager().addTask(self._store_task)
+
+    def _feature_total(self):
+        """:return: the number of features in the layer, filtered or not, counted once until the data changes"""
+        if self._total is None:
+            with unfiltered(self.layer):
+                self._total = self.layer.featureCount()
+        return self._total
+
+    def _on_store_loaded(self, task):
+        if task is not self._store_task:
+            return # dropped while loading
+        self._store_task = None
+        if task.store is not None:
+            self._store = task.store
+            self._update_match_count()
+
+    def _drop_store(self):
+        """forgets the in-memory columns, text indexes and expression values, e.g. once the data changed; they are loaded again when needed"""
+        if self._store_task is not None:
+            self._store_task.cancel()
+        self._store_task = None
+        self._store = None
+        self._total = None
+        # the engine reads the file at every query, the count of the last one may be out of date
+        self._engine_count = None
+        for task in self._text_index_tasks.values():
+            task.cancel()
+        self._text_index_tasks = {}
+        self._text_indexes = {}
+        self._drop_expression_columns()
+
+    def _load_text_index(self, field_name):
+        """starts indexing a text filtered field, unless the layer is too large or it is already on the way"""
+        if field_name in self._text_index_tasks or self.layer is None:
+            return
+        if not 0 < self._feature_total() <= IN_MEMORY_VALUE_LIMIT:
+            return
+        with unfiltered(self.layer):
+            task = TextIndexTask(self.layer, field_name, done=self._on_text_index_loaded)
+        self._text_index_tasks[field_name] = task
+        QgsApplication.taskManager().addTask(task)
+
+    def _on_text_index_loaded(self, task):
+        if self._text_index_tasks.get(task.field_name) is not task:
+            return # dropped while loading
+        del self._text_index_tasks[task.field_name]
+        if task.index is None:
+            return
+        self._text_indexes[task.field_name] = task.index
+        if self._compose_filter() != self.config.last_filter:
+            self.on_slider_changed(None)
+        else:
+            self._update_match_count()
+
+    def _load_expression_column(self, expression_text):
+        """starts computing the values of an expression slider, unless the layer is too large or it is already on the way"""
+        if expression_text in self._expression_tasks or self.layer is None:
+            return
+        if not 0 < self._feature_total() <= IN_MEMORY_VALUE_LIMIT:
+            return
+        with unfiltered(self.layer):
+            task = ExpressionColumnTask(self.layer, expression_text, done=self._on_expression_loaded)
+        self._expression_tasks[expression_text] = task
+        QgsApplication.taskManager().addTask(task)
+
+    def _on_expression_loaded(self, task):
+        name = task.field_name
+        if self._expression_tasks.get(name) is not task:
+            return # dropped while loading
+        del self._expression_tasks[name]
+        if task.store is None:
+            return
+        self._expression_columns[name] = task.store
+        self._expression_clauses.pop(name, None)
+        bounds = task.store.column_range(name)
+        kind, stats = self._stats.get(name, (None, None))
+        if bounds is not None and stats is not None and (stats['fmin'], stats['fmax']) != bounds:
+            stats.update(fmin=bounds[0], fmax=bounds[1])
+            for slider in self.sliders:
+                if slider.field_name == name:
+                    slider.setStats(*bounds)
+            self._save_sliders()
+        if self._compose_filter() != self.config.last_filter:
+            self.on_slider_changed(None)
+        else:
+            self._update_match_count()
+
+    def _drop_expression_columns(self):
+        """forgets the values of the expression sliders, computed again when needed"""
+        for task in self._expression_tasks.values():
+            task.cancel()
+        self._expression_tasks = {}
+        self._expression_columns = {}
+
+    def _joined_field(self, field_name):
+        """:return: (QgsVectorLayerJoinInfo, QgsField of the join layer) of a field a join adds, or None"""
+        for name, join, field in joined_fields(self.layer):
+            if name == field_name:
+                return join, field
+        return None
+
+    def _join_table(self, field_name):
+        """:return: (target key field, JoinTable) of a joined field, read from the join layer once, or None"""
+        if field_name in self._join_tables:
+            return self._join_tables[field_name]
+        found = self._joined_field(field_name)
+        if found is None:
+            return None
+        join, field = found
+        join_layer = join.joinLayer()
+        loader = loader_for(join_layer, [join.joinFieldName(), field.name()], source=join_layer)
+        with PERF.timed('join_table', {'field': field_name}):
+            table = JoinTable.load(loader, join.joinFieldName(), field.name())
+        self._watch_join_layer(join_layer)
+        self._join_tables[field_name] = (join.targetFieldName(), table)
+        return self._join_tables[field_name]
+
+    def _watch_join_layer(self, join_layer):
+        if join_layer.id() in self._join_layers or not hasattr(join_layer, 'dataChanged'):
+            return
+        join_layer.dataChanged.connect(self._on_join_layer_changed)
+        self._join_layers[join_layer.id()] = join_layer
+
+    def _unwatch_join_layers(self):
+        for join_layer in self._join_layers.values():
+            try:
+                join_layer.dataChanged.disconnect(self._on_join_layer_changed)
+            except (TypeError, RuntimeError):
+                pass # already deleted
+        self._join_layers = {}
+
+    def _on_join_layer_changed(self):
+        self._join_tables = {}
+        if not self._join_refresh_pending:
+            # once the current batch of edits is done
+            self._join_refresh_pending = True
+            QtCore.QTimer.singleShot(0, self._refresh_join_filters)
+
+    def _refresh_join_filters(self):
+        """brings the filters on joined fields up to date with the join layer, and applies them again with the keys it holds now"""
+        self._join_refresh_pending = False
+        joined = [slider for slider in self.sliders if self._is_joined(slider)] if self.layer is not None else []
+        if not joined:
+            return
+        for slider in joined:
+            found = self._join_table(slider.field_name)
+            if found is None:
+                continue # the join was removed
+            kind, stats = self._stats[slider.field_name]
+            if kind == 'range':
+                bounds = found[1].range()
+                if bounds is None:
+                    continue # nothing but NULLs, the filter keeps what it showed
+                stats['fmin'], stats['fmax'] = bounds
+                slider.setStats(*bounds)
+            else:
+                stats['values'] = self._joined_values(found[1])
+                slider.setValues(stats['values'])
+        if self._filter_list is not None:
+            self._filter_list._on_rows_changed()
+        if self._compose_filter() != self.config.last_filter:
+            self.on_slider_changed(None)
+
+    def _parquet_footer(self):
+        """:return: the ParquetFooter of a layer read from a Parquet file, None for other layers"""
+        db = self.layer.dataProvider()
+        uri = db.dataSourceUri() if hasattr(db, 'dataSourceUri') else None
+        if self._parquet is None or self._parquet[0] != uri:
+            self._parquet = [uri, parquet_path(self.layer), None, None]
+        path = self._parquet[1]
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_size, st.st_mtime)
+        if self._parquet[2] != stamp:
+            self._parquet[2] = stamp
+            try:
+                with PERF.timed('parquet_footer'):
+                    self._parquet[3] = ParquetFooter.read(path)
+            except (OSError, ValueError) as e:
+                QgsMessageLog.logMessage("Could not read the statistics of %s: %s" % (path, str(e)), 'Range Filter Plugin', level=Qgis.Warning)
+                self._parquet[3] = None
+        return self._parquet[3]
+
+    def _on_canvas_refreshed(self):
+        if self._render_started is not None:
+            PERF.record('render', (time.perf_counter() - self._render_started) * 1000.0)
+            self._render_started = None
+        if self.layer:
+            TRACER.finish(self.layer.id())
+
+    def on_performance_menu(self):
+        PERF.log_report()
+        msg_box = QMessageBox()
+        msg_box.setWindowTitle("Range Filter Performance")
+        msg_box.setText("Timings since QGIS started (also written to the message log).")
+        msg_box.setDetailedText(PERF.report() + "\n\nDrag to rendered frame:\n" + TRACER.report())
+        btn_budget = msg_box.addButton("Latency Budget...", QMessageBox.ActionRole)
+        btn_reset = msg_box.addButton("Reset", QMessageBox.ResetRole)
+        msg_box.addButton(QMessageBox.Close)
+        msg_box.exec_()
+        if msg_box.clickedButton() == btn_reset:
+            PERF.reset()
+        elif msg_box.clickedButton() == btn_budget:
+            current = self.config.latency_budget_ms
+            budget, ok = QInputDialog.getInt(self, "Latency Budget", "Warn when drag to rendered frame exceeds (ms, 0 = off):", current, 0, 60000)
+            if ok:
+                self.config.latency_budget_ms = budget
+                self.config.save(self.layer)
+                TRACER.set_budget(self.layer.id(), budget)
 
     def on_coerce_slider(self, slider):
         val = "DATE" if slider.is_date_or_time else "NUMBER"
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + slider.field_name), val)
+        self.config.coerce[slider.field_name] = val
+        self.config.save(self.layer)
+
+    def showFilterMenu(self, filter_widget, pos):
+        """the context menu of one filter, or of the FilterEntry it edits, shown at pos in global coordinates"""
+        menu = QMenu()
+        handlers = [(menu.addAction('Hide'), lambda: self.on_coerce_slider_hide(filter_widget)),
+                    (menu.addAction('Treat as Number'), lambda: self.on_coerce_slider_number(filter_widget)),
+                    (menu.addAction('Treat as Date'), lambda: self.on_coerce_slider_date(filter_widget)),
+                    (menu.addAction('Treat as Category'), lambda: self.on_coerce_slider_category(filter_widget))]
+        menu.addSeparator()
+        handlers.append((menu.addAction('Options...'), self.on_options_menu))
+        handlers.append((menu.addAction('Performance...'), self.on_performance_menu))
+        action_follow = menu.addAction('Follow File')
+        action_follow.setCheckable(True)
+        action_follow.setChecked(self.isFollowing())
+        handlers.append((action_follow, self.on_follow_menu))
+        action_extent = menu.addAction('Visible Extent Only')
+        action_extent.setCheckable(True)
+        action_extent.setChecked(self.isExtentOnly())
+        handlers.append((action_extent, self.on_extent_menu))
+
+        selected_action = menu.exec_(pos)
+        for action, handler in handlers:
+            if selected_action == action:
+                handler()
+                break
 
     def on_coerce_slider_hide(self, slider):
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + slider.field_name), "HIDDEN")
+        self.config.coerce[slider.field_name] = "HIDDEN"
         self.on_options_closed()
 
     def on_coerce_slider_number(self, slider):
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + slider.field_name), "NUMBER")
+        self.config.coerce[slider.field_name] = "NUMBER"
         self.on_options_closed()
 
     def on_coerce_slider_date(self, slider):
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + slider.field_name), "DATE")
+        self.config.coerce[slider.field_name] = "DATE"
         self.on_options_closed()
 
     def on_coerce_slider_category(self, slider):
-        self.layer.setCustomProperty(WIDGET_SETTING_PREFIX % ("COERCE_" + slider.field_name), "CATEGORY")
+        self.config.coerce[slider.field_name] = "CATEGORY"
         self.on_options_closed()
 
     def on_remove_slider(self, slider):
-        self.sliders.remove(slider)
-        self.layout.removeWidget(slider)
+        self._drop_filter(slider)
         self._save_sliders()
-        slider.deleteLater()
         self.on_slider_changed(None)
 
         current_width = self.width()
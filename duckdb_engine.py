@@ -0,0 +1,133 @@
+# Runs the composed filter in an embedded DuckDB over a layer's source file.
+#
+# For layers read from a local CSV, Parquet or GeoPackage file, DuckDB can
+# answer what the provider answers only after a reload: how many features
+# the filter lets through, and which. It reads the file itself, on all
+# cores, and computes the statistics of every slider in a single query. No
+# server is involved, and DuckDB is optional: without the module installed
+# the engine is simply unavailable. Queries may come from a task's thread,
+# one at a time.
+
+import threading
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# column the feature id is exposed as, next to the file's own columns
+FID_COLUMN = "__range_filter_fid"
+VIEW = "layer"
+
+
+class EngineError(Exception):
+    """the engine cannot read the source, or the filter is not valid SQL for it"""
+
+
+def available():
+    return duckdb is not None
+
+
+def _literal(text):
+    return "'%s'" % str(text).replace("'", "''")
+
+
+def _quote(identifier):
+    return '"%s"' % identifier.replace('"', '""')
+
+
+def relation_sql(source):
+    """
+    :param source: dict with 'kind' ('csv', 'parquet' or 'sqlite') and 'path'; csv sources also
+        carry delimiter, quote, use_header and skip_lines, sqlite ones table and fid
+    :return: SELECT reading every column of the source plus its feature id as FID_COLUMN
+    """
+    kind = source['kind']
+    path = _literal(source['path'])
+    if kind == 'parquet':
+        # the OGR driver numbers features by row, from 0
+        return ("SELECT file_row_number AS %s, * EXCLUDE (file_row_number) FROM read_parquet(%s, file_row_number=true)"
+                % (FID_COLUMN, path))
+    if kind == 'sqlite':
+        return "SELECT %s AS %s, * FROM sqlite_scan(%s, %s)" % (_quote(source['fid']), FID_COLUMN, path, _literal(source['table']))
+    if kind == 'csv':
+        # the delimitedtext provider numbers features by line; one line per record is assumed
+        first_line = 1 + source.get('skip_lines', 0) + (1 if source.get('use_header', True) else 0)
+        options = "delim=%s, quote=%s, header=%s, skip=%d" % (
+            _literal(source.get('delimiter') or ','), _literal(source.get('quote') or '"'),
+            'true' if source.get('use_header', True) else 'false', source.get('skip_lines', 0))
+        return "SELECT row_number() OVER () + %d AS %s, * FROM read_csv(%s, %s)" % (first_line - 1, FID_COLUMN, path, options)
+    raise EngineError("no DuckDB reader for %s sources" % kind)
+
+
+def stats_sql(range_names, category_names):
+    """:return: one SELECT with the min and max of every range field and the distinct values of every category field"""
+    columns = ["min(%s), max(%s)" % (_quote(n), _quote(n)) for n in range_names]
+    columns += ["list(DISTINCT %s)" % _quote(n) for n in category_names]
+    return "SELECT %s FROM %s" % (", ".join(columns), VIEW)
+
+
+def where_sql(subset):
+    return " WHERE %s" % subset if subset else ""
+
+
+class DuckDbEngine(object):
+    """
+    An in-process DuckDB database with the source file as a view. The file is read at
+    every query, so appended rows are seen; unsaved edits in QGIS are not.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._connection = None
+        # a connection runs one query at a time
+        self._lock = threading.Lock()
+
+    def _fetch(self, sql):
+        """:return: the rows of a query"""
+        if duckdb is None:
+            raise EngineError("DuckDB is not installed")
+        with self._lock:
+            try:
+                if self._connection is None:
+                    connection = duckdb.connect(":memory:")
+                    if self.source['kind'] == 'sqlite':
+                        connection.execute("LOAD sqlite")
+                    connection.execute("CREATE VIEW %s AS %s" % (VIEW, relation_sql(self.source)))
+                    self._connection = connection
+                return self._connection.execute(sql).fetchall()
+            except duckdb.Error as e:
+                raise EngineError(str(e))
+
+    def count(self, subset=""):
+        """:return: (number of features the subset string lets through, number of features)"""
+        if not subset:
+            total = self._fetch("SELECT count(*) FROM %s" % VIEW)[0][0]
+            return total, total
+        return tuple(self._fetch("SELECT count(*) FILTER (WHERE %s), count(*) FROM %s" % (subset, VIEW))[0])
+
+    def matching_ids(self, subset=""):
+        """:return: list of the ids of the features the subset string lets through"""
+        rows = self._fetch("SELECT %s FROM %s%s ORDER BY 1" % (FID_COLUMN, VIEW, where_sql(subset)))
+        return [row[0] for row in rows]
+
+    def stats(self, range_names, category_names=()):
+        """:return: ({range field: (min, max)}, {category field: distinct values})"""
+        range_names, category_names = list(range_names), list(category_names)
+        if not range_names and not category_names:
+            return {}, {}
+        row = self._fetch(stats_sql(range_names, category_names))[0]
+        ranges = dict((name, (row[2 * i], row[2 * i + 1])) for i, name in enumerate(range_names))
+        offset = 2 * len(range_names)
+        values = dict((name, list(row[offset + i] or [])) for i, name in enumerate(category_names))
+        return ranges, values
+
+    def value_counts(self, name):
+        """:return: value -> number of features, from one grouped query"""
+        return dict(self._fetch("SELECT %s, count(*) FROM %s GROUP BY 1" % (_quote(name), VIEW)))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,92 @@
+# Statistics of the features in the visible map extent.
+#
+# With the filters following the view, a slider spans the values of the
+# features on screen rather than those of the whole layer. A spatial index
+# gives the ids of the features whose bounding box meets the extent. From
+# one extent to the next only the features that came into view or left it
+# are looked at: their values are added to or removed from running
+# statistics that keep a multiset of values, so a pan across a continental
+# layer costs what changed on screen instead of a scan. An edited value is
+# swapped in place; only edited geometries call for a new index.
+
+try:
+    from .category_index import value_key
+except ImportError:
+    # loaded as a top-level module, as the tests do
+    from category_index import value_key
+
+
+class ExtentTracker(object):
+    """
+    The features in view of one layer, with the values of its filtered fields.
+
+    :param index: anything with intersects(rectangle) -> feature ids, e.g. a QgsSpatialIndex
+    :param columns: field name -> {feature id: value_key of its value}
+    :ivar visible: set of the ids of the features in view
+    """
+
+    def __init__(self, index, columns):
+        self.index = index
+        self.columns = columns
+        self.visible = set()
+
+    @classmethod
+    def load(cls, index, loader, convert=None, is_canceled=None):
+        """
+        reads the values of every feature through a feature_loader loader
+
+        :param convert: field name -> function applied to each of its values
+        :return: the tracker, or None when the load was canceled
+        """
+        convert = convert or {}
+        columns = dict((name, {}) for name, _, _ in loader.columns)
+        for chunk in loader.chunks(is_canceled=is_canceled):
+            fids = chunk.fids[:chunk.size]
+            for name, values in columns.items():
+                found = chunk.values(name)
+                if name in convert:
+                    found = [convert[name](value) for value in found]
+                values.update(zip(fids, map(value_key, found)))
+        return None if loader.canceled else cls(index, columns)
+
+    def move(self, extent):
+        """:return: (ids of the features that came into view, ids of those that left it)"""
+        inside = set(self.index.intersects(extent))
+        entered = inside - self.visible
+        left = self.visible - inside
+        self.visible = inside
+        return entered, left
+
+    def update(self, stats, entered, left):
+        """
+        applies the features that came into view or left it to running statistics
+
+        :param stats: field name -> statistics with add(value) and remove(value), e.g. a FieldStats with a multiset
+        :return: set of the names of the fields whose statistics changed
+        """
+        changed = set()
+        for name, field_stats in stats.items():
+            values = self.columns.get(name)
+            if values is None:
+                continue
+            for fid in left:
+                if field_stats.remove(values.get(fid)):
+                    changed.add(name)
+            for fid in entered:
+                if field_stats.add(values.get(fid)):
+                    changed.add(name)
+        return changed
+
+    def change(self, stats, name, fid, value):
+        """
+        sets the value one feature holds in a field, and in its running statistics if the feature is in view
+
+        :param stats: the statistics of name, as for update
+        :return: True if they changed
+        """
+        values = self.columns.get(name)
+        if values is None:
+            return False
+        old = values.get(fid)
+        value = values[fid] = value_key(value)
+        return fid in self.visible and stats.change(old, value)
@@ -0,0 +1,415 @@
+# Reads a few attributes of a layer's features in fixed size chunks.
+#
+# Statistics and in-memory indexes only need the filtered columns, so every
+# pass over the features asks the provider for those attributes alone and no
+# geometry: on a wide polygon layer that is the difference between reading the
+# attribute bytes and building every geometry. The values of a chunk are
+# copied into buffers allocated once per scan, numeric columns as packed
+# doubles rather than one Python object per value.
+#
+# GeoPackage and SpatiaLite layers can skip the provider altogether: their
+# columns are read straight from the SQLite file in batches, filling the same
+# chunks, which avoids building a QgsFeature for every row.
+
+import os
+import re
+import sqlite3
+
+from array import array
+from urllib.request import pathname2url
+
+from qgis.core import QgsFeatureRequest
+from qgis.PyQt.QtCore import QVariant
+
+CHUNK_SIZE = 4096
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+# fids per "IN (...)" list, below SQLite's default limit on bound parameters
+SQLITE_MAX_PARAMETERS = 500
+
+
+def columns_for(fields, field_names):
+    """
+    :param fields: the QgsFields of the source to be read
+    :return: (name, field index, numeric) for each of field_names found in fields
+    """
+    names = [field.name() for field in fields]
+    columns = []
+    for name in field_names:
+        if name in names:
+            idx = names.index(name)
+            columns.append((name, idx, fields[idx].isNumeric()))
+    return columns
+
+
+class Column(object):
+    """
+    One field's values within a chunk; only the first chunk.size entries are valid.
+
+    :ivar numeric: whether the values are held as doubles
+    :ivar values: array('d') for numeric columns, a list of attribute values otherwise
+    :ivar nulls: bytearray with a 1 for every NULL of a numeric column
+    """
+
+    __slots__ = ('name', 'numeric', 'values', 'nulls')
+
+    def __init__(self, name, numeric, size):
+        self.name = name
+        self.numeric = numeric
+        if numeric:
+            self.values = array('d', bytes(8 * size))
+            self.nulls = bytearray(size)
+        else:
+            self.values = [None] * size
+            self.nulls = None
+
+    def get(self, i):
+        """:return: the i-th value, None for NULL"""
+        if self.numeric:
+            return None if self.nulls[i] else self.values[i]
+        value = self.values[i]
+        if hasattr(value, 'isNull') and value.isNull():
+            return None # a QVariant NULL
+        return value
+
+
+class Chunk(object):
+    """
+    Up to chunk_size features of a scan. The loader fills the same Chunk again for the
+    next features, so anything kept from it must be copied out.
+
+    :ivar size: number of features in the chunk
+    :ivar fids: array('q') of feature ids
+    :ivar columns: field name -> Column
+    """
+
+    __slots__ = ('size', 'fids', 'columns')
+
+    def __init__(self, columns, size):
+        self.size = 0
+        self.fids = array('q', bytes(8 * size))
+        self.columns = dict((name, Column(name, numeric, size)) for name, _, numeric in columns)
+
+    def values(self, name):
+        """:return: list of the field's values in this chunk, None for NULL"""
+        column = self.columns[name]
+        return [column.get(i) for i in range(self.size)]
+
+
+class AttributeLoader(object):
+    """
+    Scans some attributes of a feature source, without geometries, chunk by chunk.
+
+    :param source: anything with getFeatures(request): a layer, its provider, or a
+        QgsVectorLayerFeatureSource when scanning from a task's thread
+    :param columns: (name, field index, numeric) of the fields to read, see columns_for
+    :param fids: only read these features
+    """
+
+    def __init__(self, source, columns, chunk_size=CHUNK_SIZE, fids=None):
+        self.source = source
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.fids = fids
+        # set when the last scan stopped because it was canceled
+        self.canceled = False
+
+    def request(self):
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes([idx for _, idx, _ in self.columns])
+        if self.fids is not None:
+            request.setFilterFids(list(self.fids))
+        return request
+
+    def chunks(self, total=None, progress=None, is_canceled=None):
+        """
+        yields the same Chunk, filled with the next features each time
+
+        :param total: number of features expected, for progress
+        :param progress: called with the percentage done after each chunk
+        :param is_canceled: polled after each chunk, the scan stops once it returns True
+        """
+        self.canceled = False
+        chunk = Chunk(self.columns, self.chunk_size)
+        fids = chunk.fids
+        fill = [(idx, chunk.columns[name]) for name, idx, _ in self.columns]
+        done = 0
+        n = 0
+        for feature in self.source.getFeatures(self.request()):
+            attributes = feature.attributes()
+            fids[n] = feature.id()
+            for idx, column in fill:
+                value = attributes[idx]
+                if column.numeric:
+                    try:
+                        column.values[n] = value
+                        column.nulls[n] = 0
+                    except TypeError:
+                        column.nulls[n] = 1 # NULL, or not a number
+                else:
+                    column.values[n] = value
+            n += 1
+            if n == self.chunk_size:
+                chunk.size = n
+                yield chunk
+                done += n
+                n = 0
+                if self._stop(done, total, progress, is_canceled):
+                    return
+        if n:
+            chunk.size = n
+            yield chunk
+            done += n
+            self._stop(done, total, progress, is_canceled)
+
+    def _stop(self, done, total, progress, is_canceled):
+        if progress is not None and total:
+            progress(min(100.0, 100.0 * done / total))
+        if is_canceled is not None and is_canceled():
+            self.canceled = True
+        return self.canceled
+
+
+class ExpressionLoader(AttributeLoader):
+    """
+    Evaluates expressions on every feature of a source, filling chunks as an AttributeLoader
+    does from fields: each expression is read as a numeric column named after it.
+
+    :param expressions: (name, QgsExpression) pairs, prepared with context
+    :param context: QgsExpressionContext with the layer's scopes, created on the main thread
+    """
+
+    def __init__(self, source, expressions, context, chunk_size=CHUNK_SIZE, fids=None):
+        AttributeLoader.__init__(self, source, [(name, None, True) for name, _ in expressions], chunk_size, fids)
+        self.expressions = list(expressions)
+        self.context = context
+
+    def request(self):
+        request = QgsFeatureRequest()
+        # attributes are left alone, expressions may refer to any of them
+        if not any(expression.needsGeometry() for _, expression in self.expressions):
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        if self.fids is not None:
+            request.setFilterFids(list(self.fids))
+        return request
+
+    def chunks(self, total=None, progress=None, is_canceled=None):
+        """see AttributeLoader.chunks"""
+        self.canceled = False
+        chunk = Chunk(self.columns, self.chunk_size)
+        fids = chunk.fids
+        fill = [(expression, chunk.columns[name]) for name, expression in self.expressions]
+        context = self.context
+        done = 0
+        n = 0
+        for feature in self.source.getFeatures(self.request()):
+            context.setFeature(feature)
+            fids[n] = feature.id()
+            for expression, column in fill:
+                try:
+                    column.values[n] = expression.evaluate(context)
+                    column.nulls[n] = 0
+                except TypeError:
+                    column.nulls[n] = 1 # NULL, or not a number
+            n += 1
+            if n == self.chunk_size:
+                chunk.size = n
+                yield chunk
+                done += n
+                n = 0
+                if self._stop(done, total, progress, is_canceled):
+                    return
+        if n:
+            chunk.size = n
+            yield chunk
+            done += n
+            self._stop(done, total, progress, is_canceled)
+
+
+def _quote(identifier):
+    return '"%s"' % identifier.replace('"', '""')
+
+
+def _connect(path):
+    # read only: the provider may have the file open for writing
+    return sqlite3.connect('file:%s?mode=ro' % pathname2url(path), uri=True)
+
+
+def _is_sqlite_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except (OSError, IOError):
+        return False
+
+
+def sqlite_source(layer):
+    """
+    :return: dict with the path, table and fid column of a GeoPackage or SpatiaLite layer
+        read from a local file, or None for any other layer
+    """
+    db = layer.dataProvider()
+    if not hasattr(db, 'name'):
+        return None
+    uri = db.dataSourceUri()
+    key = None
+    if db.name() == 'ogr':
+        # /data/places.gpkg|layername=places|subset=...
+        parts = uri.split('|')
+        path, table = parts[0], None
+        for part in parts[1:]:
+            name, _, value = part.partition('=')
+            if name == 'layername':
+                table = value
+    elif db.name() == 'spatialite':
+        # dbname='/data/places.sqlite' table="places" (geom) key='id'
+        path = re.search(r"dbname='((?:[^'\\]|\\.)*)'", uri)
+        table = re.search(r'table="((?:[^"]|"")*)"(?:\."((?:[^"]|"")*)")?', uri)
+        key = re.search(r"key='((?:[^'\\]|\\.)*)'", uri)
+        if path is None or table is None:
+            return None
+        path = path.group(1).replace("\\'", "'")
+        table = (table.group(2) or table.group(1)).replace('""', '"')
+        key = key.group(1) if key is not None else None
+    else:
+        return None
+    if not table or not os.path.isfile(path) or not _is_sqlite_file(path):
+        return None
+
+    try:
+        connection = _connect(path)
+        try:
+            pk = [row[1] for row in connection.execute('PRAGMA table_info(%s)' % _quote(table)) if row[5] == 1]
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return None
+    fid = key or (pk[0] if len(pk) == 1 else 'rowid')
+    return {'path': path, 'table': table, 'fid': fid}
+
+
+def _reads_as_stored(field):
+    """whether SQLite holds the field's values the way the provider returns them"""
+    return field.isNumeric() or field.type() == QVariant.String
+
+
+def loader_for(layer, field_names, fids=None, source=None, committed=False, chunk_size=CHUNK_SIZE):
+    """
+    picks the fastest way to read some fields of a layer
+
+    :param source: what to read when there is no fast path, the layer's provider by default
+    :param committed: only the values stored in the data source are wanted, edits that
+        have not been saved yet don't matter
+    :return: a SqliteLoader where the SQLite file can be read directly, an AttributeLoader otherwise
+    """
+    db = layer.dataProvider()
+    fields = db.fields()
+    columns = columns_for(fields, field_names)
+    fast = sqlite_source(layer)
+    if fast is not None and (committed or not layer.isModified()) \
+            and all(_reads_as_stored(fields[idx]) for _, idx, _ in columns):
+        return SqliteLoader(fast['path'], fast['table'], fast['fid'], columns, chunk_size, fids)
+    return AttributeLoader(source if source is not None else db, columns, chunk_size, fids)
+
+
+class SqliteLoader(AttributeLoader):
+    """
+    Reads some columns of a GeoPackage or SpatiaLite table straight from the file, in the
+    chunks an AttributeLoader yields. Only the committed data is seen, and the provider's
+    subset string does not apply.
+    """
+
+    def __init__(self, path, table, fid_column, columns, chunk_size=CHUNK_SIZE, fids=None, fid_range=None):
+        AttributeLoader.__init__(self, path, columns, chunk_size, fids)
+        self.path = path
+        self.table = table
+        self.fid_column = fid_column
+        # (first, last) fid read, for one share of a table split between workers
+        self.fid_range = fid_range
+
+    def split(self, parts):
+        """:return: loaders over consecutive fid ranges, together reading what this one reads"""
+        if parts < 2 or self.fids is not None or self.fid_range is not None:
+            return [self]
+        connection = _connect(self.path)
+        try:
+            low, high = connection.execute('SELECT MIN(%s), MAX(%s) FROM %s' % (
+                _quote(self.fid_column), _quote(self.fid_column), _quote(self.table))).fetchone()
+        finally:
+            connection.close()
+        if not isinstance(low, int) or not isinstance(high, int):
+            return [self]
+        step = (high - low) // parts + 1
+        return [SqliteLoader(self.path, self.table, self.fid_column, self.columns, self.chunk_size,
+                             fid_range=(first, first + step - 1))
+                for first in range(low, high + 1, step)]
+
+    def _queries(self):
+        """:return: (sql, parameters) for each batch of rows to read"""
+        sql = 'SELECT %s FROM %s' % (', '.join(_quote(c) for c in [self.fid_column] + [name for name, _, _ in self.columns]),
+                                     _quote(self.table))
+        if self.fid_range is not None:
+            return [('%s WHERE %s BETWEEN ? AND ?' % (sql, _quote(self.fid_column)), list(self.fid_range))]
+        if self.fids is None:
+            return [(sql, [])]
+        fids = sorted(self.fids)
+        batches = [fids[i:i + SQLITE_MAX_PARAMETERS] for i in range(0, len(fids), SQLITE_MAX_PARAMETERS)]
+        return [('%s WHERE %s IN (%s)' % (sql, _quote(self.fid_column), ', '.join('?' * len(batch))), batch)
+                for batch in batches]
+
+    def chunks(self, total=None, progress=None, is_canceled=None):
+        """see AttributeLoader.chunks"""
+        self.canceled = False
+        chunk = Chunk(self.columns, self.chunk_size)
+        fids = chunk.fids
+        fill = [(i + 1, chunk.columns[name]) for i, (name, _, _) in enumerate(self.columns)]
+        done = 0
+        connection = _connect(self.path)
+        try:
+            for sql, parameters in self._queries():
+                cursor = connection.execute(sql, parameters)
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    for n, row in enumerate(rows):
+                        fids[n] = row[0]
+                        for i, column in fill:
+                            value = row[i]
+                            if column.numeric:
+                                try:
+                                    column.values[n] = value
+                                    column.nulls[n] = 0
+                                except TypeError:
+                                    column.nulls[n] = 1
+                            else:
+                                column.values[n] = value
+                    chunk.size = len(rows)
+                    yield chunk
+                    done += len(rows)
+                    if self._stop(done, total, progress, is_canceled):
+                        return
+        finally:
+            connection.close()
+
+    def min_max(self, names):
+        """:return: field name -> (min, max) of numeric columns, in a single pass over the table"""
+        if not names:
+            return {}
+        sql = 'SELECT %s FROM %s' % (', '.join('MIN(%s), MAX(%s)' % (_quote(n), _quote(n)) for n in names), _quote(self.table))
+        connection = _connect(self.path)
+        try:
+            row = connection.execute(sql).fetchone()
+        finally:
+            connection.close()
+        return dict((name, (row[2 * i], row[2 * i + 1])) for i, name in enumerate(names))
+
+    def value_counts(self, name):
+        """:return: value -> number of rows, from one grouped query"""
+        sql = 'SELECT %s, COUNT(*) FROM %s GROUP BY 1' % (_quote(name), _quote(self.table))
+        connection = _connect(self.path)
+        try:
+            return dict(connection.execute(sql).fetchall())
+        finally:
+            connection.close()
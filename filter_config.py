@@ -0,0 +1,132 @@
+# Per layer configuration of the range filter widget.
+#
+# Everything the widget remembers about a layer lives in one JSON blob stored
+# as a single layer custom property. It is read once when the widget is
+# created, kept in memory while the widget lives, and written back in one
+# setCustomProperty call, and only when it actually changed, so that dragging
+# a slider does not mark the project dirty over and over.
+
+import json
+
+PROPERTY_PREFIX = "legend_data_filter_%s"
+CONFIG_PROPERTY = PROPERTY_PREFIX % "CONFIG"
+CONFIG_VERSION = 3
+
+# keys used before CONFIG_VERSION 3, one custom property each
+LEGACY_SLIDERS = "!!SLIDERS!!"
+LEGACY_KEYS = (LEGACY_SLIDERS, "SCHEMA_VERSION", "UI_MODE")
+LEGACY_COERCE = "COERCE_"
+
+COERCIONS = ("HIDDEN", "NUMBER", "DATE", "CATEGORY", "TEXT")
+ENGINES = ("provider", "duckdb")
+
+
+class FilterConfig(object):
+    """
+    Settings of one layer's filters.
+
+    :ivar fields: configured field names in display order, or None before the
+        layer has been set up
+    :ivar coerce: field name -> one of COERCIONS
+    :ivar ui_mode: "Classic" or "Spacious"
+    :ivar latency_budget_ms: warn above this drag to frame latency, 0 = off
+    :ivar last_filter: subset string the widget last applied
+    :ivar stats: {"fingerprint": ..., "fields": {name: {"kind", "stats"}}}
+    :ivar states: field name -> filter state of every moved filter
+    :ivar follow: whether the layer's file is followed as it grows
+    :ivar engine: one of ENGINES, what counts the features a filter lets through
+    :ivar expressions: expressions filtered on like fields, e.g. "$area"; each is its own field name
+    :ivar extent_only: whether statistics and match counts are of the features in the visible map extent
+    """
+
+    def __init__(self):
+        self.fields = None
+        self.coerce = {}
+        self.ui_mode = "Classic"
+        self.latency_budget_ms = 0
+        self.last_filter = None
+        self.stats = None
+        self.states = {}
+        self.follow = False
+        self.engine = "provider"
+        self.expressions = []
+        self.extent_only = False
+        self._saved = None
+
+    def is_spacious(self):
+        return self.ui_mode == "Spacious"
+
+    def to_dict(self):
+        return {
+            "version": CONFIG_VERSION,
+            "fields": self.fields,
+            "coerce": self.coerce,
+            "ui_mode": self.ui_mode,
+            "latency_budget_ms": self.latency_budget_ms,
+            "last_filter": self.last_filter,
+            "stats": self.stats,
+            "states": self.states,
+            "follow": self.follow,
+            "engine": self.engine,
+            "expressions": self.expressions,
+            "extent_only": self.extent_only,
+        }
+
+    def _update(self, data):
+        self.fields = data.get("fields")
+        self.coerce = dict(data.get("coerce") or {})
+        self.ui_mode = data.get("ui_mode") or "Classic"
+        self.latency_budget_ms = int(data.get("latency_budget_ms") or 0)
+        self.last_filter = data.get("last_filter")
+        self.stats = data.get("stats")
+        self.states = dict(data.get("states") or {})
+        self.follow = bool(data.get("follow", False))
+        self.engine = data.get("engine") if data.get("engine") in ENGINES else "provider"
+        self.expressions = list(data.get("expressions") or [])
+        self.extent_only = bool(data.get("extent_only", False))
+
+    def dumps(self):
+        return json.dumps(self.to_dict(), separators=(',', ':'), sort_keys=True)
+
+    @classmethod
+    def load(cls, layer):
+        """reads the layer's configuration, migrating the pre-version 3 properties if needed"""
+        config = cls()
+        blob = layer.customProperty(CONFIG_PROPERTY, None)
+        if blob:
+            try:
+                config._update(json.loads(blob))
+                config._saved = blob
+                return config
+            except (TypeError, ValueError):
+                pass # unreadable, start over
+        if layer.customProperty(PROPERTY_PREFIX % LEGACY_SLIDERS, None) is not None:
+            config._migrate(layer)
+            config.save(layer)
+        return config
+
+    def _migrate(self, layer):
+        def legacy(key, default=None):
+            return layer.customProperty(PROPERTY_PREFIX % key, default)
+
+        self.fields = legacy(LEGACY_SLIDERS).split("###")
+        # layers set up before SCHEMA_VERSION existed are kept in the classic layout
+        self.ui_mode = legacy("UI_MODE", "Classic") if legacy("SCHEMA_VERSION") is not None else "Classic"
+
+        legacy_keys = [PROPERTY_PREFIX % key for key in LEGACY_KEYS]
+        for field in layer.dataProvider().fields():
+            key = PROPERTY_PREFIX % (LEGACY_COERCE + field.name())
+            value = layer.customProperty(key, None)
+            if value in COERCIONS:
+                self.coerce[field.name()] = value
+            legacy_keys.append(key)
+        if hasattr(layer, 'removeCustomProperty'):
+            for key in legacy_keys:
+                layer.removeCustomProperty(key)
+
+    def save(self, layer):
+        """writes the configuration back in one property, if anything changed since it was read or last saved"""
+        blob = self.dumps()
+        if blob != self._saved:
+            layer.setCustomProperty(CONFIG_PROPERTY, blob)
+            self._saved = blob
@@ -0,0 +1,241 @@
+# Lightweight timing instrumentation for the range filter widget.
+#
+# Everything here is meant to stay switched on in production: recording a
+# sample is a couple of dict lookups and an integer increment, and nothing is
+# logged unless an operation is slower than SLOW_OPERATION_MS.
+
+import collections
+import math
+import time
+
+from qgis.core import QgsMessageLog, Qgis
+
+LOG_TAG = 'Range Filter Plugin'
+
+# operations slower than this are written to the QGIS message log as they happen
+SLOW_OPERATION_MS = 250.0
+
+# histogram buckets are powers of two in milliseconds: <1, <2, <4 ... <32768, >=32768
+HISTOGRAM_BUCKETS = 17
+
+
+class OperationStats(object):
+    """Counters and a log2 millisecond histogram for one named operation."""
+
+    __slots__ = ('count', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        bucket = 0 if ms < 1.0 else min(int(math.log2(ms)) + 1, HISTOGRAM_BUCKETS - 1)
+        self.buckets[bucket] += 1
+
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def percentile_ms(self, pct):
+        """upper bound of the histogram bucket holding the given percentile"""
+        if not self.count:
+            return 0.0
+        target = math.ceil(self.count * pct / 100.0)
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(float(2 ** i), self.max_ms)
+        return self.max_ms
+
+
+class _Timer(object):
+    """context manager returned by PerfStats.timed()"""
+
+    __slots__ = ('stats', 'op', 'detail', 'start')
+
+    def __init__(self, stats, op, detail):
+        self.stats = stats
+        self.op = op
+        self.detail = detail
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stats.record(self.op, (time.perf_counter() - self.start) * 1000.0, self.detail)
+        return False
+
+
+class PerfStats(object):
+    """Registry of timed operations and plain counters."""
+
+    def __init__(self):
+        self.enabled = True
+        self.operations = {}
+        self.counters = {}
+
+    def timed(self, op, detail=None):
+        """time the body of a with-block as one sample of operation `op`"""
+        return _Timer(self, op, detail)
+
+    def record(self, op, ms, detail=None):
+        if not self.enabled:
+            return
+        stats = self.operations.get(op)
+        if stats is None:
+            stats = self.operations[op] = OperationStats()
+        stats.add(ms)
+        if ms >= SLOW_OPERATION_MS:
+            self.log(op, ms, detail, level=Qgis.Warning)
+
+    def incr(self, counter, n=1):
+        if self.enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def reset(self):
+        self.operations = {}
+        self.counters = {}
+
+    def log(self, op, ms, detail=None, level=Qgis.Info):
+        """structured single line log entry: `perf op=<op> ms=<ms> [key=value ...]`"""
+        msg = "perf op=%s ms=%.1f" % (op, ms)
+        if detail:
+            msg += " " + " ".join("%s=%s" % (k, v) for k, v in sorted(detail.items()))
+        QgsMessageLog.logMessage(msg, LOG_TAG, level=level)
+
+    def report(self):
+        """:return: human readable table of all operations and counters"""
+        lines = ["%-22s %7s %9s %9s %9s %9s" % ("operation", "count", "mean ms", "p95 ms", "max ms", "total ms")]
+        for op in sorted(self.operations):
+            s = self.operations[op]
+            lines.append("%-22s %7d %9.1f %9.1f %9.1f %9.1f" % (op, s.count, s.mean_ms(), s.percentile_ms(95), s.max_ms, s.total_ms))
+        if self.counters:
+            lines.append("")
+            for name in sorted(self.counters):
+                lines.append("%-22s %7d" % (name, self.counters[name]))
+        return "\n".join(lines)
+
+    def log_report(self):
+        for op in sorted(self.operations):
+            s = self.operations[op]
+            self.log(op, s.mean_ms(), {'count': s.count, 'p95': '%.1f' % s.percentile_ms(95), 'max': '%.1f' % s.max_ms})
+
+
+# process wide registry shared by every widget instance
+PERF = PerfStats()
+
+
+class _Trace(object):
+    """one user interaction on one layer, from input event to rendered frame"""
+
+    __slots__ = ('start', 'strategy', 'stages', 'last', 'coalesced')
+
+    def __init__(self, start, strategy):
+        self.start = start
+        self.strategy = strategy
+        self.stages = []
+        self.last = start
+        self.coalesced = 0
+
+
+class InteractionTracer(object):
+    """
+    End-to-end latency of slider interactions, per layer.
+
+    An interaction begins at the input event (handle drag, key press, item
+    toggle), is marked as it passes through filter composition and the
+    provider reload, and finishes when the map canvas reports it has been
+    redrawn. Input that arrives while an interaction is still waiting for its
+    frame is folded into it, so the latency is measured from the oldest input
+    the user has not yet seen on screen.
+    """
+
+    # keep this many finished interactions per layer for percentiles
+    WINDOW = 500
+    # interactions that never see a redraw (e.g. hidden layer) are dropped after this
+    STALE_SECONDS = 30.0
+
+    def __init__(self):
+        self.pending = {}
+        self.samples = {}
+        self.names = {}
+        self.budgets = {}
+
+    def begin(self, layer_id, layer_name, strategy, start=None):
+        now = time.perf_counter()
+        if start is None or start > now:
+            start = now
+        self.names[layer_id] = layer_name
+        trace = self.pending.get(layer_id)
+        if trace is not None and now - trace.start < self.STALE_SECONDS:
+            trace.coalesced += 1
+            trace.strategy = strategy
+            return
+        self.pending[layer_id] = _Trace(start, strategy)
+
+    def mark(self, layer_id, stage):
+        trace = self.pending.get(layer_id)
+        if trace is None:
+            return
+        now = time.perf_counter()
+        trace.stages.append((stage, (now - trace.last) * 1000.0))
+        trace.last = now
+
+    def finish(self, layer_id):
+        """closes the pending interaction of a layer once its frame is on screen"""
+        trace = self.pending.pop(layer_id, None)
+        if trace is None:
+            return None
+        now = time.perf_counter()
+        trace.stages.append(('render', (now - trace.last) * 1000.0))
+        total_ms = (now - trace.start) * 1000.0
+        key = (layer_id, trace.strategy)
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = collections.deque(maxlen=self.WINDOW)
+        samples.append(total_ms)
+        PERF.record('interaction', total_ms)
+
+        budget = self.budgets.get(layer_id)
+        if budget and total_ms > budget:
+            PERF.incr('latency_budget_exceeded')
+            detail = {'layer': self.names.get(layer_id, layer_id), 'strategy': trace.strategy,
+                      'budget': '%.0f' % budget, 'coalesced': trace.coalesced}
+            detail.update(('%s_ms' % stage, '%.1f' % ms) for stage, ms in trace.stages)
+            PERF.log('interaction', total_ms, detail, level=Qgis.Warning)
+        return total_ms
+
+    def set_budget(self, layer_id, budget_ms):
+        if budget_ms:
+            self.budgets[layer_id] = float(budget_ms)
+        else:
+            self.budgets.pop(layer_id, None)
+
+    def percentiles(self, layer_id, strategy, pcts=(50, 95, 99)):
+        """:return: exact percentiles (ms) over the rolling window, or None if nothing recorded"""
+        samples = self.samples.get((layer_id, strategy))
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return tuple(ordered[max(0, int(math.ceil(len(ordered) * p / 100.0)) - 1)] for p in pcts)
+
+    def report(self):
+        """:return: human readable p50/p95/p99 table, one row per layer and strategy"""
+        lines = ["%-22s %-10s %6s %9s %9s %9s %7s" % ("layer", "strategy", "n", "p50 ms", "p95 ms", "p99 ms", "budget")]
+        for key in sorted(self.samples, key=lambda k: (self.names.get(k[0], k[0]), k[1])):
+            layer_id, strategy = key
+            p50, p95, p99 = self.percentiles(layer_id, strategy)
+            budget = self.budgets.get(layer_id)
+            lines.append("%-22s %-10s %6d %9.1f %9.1f %9.1f %7s" % (self.names.get(layer_id, layer_id)[:22], strategy, len(self.samples[key]),
+                                                                 p50, p95, p99, ("%.0f" % budget) if budget else "-"))
+        return "\n".join(lines)
+
+
+TRACER = InteractionTracer()
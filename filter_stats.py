@@ -0,0 +1,105 @@
+# Statistics of filtered fields, maintained incrementally as a layer is edited.
+#
+# A range filter needs the minimum and maximum of its field, a category
+# filter the distinct values. Adding a value can only widen those, so
+# additions are always cheap. Removing one is cheap too while a multiset
+# (value -> number of features) is held; without one, removing the value
+# that was the minimum or maximum leaves the statistic unknown and the field
+# is marked stale, to be scanned again.
+
+import collections
+import numbers
+
+try:
+    from .category_index import value_key
+except ImportError:
+    # loaded as a top-level module, as the tests do
+    from category_index import value_key
+
+
+class FieldStats(object):
+    """
+    Running statistics of one filtered field.
+
+    :ivar kind: 'range' or 'category'
+    :ivar fmin: smallest value of a range field
+    :ivar fmax: largest value of a range field
+    :ivar values: distinct values of a category field, in display order. Without a
+        multiset a removed category stays listed, it simply matches nothing.
+    :ivar counts: multiset of the field's values by value_key, or None when not held
+    :ivar stale: set once an edit made the statistics unknown
+    """
+
+    __slots__ = ('kind', 'fmin', 'fmax', 'values', 'counts', 'stale')
+
+    def __init__(self, kind, fmin=None, fmax=None, values=None, counts=None):
+        self.kind = kind
+        self.fmin = fmin
+        self.fmax = fmax
+        self.values = list(values) if values is not None else []
+        self.counts = collections.Counter(counts) if counts is not None else None
+        self.stale = False
+
+    def _position(self, key):
+        for i, v in enumerate(self.values):
+            if value_key(v) == key:
+                return i
+        return None
+
+    def add(self, value):
+        """:return: True if the statistics changed"""
+        value = value_key(value)
+        if self.counts is not None:
+            self.counts[value] += 1
+        if self.kind == 'category':
+            if self._position(value) is not None:
+                return False
+            self.values.append(value)
+            return True
+        if not isinstance(value, numbers.Number) or isinstance(value, bool):
+            return False # NULL or not comparable
+        changed = False
+        if self.fmin is None or value < self.fmin:
+            self.fmin = value
+            changed = True
+        if self.fmax is None or value > self.fmax:
+            self.fmax = value
+            changed = True
+        return changed
+
+    def remove(self, value):
+        """:return: True if the statistics changed; check stale for whether they are still known"""
+        value = value_key(value)
+        if self.counts is not None:
+            if self.counts[value] > 1:
+                self.counts[value] -= 1
+                return False
+            self.counts.pop(value, None)
+            if self.kind == 'category':
+                i = self._position(value)
+                if i is None:
+                    return False
+                del self.values[i]
+                return True
+            if value != self.fmin and value != self.fmax:
+                return False
+            remaining = [v for v in self.counts if isinstance(v, numbers.Number) and not isinstance(v, bool)]
+            if remaining:
+                self.fmin, self.fmax = min(remaining), max(remaining)
+            return True
+
+        if self.kind == 'range' and value is not None and (value == self.fmin or value == self.fmax):
+            self.stale = True
+        return False
+
+    def remove_unknown(self):
+        """a feature whose value could not be looked up was removed"""
+        if self.kind == 'range' or self.counts is not None:
+            self.stale = True
+
+    def change(self, old, new):
+        """one feature's value went from old to new. :return: True if the statistics changed"""
+        if value_key(old) == value_key(new):
+            return False
+        changed = self.add(new)
+        return self.remove(old) or changed
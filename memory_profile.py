@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""
+Memory footprint profiling for the range filter legend widget.
+
+Reports, using tracemalloc:
+
+  * memory per widget, for a legend built with N sliders
+  * memory held by each cache the widget (or its sliders) keeps
+  * peak memory while the statistics scan builds the sliders
+  * growth across repeated on_options_closed() rebuild cycles (leak check)
+
+Run it either against the mocks used by the unit tests:
+
+    python memory_profile.py --mock --sliders 100 --cycles 20
+
+or inside a real, offscreen QGIS:
+
+    QT_QPA_PLATFORM=offscreen python memory_profile.py --qgis --sliders 100 --features 100000
+
+tracemalloc only sees allocations made by Python. In real QGIS most of a
+widget lives in C++, so the resident set size of the process is reported
+next to it.
+"""
+
+import argparse
+import gc
+import importlib
+import os
+import sys
+import tracemalloc
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# the typical (median) rebuild cycle may retain this much before the leak check
+# complains; one-off growth such as a dict resizing does not count
+LEAK_TOLERANCE_BYTES = 1024
+
+
+def _rss_bytes():
+    """resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _format_bytes(n):
+    if n is None:
+        return "n/a"
+    for unit in ("B", "KiB", "MiB"):
+        if abs(n) < 1024:
+            return "%.1f %s" % (n, unit)
+        n /= 1024.0
+    return "%.1f GiB" % n
+
+
+def measure(fn, *args, **kwargs):
+    """
+    Calls fn and measures it.
+
+    :return: (result, retained bytes, peak bytes above the starting point, rss delta)
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    gc.collect()
+    rss_before = _rss_bytes()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = fn(*args, **kwargs)
+    gc.collect()
+    after, peak = tracemalloc.get_traced_memory()
+    rss_after = _rss_bytes()
+    rss_delta = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return result, after - before, peak - before, rss_delta
+
+
+def deep_sizeof(obj, _seen=None):
+    """approximate size of a python object graph (containers and their contents)"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == 'deque':
+        size += sum(deep_sizeof(v, _seen) for v in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, s), _seen) for s in obj.__slots__ if hasattr(obj, s))
+    return size
+
+
+def iter_caches(widget):
+    """yields (name, object) for every cache reachable from a DataLayerRangeFilterWidget"""
+    perf = sys.modules[type(widget).__module__].PERF
+    tracer = sys.modules[type(widget).__module__].TRACER
+    yield "perf histograms (shared)", perf.operations
+    yield "latency windows (shared)", tracer.samples
+    yield "slider label tables", [getattr(getattr(w, 'slider', None), '_labels', None) for w in widget.sliders]
+    yield "category sizes (shared)", sys.modules[type(widget).__module__].CATEGORY_SIZE_CACHE
+    yield "field statistics", widget._field_stats
+    yield "uncommitted edit values", widget._edit_values
+    yield "in-memory columns", widget._store
+    yield "text indexes", widget._text_indexes
+    yield "expression columns", widget._expression_columns
+    yield "expression filters", widget._expression_clauses
+    yield "features in view", widget._extent
+
+
+def profile_build(widget_cls, layer):
+    """memory for building one widget with all its sliders"""
+    widget, retained, peak, rss = measure(widget_cls, layer)
+    n = max(1, len(widget.sliders))
+    return widget, {
+        'sliders': len(widget.sliders),
+        'widget_total': retained,
+        'per_slider': retained // n,
+        'scan_peak': peak,
+        'rss_delta': rss,
+    }
+
+
+def profile_caches(widget):
+    return [(name, deep_sizeof(cache)) for name, cache in iter_caches(widget)]
+
+
+def leak_check(widget, cycles=10, process_events=None):
+    """
+    Rebuilds the widget `cycles` times through on_options_closed and tracks
+    retained memory. The first cycle is treated as warm-up, and a leak is
+    reported when the median cycle keeps memory alive.
+
+    :return: dict with per-cycle retained bytes, total growth, a leak flag and
+        the top allocation sites that grew
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+
+    def _cycle():
+        widget.on_options_closed()
+        if process_events is not None:
+            process_events()
+
+    _cycle()
+    gc.collect()
+    baseline = tracemalloc.take_snapshot()
+    per_cycle = []
+    for _ in range(cycles):
+        _, retained, _, _ = measure(_cycle)
+        per_cycle.append(retained)
+    gc.collect()
+    final = tracemalloc.take_snapshot()
+    growth = sum(per_cycle)
+    # leave out the profiler's own bookkeeping
+    ignore = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    diff = final.filter_traces(ignore).compare_to(baseline.filter_traces(ignore), 'lineno')
+    top = [str(stat) for stat in diff[:10] if stat.size_diff > 0]
+    return {
+        'per_cycle': per_cycle,
+        'growth': growth,
+        'leak': sorted(per_cycle)[len(per_cycle) // 2] > LEAK_TOLERANCE_BYTES,
+        'top': top,
+    }
+
+
+def print_report(build, caches, leaks):
+    print("sliders built:          %d" % build['sliders'])
+    print("widget (python heap):   %s" % _format_bytes(build['widget_total']))
+    print("per slider:             %s" % _format_bytes(build['per_slider']))
+    print("peak during stats scan: %s" % _format_bytes(build['scan_peak']))
+    print("process rss delta:      %s" % _format_bytes(build['rss_delta']))
+    print("")
+    print("caches:")
+    for name, size in caches:
+        print("  %-28s %s" % (name, _format_bytes(size)))
+    print("")
+    print("rebuild cycles:         %d" % len(leaks['per_cycle']))
+    print("retained over cycles:   %s" % _format_bytes(leaks['growth']))
+    print("leak suspected:         %s" % ("YES" if leaks['leak'] else "no"))
+    for line in leaks['top']:
+        print("  " + line)
+
+
+def _mock_environment(n_sliders):
+    """installs the unit test mocks and returns (widget class, mock layer, process_events)"""
+    os.chdir(PLUGIN_DIR)
+    sys.path.insert(0, PLUGIN_DIR)
+    importlib.import_module('test_range_slider')
+    module = importlib.import_module('data_layer_range_filter_widget_test')
+
+    names = ["f%d" % i for i in range(n_sliders)]
+
+    class MockField:
+        def __init__(self, name): self._name = name
+        def name(self): return self._name
+        def isNumeric(self): return True
+        def type(self): return 6
+
+    class MockDB:
+        def setSubsetString(self, s): pass
+        def fields(self): return [MockField(n) for n in names]
+        def fieldNameIndex(self, n): return names.index(n) if n in names else -1
+
+    class MockLayer:
+        class Signal:
+            def connect(self, fn): pass
+        def __init__(self):
+            self.willBeDeleted = self.Signal()
+            self._props = {}
+        def dataProvider(self): return MockDB()
+        def id(self): return "memory_profile"
+        def name(self): return "memory_profile"
+        def setCustomProperty(self, k, v): self._props[k] = v
+        def customProperty(self, k, default): return self._props.get(k, default)
+        def uniqueValues(self, idx): return ["A", "B"]
+        def aggregate(self, agg, name): return [100 if agg == 1 else 0] # Max, Min
+
+    return module.DataLayerRangeFilterWidget, MockLayer(), None
+
+
+def _qgis_environment(n_sliders, n_features):
+    """starts an offscreen QgsApplication and builds a memory layer to profile"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication, QgsVectorLayer, QgsFeature, QgsGeometry, QgsPointXY
+    from qgis.PyQt.QtCore import QCoreApplication, QEvent
+
+    app = QgsApplication([], True)
+    app.initQgis()
+
+    fields = "&".join("field=f%d:double" % i for i in range(n_sliders))
+    layer = QgsVectorLayer("Point?crs=EPSG:4326&" + fields, "memory_profile", "memory")
+    feats = []
+    for i in range(n_features):
+        f = QgsFeature(layer.fields())
+        f.setAttributes([float((i * (k + 7)) % 1000) for k in range(n_sliders)])
+        f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(i % 360 - 180, i % 180 - 90)))
+        feats.append(f)
+    layer.dataProvider().addFeatures(feats)
+
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    module = importlib.import_module(os.path.basename(PLUGIN_DIR) + '.data_layer_range_filter_widget')
+
+    def process_events():
+        QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+        QCoreApplication.processEvents()
+
+    # keep the application alive as long as the layer
+    layer._memory_profile_app = app
+    return module.DataLayerRangeFilterWidget, layer, process_events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--mock', action='store_true', help="profile against the unit test mocks (default)")
+    mode.add_argument('--qgis', action='store_true', help="profile inside a real offscreen QGIS")
+    parser.add_argument('--sliders', type=int, default=100)
+    parser.add_argument('--features', type=int, default=10000)
+    parser.add_argument('--cycles', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    tracemalloc.start(10)
+    if args.qgis:
+        widget_cls, layer, process_events = _qgis_environment(args.sliders, args.features)
+    else:
+        widget_cls, layer, process_events = _mock_environment(args.sliders)
+
+    widget, build = profile_build(widget_cls, layer)
+    caches = profile_caches(widget)
+    leaks = leak_check(widget, args.cycles, process_events)
+    print_report(build, caches, leaks)
+    return 1 if leaks['leak'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# Field statistics gathered by several worker threads at once.
+#
+# Each worker runs its own loader over a share of the features of a
+# GeoPackage or SpatiaLite table, split by feature id and read straight from
+# the file. Other providers are left to their own aggregates: a worker per
+# share of the fields would read every row several times over. Workers keep
+# mergeable partial results per field, the smallest and largest number and
+# the distinct values up to a limit, which are merged once every worker is
+# done.
+
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+WORKERS = min(8, os.cpu_count() or 1)
+
+
+class FieldSummary(object):
+    """
+    Partial statistics of one field.
+
+    :ivar fmin: smallest number seen, None if none
+    :ivar fmax: largest number seen
+    :ivar nulls: number of NULLs
+    :ivar values: distinct values of a non-numeric field, None once there were more than limit
+    """
+
+    __slots__ = ('numeric', 'limit', 'fmin', 'fmax', 'nulls', 'values')
+
+    def __init__(self, numeric, limit):
+        self.numeric = numeric
+        self.limit = limit
+        self.fmin = None
+        self.fmax = None
+        self.nulls = 0
+        self.values = None if numeric else set()
+
+    def add_column(self, column, size):
+        """takes in the first size values of a feature_loader Column"""
+        if self.numeric:
+            present = [column.values[i] for i in range(size) if not column.nulls[i]]
+            self.nulls += size - len(present)
+            if present:
+                self._widen(min(present), max(present))
+            return
+        if self.values is None:
+            return
+        for value in column.values[:size]:
+            try:
+                self.values.add(value)
+            except TypeError:
+                self.values.add(str(value)) # unhashable, e.g. a QVariant NULL
+        if len(self.values) > self.limit:
+            self.values = None
+
+    def _widen(self, low, high):
+        if self.fmin is None or low < self.fmin:
+            self.fmin = low
+        if self.fmax is None or high > self.fmax:
+            self.fmax = high
+
+    def merge(self, other):
+        self.nulls += other.nulls
+        if other.fmin is not None:
+            self._widen(other.fmin, other.fmax)
+        if self.values is not None:
+            if other.values is None:
+                self.values = None
+            else:
+                self.values |= other.values
+                if len(self.values) > self.limit:
+                    self.values = None
+
+    def range(self):
+        """:return: (min, max) with integral values as ints, the way the provider reports them, or None"""
+        if self.fmin is None:
+            return None
+        return tuple(int(v) if isinstance(v, float) and v.is_integer() else v for v in (self.fmin, self.fmax))
+
+
+def summarize(loader, limit, is_canceled=None):
+    """:return: field name -> FieldSummary over everything one loader reads"""
+    summaries = dict((name, FieldSummary(numeric, limit)) for name, _, numeric in loader.columns)
+    for chunk in loader.chunks(is_canceled=is_canceled):
+        for name, summary in summaries.items():
+            summary.add_column(chunk.columns[name], chunk.size)
+    return summaries
+
+
+def parallel_summaries(loaders, limit, workers=WORKERS, is_canceled=None):
+    """
+    runs every loader on a worker thread and merges what they found
+
+    :return: field name -> FieldSummary
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(loaders)))) as pool:
+        parts = list(pool.map(lambda loader: summarize(loader, limit, is_canceled), loaders))
+    merged = {}
+    for part in parts:
+        for name, summary in part.items():
+            if name in merged:
+                merged[name].merge(summary)
+            else:
+                merged[name] = summary
+    return merged
@@ -0,0 +1,229 @@
+# Column statistics from the footer of a (Geo)Parquet file.
+#
+# A Parquet file ends with its metadata: for every row group, the number of
+# rows and, per column, the minimum, maximum and number of NULLs. That is
+# enough for slider ranges without reading a single row. The metadata is Thrift
+# in its compact encoding; only the little of it needed here is decoded, so
+# no Parquet library is required.
+
+import datetime
+import os
+import struct
+
+MAGIC = b'PAR1'
+
+# physical types
+BOOLEAN, INT32, INT64, INT96, FLOAT, DOUBLE, BYTE_ARRAY, FIXED_LEN_BYTE_ARRAY = range(8)
+# converted types
+CONVERTED_UTF8, CONVERTED_DECIMAL, CONVERTED_DATE = 0, 5, 6
+CONVERTED_TIMESTAMP_MILLIS, CONVERTED_TIMESTAMP_MICROS = 9, 10
+# logical types, by their field id in the LogicalType union
+LOGICAL_STRING, LOGICAL_DECIMAL, LOGICAL_DATE, LOGICAL_TIMESTAMP = 1, 5, 6, 8
+TIMESTAMP_UNITS = {1: 1e3, 2: 1e6, 3: 1e9} # MILLIS, MICROS, NANOS per second
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class _CompactReader(object):
+    """decodes Thrift compact protocol structs into dicts of field id -> value"""
+
+    STOP, TRUE, FALSE, BYTE, I16, I32, I64, DOUBLE, BINARY, LIST, SET, MAP, STRUCT = range(13)
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def _byte(self):
+        b = self.data[self.pos]
+        self.pos += 1
+        return b
+
+    def _varint(self):
+        result = shift = 0
+        while True:
+            b = self._byte()
+            result |= (b & 0x7f) << shift
+            if not b & 0x80:
+                return result
+            shift += 7
+
+    def _zigzag(self):
+        n = self._varint()
+        return (n >> 1) ^ -(n & 1)
+
+    def _value(self, kind):
+        if kind in (self.TRUE, self.FALSE):
+            return kind == self.TRUE
+        if kind == self.BYTE:
+            return struct.unpack('<b', bytes([self._byte()]))[0]
+        if kind in (self.I16, self.I32, self.I64):
+            return self._zigzag()
+        if kind == self.DOUBLE:
+            self.pos += 8
+            return struct.unpack('<d', self.data[self.pos - 8:self.pos])[0]
+        if kind == self.BINARY:
+            size = self._varint()
+            self.pos += size
+            return self.data[self.pos - size:self.pos]
+        if kind in (self.LIST, self.SET):
+            header = self._byte()
+            size = header >> 4
+            if size == 15:
+                size = self._varint()
+            element = header & 0x0f
+            if element in (self.TRUE, self.FALSE):
+                # booleans in a list take a byte each
+                return [self._byte() == 1 for _ in range(size)]
+            return [self._value(element) for _ in range(size)]
+        if kind == self.MAP:
+            size = self._varint()
+            if not size:
+                return {}
+            types = self._byte()
+            return dict((self._value(types >> 4), self._value(types & 0x0f)) for _ in range(size))
+        if kind == self.STRUCT:
+            return self.struct()
+        raise ValueError("unknown thrift compact type %d" % kind)
+
+    def struct(self):
+        fields = {}
+        field_id = 0
+        while True:
+            header = self._byte()
+            kind = header & 0x0f
+            if kind == self.STOP:
+                return fields
+            delta = header >> 4
+            field_id = field_id + delta if delta else self._zigzag()
+            fields[field_id] = self._value(kind)
+
+
+def is_parquet_file(path):
+    try:
+        with open(path, 'rb') as f:
+            if f.read(4) != MAGIC:
+                return False
+            f.seek(-4, os.SEEK_END)
+            return f.read(4) == MAGIC
+    except (OSError, IOError):
+        return False
+
+
+def parquet_path(layer):
+    """:return: the path of a layer read from a local Parquet file through OGR, or None"""
+    db = layer.dataProvider()
+    if not hasattr(db, 'name') or db.name() != 'ogr':
+        return None
+    path = db.dataSourceUri().split('|')[0]
+    return path if os.path.isfile(path) and is_parquet_file(path) else None
+
+
+class ParquetFooter(object):
+    """
+    Row group statistics of a Parquet file.
+
+    :ivar num_rows: rows in the file
+    :ivar row_groups: list of (number of rows, {column: (min, max, null count)}), with
+        min and max None where the writer left them out
+    """
+
+    def __init__(self, num_rows, row_groups):
+        self.num_rows = num_rows
+        self.row_groups = row_groups
+
+    @classmethod
+    def read(cls, path):
+        """:raise ValueError: if path is not a readable Parquet file"""
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size < 12:
+                raise ValueError("%s is too small for a Parquet file" % path)
+            f.seek(size - 8)
+            length, magic = struct.unpack('<i4s', f.read(8))
+            if magic != MAGIC or length <= 0 or length > size - 12:
+                raise ValueError("%s has no Parquet footer" % path)
+            f.seek(size - 8 - length)
+            data = f.read(length)
+        try:
+            meta = _CompactReader(data).struct()
+        except (IndexError, struct.error) as e:
+            raise ValueError("%s has a damaged Parquet footer: %s" % (path, e))
+
+        # top level columns only, nested ones have no single value per row
+        types = {}
+        schema = meta.get(2, [])
+        for element in schema[1:]:
+            if 5 not in element and 1 in element:
+                types[element[4].decode('utf-8')] = element
+
+        row_groups = []
+        for group in meta.get(4, []):
+            columns = {}
+            for chunk in group.get(1, []):
+                column = chunk.get(3, {})
+                path_in_schema = [p.decode('utf-8') for p in column.get(3, [])]
+                if len(path_in_schema) != 1 or path_in_schema[0] not in types:
+                    continue
+                name = path_in_schema[0]
+                stats = column.get(12, {})
+                element = types[name]
+                # min_value/max_value are exact; the older min/max are only trusted for numbers
+                low, high = stats.get(6), stats.get(5)
+                if low is None and high is None and element[1] in (INT32, INT64, FLOAT, DOUBLE):
+                    low, high = stats.get(2), stats.get(1)
+                columns[name] = (_decode(element, low), _decode(element, high), stats.get(3))
+            row_groups.append((group.get(3, 0), columns))
+        return cls(meta.get(3, 0), row_groups)
+
+    def column_range(self, name):
+        """:return: (min, max) of a column over the whole file, or None when a row group has no statistics for it"""
+        low = high = None
+        for num_rows, columns in self.row_groups:
+            if name not in columns:
+                return None
+            gmin, gmax, nulls = columns[name]
+            if gmin is None or gmax is None:
+                if nulls is not None and nulls == num_rows:
+                    continue # nothing but NULLs
+                return None
+            low = gmin if low is None or gmin < low else low
+            high = gmax if high is None or gmax > high else high
+        return None if low is None else (low, high)
+
+
+def _decode(element, raw):
+    """converts a min/max statistic to a Python value, None where it can't be interpreted"""
+    if raw is None:
+        return None
+    physical = element.get(1)
+    converted = element.get(6)
+    logical = element.get(10, {})
+    try:
+        if physical == BOOLEAN:
+            return bool(raw[0])
+        if physical == INT32:
+            value = struct.unpack('<i', raw[:4])[0]
+        elif physical == INT64:
+            value = struct.unpack('<q', raw[:8])[0]
+        elif physical == FLOAT:
+            return struct.unpack('<f', raw[:4])[0]
+        elif physical == DOUBLE:
+            return struct.unpack('<d', raw[:8])[0]
+        elif physical == BYTE_ARRAY and (converted == CONVERTED_UTF8 or LOGICAL_STRING in logical):
+            return raw.decode('utf-8')
+        else:
+            return None
+    except (struct.error, UnicodeDecodeError, IndexError):
+        return None
+
+    if converted == CONVERTED_DECIMAL or LOGICAL_DECIMAL in logical:
+        return None # the scale would be needed
+    if converted == CONVERTED_DATE or LOGICAL_DATE in logical:
+        return (EPOCH + datetime.timedelta(days=value)).date()
+    if LOGICAL_TIMESTAMP in logical:
+        unit = logical[LOGICAL_TIMESTAMP].get(2, {})
+        per_second = next((TIMESTAMP_UNITS[k] for k in unit if k in TIMESTAMP_UNITS), 1e3)
+        return EPOCH + datetime.timedelta(seconds=value / per_second)
+    if converted in (CONVERTED_TIMESTAMP_MILLIS, CONVERTED_TIMESTAMP_MICROS):
+        return EPOCH + datetime.timedelta(seconds=value / (1e3 if converted == CONVERTED_TIMESTAMP_MILLIS else 1e6))
+    return value
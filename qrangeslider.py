@@ -46,13 +46,17 @@ __version__ = "0.1.2"
 # ---------------------------------------------------------------------------------------------
 """The QRangeSlider class implements a horizontal range slider widget.
 
+QPaintedRangeSlider offers the same interface drawn in a single paintEvent,
+for legends that hold many sliders.
 """
 
 # ---------------------------------------------------------------------------------------------
 # IMPORTS
 # ---------------------------------------------------------------------------------------------
 import os
+import re
 import sys
+import time
 
 from PyQt5 import QtCore
 from PyQt5 import QtGui
@@ -65,7 +69,7 @@ try:
 except AttributeError:
     _fromUtf8 = lambda s: s
 
-__all__ = ['QRangeSlider']
+__all__ = ['QRangeSlider', 'QPaintedRangeSlider']
 
 HANDLE_BORDER_WIDTH = 2
 
@@ -114,6 +118,64 @@ def scale(val, src, dst):
     """
     return int(((val - src[0]) / float(src[1]-src[0])) * (dst[1]-dst[0]) + dst[0])
 
+# value ranges wider than this have their labels formatted on demand instead of in a table
+LABEL_TABLE_LIMIT = 4096
+
+_LABEL_FONT = None
+_LABEL_FONT_METRICS = None
+
+def labelFont():
+    """:return: the font slider labels are drawn in, created once"""
+    global _LABEL_FONT
+    if _LABEL_FONT is None:
+        _LABEL_FONT = QtGui.QFont('Arial', 8)
+    return _LABEL_FONT
+
+def labelFontMetrics():
+    """:return: metrics of labelFont(), created once"""
+    global _LABEL_FONT_METRICS
+    if _LABEL_FONT_METRICS is None:
+        _LABEL_FONT_METRICS = QtGui.QFontMetrics(labelFont())
+    return _LABEL_FONT_METRICS
+
+
+class LabelTable(object):
+    """
+    Mixin that formats slider values through textPrinter once.
+
+    The first label requested after the range or printer changes formats
+    every position from min() to max() into a table; painting then only
+    indexes into it. Call invalidateLabels() when the printer's own output
+    changes (e.g. new data bounds behind the same slider range).
+    """
+
+    _labels = None
+
+    def label(self, value):
+        """:return: display text for a slider value"""
+        if self.textPrinter is None:
+            return str(value)
+        table = self._labels
+        if table is None:
+            table = self._labels = self._buildLabels()
+        lo, texts = table
+        i = value - lo
+        if texts is not None and 0 <= i < len(texts):
+            return texts[i]
+        return self.textPrinter.pretty(value)
+
+    def _buildLabels(self):
+        lo, hi = self.min(), self.max()
+        if hi - lo > LABEL_TABLE_LIMIT:
+            return (lo, None)
+        return (lo, [self.textPrinter.pretty(v) for v in range(lo, hi + 1)])
+
+    def invalidateLabels(self):
+        """drops the label table, it is rebuilt on the next paint"""
+        self._labels = None
+        self.update()
+
+
 class Ui_Form(object):
     """default range slider form"""
     
@@ -190,10 +252,8 @@ class Head(Element):
 
     def drawText(self, event, qp):
         qp.setPen(self.textColor())
-        qp.setFont(QtGui.QFont('Arial', 8))
-        min_text = str(self.main.min())
-        if self.main.textPrinter is not None:
-            min_text = self.main.textPrinter.pretty(self.main.min())
+        qp.setFont(labelFont())
+        min_text = self.main.label(self.main.min())
         qp.drawText(event.rect(), QtCore.Qt.AlignLeft, min_text)
 
 
@@ -205,10 +265,8 @@ class Tail(Element):
         
     def drawText(self, event, qp):
         qp.setPen(self.textColor())
-        qp.setFont(QtGui.QFont('Arial', 8))
-        max_text = str(self.main.max())
-        if self.main.textPrinter is not None:
-            max_text = self.main.textPrinter.pretty(self.main.max())
+        qp.setFont(labelFont())
+        max_text = self.main.label(self.main.max())
 
         qp.drawText(event.rect(), QtCore.Qt.AlignRight, max_text)
 
@@ -221,13 +279,10 @@ class Handle(Element):
         
     def drawText(self, event, qp):
         qp.setPen(self.textColor())
-        qp.setFont(QtGui.QFont('Arial', 8))
-        start_text = str(self.main.start())
-        end_text = str(self.main.end())
-        if self.main.textPrinter is not None:
-            start_text = self.main.textPrinter.pretty(self.main.start())
-            end_text = self.main.textPrinter.pretty(self.main.end())
-        
+        qp.setFont(labelFont())
+        start_text = self.main.label(self.main.start())
+        end_text = self.main.label(self.main.end())
+
         # give a little buffer for the text
         rect = event.rect()
         rect.adjust(MARGIN_HANDLE_WIDTH, 0, -MARGIN_HANDLE_WIDTH, 0)
@@ -237,6 +292,7 @@ class Handle(Element):
 
     def mouseMoveEvent(self, event):
         event.accept()
+        self.main._markInteraction()
         mx = event.globalX()
         _mx = getattr(self, '__mx', None)
         
@@ -262,7 +318,7 @@ class Handle(Element):
             self.main.setRange(s, e)
 
 
-class QRangeSlider(QWidget, Ui_Form):
+class QRangeSlider(QWidget, Ui_Form, LabelTable):
     """
     The QRangeSlider class implements a horizontal range slider widget.
 
@@ -274,6 +330,7 @@ class QRangeSlider(QWidget, Ui_Form):
         * bool drawValues (self)
         * int end (self)
         * (int, int) getRange (self)
+        * float interactionTime (self)
         * int max (self)
         * int min (self)
         * int start (self)
@@ -397,12 +454,14 @@ class QRangeSlider(QWidget, Ui_Form):
         """sets minimum value"""
         assert type(value) is int
         setattr(self, '__min', value)
+        self._labels = None
         self.minValueChanged.emit(value)
 
     def setMax(self, value):
         """sets maximum value"""
         assert type(value) is int
         setattr(self, '__max', value)
+        self._labels = None
         self.maxValueChanged.emit(value)
     
     def start(self):
@@ -441,6 +500,14 @@ class QRangeSlider(QWidget, Ui_Form):
         self._splitter.splitterMoved.connect(self._handleMoveSplitter)
         self._setEnd(value)
 
+    def interactionTime(self):
+        """:return: time.perf_counter() of the last user drag or key press, or None"""
+        return getattr(self, '__interactionTime', None)
+
+    def _markInteraction(self):
+        """records that the user is moving the slider right now"""
+        setattr(self, '__interactionTime', time.perf_counter())
+
     def drawValues(self):
         """:return: True if slider values will be drawn"""
         return getattr(self, '__drawValues', None)
@@ -449,6 +516,7 @@ class QRangeSlider(QWidget, Ui_Form):
         """sets draw values boolean to draw slider values"""
         assert type(draw) is bool
         self.textPrinter = textPrinter
+        self._labels = None
         setattr(self, '__drawValues', draw)
 
     def getRange(self):
@@ -473,6 +541,7 @@ class QRangeSlider(QWidget, Ui_Form):
             event.ignore()
             return
         event.accept()
+        self._markInteraction()
         if s >= self.min() and e <= self.max():
             self.setRange(s, e)
 
@@ -502,6 +571,7 @@ class QRangeSlider(QWidget, Ui_Form):
 
     def _handleMoveSplitter(self, xpos, index):
         """private method for handling moving splitter handles"""
+        self._markInteraction()
         hw = self._splitter.handleWidth()
         
         def _lockWidth(widget):
@@ -537,6 +607,307 @@ class QRangeSlider(QWidget, Ui_Form):
         _unlockWidth(self._handle)
 
 
+class QPaintedRangeSlider(QWidget, LabelTable):
+    """
+    Drop-in replacement for QRangeSlider that has no child widgets.
+
+    Track, span, handles and labels are drawn in a single paintEvent and the
+    handles are hit-tested by hand, so building one costs a single QWidget
+    and dragging a handle never triggers a relayout. Methods and signals are
+    the same as QRangeSlider's; styles given to setBackgroundStyle and
+    setSpanStyle are reduced to their background colour.
+    """
+
+    # what the mouse is dragging
+    _DRAG_NONE = 0
+    _DRAG_START = 1
+    _DRAG_END = 2
+    _DRAG_SPAN = 3
+
+    HANDLE_WIDTH = 4 + 2*HANDLE_BORDER_WIDTH
+    # extra pixels either side of a handle that still grab it
+    HANDLE_GRAB_MARGIN = 2
+
+    # signals
+    minValueChanged = QtCore.pyqtSignal(int)
+    maxValueChanged = QtCore.pyqtSignal(int)
+    startValueChanged = QtCore.pyqtSignal(int)
+    endValueChanged = QtCore.pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super(QPaintedRangeSlider, self).__init__(parent)
+        self.setObjectName(_fromUtf8("QRangeSlider"))
+        self.setMouseTracking(False)
+        self.setFocusPolicy(QtCore.Qt.ClickFocus)
+        self.resize(300, 30)
+
+        self._min = 0
+        self._max = 100
+        self._start = 0
+        self._end = 100
+        self._drawValues = True
+        self.textPrinter = None
+        self._interactionTime = None
+
+        self._drag = self._DRAG_NONE
+        self._dragOffset = 0
+        self._dragAnchor = (0, 0, 0)
+
+        self._backgroundColor = QtGui.QColor('#e6e6e6')
+        self._spanColor = QtGui.QColor('#e6e6e6')
+        self._spanActiveColor = QtGui.QColor('#B7B7B7')
+        self._handleColor = QtGui.QColor('#FFFFFF')
+        self._handlePressedColor = QtGui.QColor('#ca5')
+        self._handleBorderColor = QtGui.QColor('#777')
+        self._outerTextColor = QtGui.QColor(125, 125, 125)
+        self._spanTextColor = QtGui.QColor(30, 30, 30)
+
+    def sizeHint(self):
+        return QtCore.QSize(300, labelFontMetrics().height() + 4)
+
+    def min(self):
+        """:return: minimum value"""
+        return self._min
+
+    def max(self):
+        """:return: maximum value"""
+        return self._max
+
+    def setMin(self, value):
+        """sets minimum value"""
+        assert type(value) is int
+        self._min = value
+        self._labels = None
+        self.minValueChanged.emit(value)
+        self.update()
+
+    def setMax(self, value):
+        """sets maximum value"""
+        assert type(value) is int
+        self._max = value
+        self._labels = None
+        self.maxValueChanged.emit(value)
+        self.update()
+
+    def start(self):
+        """:return: range slider start value"""
+        return self._start
+
+    def end(self):
+        """:return: range slider end value"""
+        return self._end
+
+    def _setStart(self, value):
+        """stores the start value, repaints and notifies"""
+        old = self._movingRect()
+        self._start = value
+        self.update(old.united(self._movingRect()))
+        self.startValueChanged.emit(value)
+
+    def setStart(self, value):
+        """sets the range slider start value"""
+        assert type(value) is int
+        self._setStart(value)
+
+    def _setEnd(self, value):
+        """stores the end value, repaints and notifies"""
+        old = self._movingRect()
+        self._end = value
+        self.update(old.united(self._movingRect()))
+        self.endValueChanged.emit(value)
+
+    def setEnd(self, value):
+        """set the range slider end value"""
+        assert type(value) is int
+        self._setEnd(value)
+
+    def interactionTime(self):
+        """:return: time.perf_counter() of the last user drag or key press, or None"""
+        return self._interactionTime
+
+    def _markInteraction(self):
+        """records that the user is moving the slider right now"""
+        self._interactionTime = time.perf_counter()
+
+    def drawValues(self):
+        """:return: True if slider values will be drawn"""
+        return self._drawValues
+
+    def setDrawValues(self, draw, textPrinter=None):
+        """sets draw values boolean to draw slider values"""
+        assert type(draw) is bool
+        self.textPrinter = textPrinter
+        self._labels = None
+        self._drawValues = draw
+        self.update()
+
+    def getRange(self):
+        """:return: the start and end values as a tuple"""
+        return (self.start(), self.end())
+
+    def setRange(self, start, end):
+        """set the start and end values"""
+        self.setStart(start)
+        self.setEnd(end)
+
+    def keyPressEvent(self, event):
+        """overrides key press event to move range left and right"""
+        key = event.key()
+        if key == QtCore.Qt.Key_Left:
+            s = self.start()-1
+            e = self.end()-1
+        elif key == QtCore.Qt.Key_Right:
+            s = self.start()+1
+            e = self.end()+1
+        else:
+            event.ignore()
+            return
+        event.accept()
+        self._markInteraction()
+        if s >= self.min() and e <= self.max():
+            self.setRange(s, e)
+
+    def _backgroundFromStyle(self, style):
+        """pulls the colour out of a `background: <color>` style, or None"""
+        match = re.search(r'background(?:-color)?\s*:\s*([^;]+)', style)
+        if match is None:
+            return None
+        color = QtGui.QColor(match.group(1).strip())
+        return color if color.isValid() else None
+
+    def setBackgroundStyle(self, style):
+        """sets background style"""
+        color = self._backgroundFromStyle(style)
+        if color is not None:
+            self._backgroundColor = color
+            self.update()
+
+    def setSpanStyle(self, style):
+        """sets range span handle style"""
+        color = self._backgroundFromStyle(style)
+        if color is not None:
+            self._spanColor = color
+            self._spanActiveColor = color.darker(125)
+            self.update()
+
+    # geometry: | head | start handle | span | end handle | tail |
+
+    def _mouseActiveAreaWidth(self):
+        """pixels the handles can travel over"""
+        return max(0, self.width() - 2*self.HANDLE_WIDTH)
+
+    def _valueToPos(self, value):
+        """converts slider value to local pixel x coord of the left edge of its handle"""
+        if self._max == self._min:
+            return 0
+        return scale(value, (self._min, self._max), (0, self._mouseActiveAreaWidth()))
+
+    def _posToValue(self, xpos):
+        """converts local pixel x coord to slider value"""
+        width = self._mouseActiveAreaWidth()
+        if width == 0:
+            return self._min
+        return scale(xpos, (0, width), (self._min, self._max))
+
+    def _startHandleRect(self):
+        return QtCore.QRect(self._valueToPos(self._start), 0, self.HANDLE_WIDTH, self.height())
+
+    def _endHandleRect(self):
+        return QtCore.QRect(self._valueToPos(self._end) + self.HANDLE_WIDTH, 0, self.HANDLE_WIDTH, self.height())
+
+    def _movingRect(self):
+        """the part of the slider that changes when the handles move: both handles and the span between"""
+        return self._startHandleRect().united(self._endHandleRect())
+
+    def paintEvent(self, event):
+        """draws the whole slider"""
+        w = self.width()
+        h = self.height()
+        start_rect = self._startHandleRect()
+        end_rect = self._endHandleRect()
+        head_rect = QtCore.QRect(0, 0, start_rect.left(), h)
+        span_rect = QtCore.QRect(start_rect.right() + 1, 0, end_rect.left() - start_rect.right() - 1, h)
+        tail_rect = QtCore.QRect(end_rect.right() + 1, 0, w - end_rect.right() - 1, h)
+
+        qp = QtGui.QPainter()
+        qp.begin(self)
+        qp.fillRect(head_rect, self._backgroundColor)
+        qp.fillRect(tail_rect, self._backgroundColor)
+        qp.fillRect(span_rect, self._spanActiveColor if self._drag == self._DRAG_SPAN else self._spanColor)
+
+        if self.drawValues():
+            qp.setFont(labelFont())
+            qp.setPen(self._outerTextColor)
+            qp.drawText(head_rect, QtCore.Qt.AlignLeft, self.label(self._min))
+            qp.drawText(tail_rect, QtCore.Qt.AlignRight, self.label(self._max))
+            qp.setPen(self._spanTextColor)
+            text_rect = span_rect.adjusted(MARGIN_HANDLE_WIDTH, 0, -MARGIN_HANDLE_WIDTH, 0)
+            qp.drawText(text_rect, QtCore.Qt.AlignLeft, self.label(self._start))
+            qp.drawText(text_rect, QtCore.Qt.AlignRight, self.label(self._end))
+
+        pen = QtGui.QPen(self._handleBorderColor)
+        pen.setWidth(HANDLE_BORDER_WIDTH)
+        qp.setPen(pen)
+        qp.setRenderHint(QtGui.QPainter.Antialiasing, True)
+        inset = HANDLE_BORDER_WIDTH / 2.0
+        for rect, pressed in ((start_rect, self._drag == self._DRAG_START), (end_rect, self._drag == self._DRAG_END)):
+            qp.setBrush(self._handlePressedColor if pressed else self._handleColor)
+            qp.drawRoundedRect(QtCore.QRectF(rect).adjusted(inset, inset, -inset, -inset), 2, 2)
+        qp.end()
+
+    def mousePressEvent(self, event):
+        if event.button() != QtCore.Qt.LeftButton:
+            event.ignore()
+            return
+        x = event.x()
+        m = self.HANDLE_GRAB_MARGIN
+        start_rect = self._startHandleRect().adjusted(-m, 0, m, 0)
+        end_rect = self._endHandleRect().adjusted(-m, 0, m, 0)
+        # when the handles overlap, prefer the one that can still move
+        if end_rect.contains(x, 1) and (not start_rect.contains(x, 1) or self._end < self._max):
+            self._drag = self._DRAG_END
+            self._dragOffset = x - self._endHandleRect().left()
+        elif start_rect.contains(x, 1):
+            self._drag = self._DRAG_START
+            self._dragOffset = x - self._startHandleRect().left()
+        elif start_rect.right() < x < end_rect.left():
+            self._drag = self._DRAG_SPAN
+            self._dragAnchor = (x, self._start, self._end)
+        else:
+            event.ignore()
+            return
+        event.accept()
+        self.update()
+
+    def mouseMoveEvent(self, event):
+        if self._drag == self._DRAG_NONE:
+            event.ignore()
+            return
+        event.accept()
+        self._markInteraction()
+        x = event.x()
+        if self._drag == self._DRAG_START:
+            v = min(max(self._posToValue(x - self._dragOffset), self._min), self._end)
+            if v != self._start:
+                self._setStart(v)
+        elif self._drag == self._DRAG_END:
+            v = min(max(self._posToValue(x - self._dragOffset - self.HANDLE_WIDTH), self._start), self._max)
+            if v != self._end:
+                self._setEnd(v)
+        else:
+            anchor_x, s0, e0 = self._dragAnchor
+            dv = self._posToValue(x) - self._posToValue(anchor_x)
+            dv = min(max(dv, self._min - s0), self._max - e0)
+            if s0 + dv != self._start:
+                self.setRange(s0 + dv, e0 + dv)
+
+    def mouseReleaseEvent(self, event):
+        if self._drag != self._DRAG_NONE:
+            self._drag = self._DRAG_NONE
+            self.update()
+        event.accept()
+
+
 #-------------------------------------------------------------------------------
 # MAIN
 #-------------------------------------------------------------------------------
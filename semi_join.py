@@ -0,0 +1,119 @@
+# Filters on the fields a vector layer join brings in.
+#
+# Joined fields are not in the provider's table, so no subset string can
+# name them, and filtering them through expressions evaluates the join for
+# every feature. Their filter is worked out on the join layer instead: the
+# join key and the joined column are read once into a JoinTable, a filter
+# state picks out the keys of the rows it lets through, and the target
+# layer is filtered on its own key field with an IN list of those keys.
+# As QGIS does, a key is joined to the first row that has it. The table is
+# indexed by value once, so moving a filter looks up the keys it lets
+# through instead of going over every row.
+
+import bisect
+
+try:
+    from .category_index import value_key
+except ImportError:
+    # loaded as a top-level module, as the tests do
+    from category_index import value_key
+
+
+def joined_fields(layer):
+    """
+    :return: (field name in the layer, QgsVectorLayerJoinInfo, QgsField of the join layer)
+        of every field a join adds to layer
+    """
+    if not hasattr(layer, 'vectorJoins'):
+        return []
+    found = []
+    for join in layer.vectorJoins():
+        join_layer = join.joinLayer()
+        if join_layer is None:
+            continue # the join layer is not loaded
+        subset = join.joinFieldNamesSubset()
+        for field in join_layer.fields():
+            # the join key itself is never added
+            if field.name() == join.joinFieldName() or subset is not None and field.name() not in subset:
+                continue
+            found.append((join.prefixedFieldName(field), join, field))
+    return found
+
+
+def _key(value):
+    # the provider hands integral keys back as floats from numeric columns
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+class JoinTable(object):
+    """
+    Join key and joined value of every row of a join layer, for one joined field.
+
+    :ivar keys: join key per row
+    :ivar values: joined value per row, None for NULL
+    """
+
+    def __init__(self, keys, values):
+        self.keys = list(keys)
+        self.values = list(values)
+        # joined value -> keys joined to it, and the keys with a value in ascending order of it, once asked for
+        self._by_value = None
+        self._ordered = None
+
+    @classmethod
+    def load(cls, loader, key_name, value_name, is_canceled=None):
+        """:return: the table read by a feature_loader loader, or None when the load was canceled"""
+        keys = []
+        values = []
+        for chunk in loader.chunks(is_canceled=is_canceled):
+            keys.extend(chunk.values(key_name))
+            values.extend(chunk.values(value_name))
+        return None if loader.canceled else cls(keys, values)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def range(self):
+        """:return: (min, max) of the joined values, or None if they are all NULL"""
+        present = [v for v in self.values if v is not None]
+        return (min(present), max(present)) if present else None
+
+    def distinct_values(self):
+        """:return: the distinct joined values, in the order they first occur"""
+        seen = set()
+        distinct = []
+        for value in self.values:
+            try:
+                if value in seen:
+                    continue
+                seen.add(value)
+            except TypeError:
+                pass # unhashable, e.g. a QVariant NULL
+            distinct.append(value)
+        return distinct
+
+    def keys_by_value(self):
+        """:return: joined value, None for NULL -> the keys joined to it, NULL keys left out"""
+        if self._by_value is None:
+            by_value = {}
+            seen = set()
+            for key, value in zip(self.keys, self.values):
+                if value_key(key) is None:
+                    continue
+                key = _key(key)
+                if key in seen:
+                    continue # joined to an earlier row
+                seen.add(key)
+                by_value.setdefault(value_key(value), []).append(key)
+            self._by_value = by_value
+        return self._by_value
+
+    def keys_between(self, low, high):
+        """:return: the keys joined to a value from low to high, in ascending order of it"""
+        if self._ordered is None:
+            pairs = sorted(((value, keys) for value, keys in self.keys_by_value().items() if value is not None),
+                           key=lambda pair: pair[0])
+            self._ordered = ([value for value, _ in pairs], [keys for _, keys in pairs])
+        values, keys = self._ordered
+        start, end = bisect.bisect_left(values, low), bisect.bisect_right(values, high)
+        return [key for found in keys[start:end] for key in found]
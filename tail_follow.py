@@ -0,0 +1,148 @@
+# Reads the rows appended to a delimited text file since it was last read.
+#
+# Used by the widget's follow mode for CSV and log layers that keep growing:
+# rather than scanning the whole layer again on every change, only the bytes
+# past the last complete line that was read are parsed.
+
+import csv
+import io
+import os
+import re
+
+from urllib.parse import urlparse, parse_qs, unquote
+
+# block size used to find the last complete line of a file
+READ_BACK_BYTES = 65536
+
+
+def delimited_text_source(uri):
+    """
+    parses the data source URI of a delimitedtext layer
+
+    :return: dict with path, type ('csv', 'regexp' or 'whitespace'), delimiter, quote,
+        encoding, use_header and skip_lines, or None if the URI is not a local file
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme not in ('file', ''):
+        return None
+    path = unquote(parsed.path)
+    if re.match(r'^/[A-Za-z]:/', path):
+        path = path[1:] # file:///C:/data.csv
+    query = dict((k, v[-1]) for k, v in parse_qs(parsed.query, keep_blank_values=True).items())
+    source_type = query.get('type', 'csv')
+    delimiter = query.get('delimiter', ',' if source_type == 'csv' else '')
+    delimiter = delimiter.replace('\\t', '\t')
+    return {
+        'path': path,
+        'type': source_type,
+        'delimiter': delimiter,
+        'quote': query.get('quote', '"'),
+        'encoding': query.get('encoding', 'UTF-8'),
+        'use_header': query.get('useHeader', 'yes').lower() not in ('no', 'false', '0'),
+        'skip_lines': int(query.get('skipLines', 0) or 0),
+    }
+
+
+class TailReader(object):
+    """
+    Follows a delimited text file, returning the rows appended to it as dicts
+    of field name -> text. A row is only returned once its line is complete.
+    """
+
+    def __init__(self, path, field_names, source_type='csv', delimiter=',', quote='"', encoding='UTF-8', use_header=True, skip_lines=0):
+        self.path = path
+        self.field_names = list(field_names)
+        self.source_type = source_type
+        self.delimiter = delimiter
+        self.quote = quote or '"'
+        self.encoding = encoding
+        self.use_header = use_header
+        self.skip_lines = skip_lines
+        # byte offset just past the last complete line read
+        self.offset = 0
+        # number of lines before offset
+        self.lines = 0
+        # line number, from 1, of each row read_appended last returned: the feature
+        # ids the delimitedtext provider gives them
+        self.row_lines = []
+
+    @classmethod
+    def for_source(cls, source, field_names):
+        return cls(source['path'], field_names, source['type'], source['delimiter'], source['quote'],
+                   source['encoding'], source['use_header'], source['skip_lines'])
+
+    def start(self):
+        """follows from the current end of the file: what is already there has been scanned"""
+        self.offset = 0
+        self.lines = 0
+        self.row_lines = []
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            if self.use_header:
+                for _ in range(self.skip_lines):
+                    f.readline()
+                header = self._split(f.readline().decode(self.encoding, 'replace').rstrip('\r\n'))
+                if header:
+                    self.field_names = header
+            # end of the last complete line, looking back from the end of the file
+            pos = f.seek(0, os.SEEK_END)
+            while pos > 0:
+                step = min(READ_BACK_BYTES, pos)
+                f.seek(pos - step)
+                newline = f.read(step).rfind(b'\n')
+                if newline != -1:
+                    self.offset = pos - step + newline + 1
+                    break
+                pos -= step
+            # and the lines up to it, which number the rows appended after
+            f.seek(0)
+            done = 0
+            while done < self.offset:
+                block = f.read(min(READ_BACK_BYTES, self.offset - done))
+                if not block:
+                    break
+                self.lines += block.count(b'\n')
+                done += len(block)
+
+    def read_appended(self):
+        """
+        :return: (rows, truncated). rows are the complete lines appended since the last
+            call; truncated is True when the file shrank or was replaced, in which case
+            nothing is returned and the caller should scan it again and call start()
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return [], True
+        if size < self.offset:
+            return [], True
+        if size == self.offset:
+            return [], False
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        end = data.rfind(b'\n')
+        if end == -1:
+            return [], False # the line is still being written
+        self.offset += end + 1
+        rows = []
+        self.row_lines = []
+        for line in data[:end].decode(self.encoding, 'replace').split('\n'):
+            self.lines += 1
+            line = line.rstrip('\r')
+            if not line.strip():
+                continue
+            values = self._split(line)
+            rows.append(dict(zip(self.field_names, values)))
+            self.row_lines.append(self.lines)
+        return rows, False
+
+    def _split(self, line):
+        if not line:
+            return []
+        if self.source_type == 'whitespace':
+            return line.split()
+        if self.source_type == 'regexp':
+            return re.split(self.delimiter, line)
+        return next(csv.reader(io.StringIO(line), delimiter=self.delimiter[:1] or ',', quotechar=self.quote[:1]))
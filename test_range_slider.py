@@ -1,6 +1,8 @@
 import sys
 import datetime
+import json
 import os
+import re
 
 # Mock qgis modules so we can import the widget class
 class MockQgis:
@@ -11,6 +13,56 @@ class MockQgis:
             def logMessage(msg, tag, level):
                 pass
         QgsAggregateCalculator = type('QgsAggregateCalculator', (), {'Max': 1, 'Min': 2})
+        class QgsProject:
+            project = None
+            @staticmethod
+            def instance():
+                class Root:
+                    def findLayer(self, layer_id): return None
+                class Project:
+                    def __init__(self): self.writeProject = MockQgis.PyQt.QtCore.Signal()
+                    def layerTreeRoot(self): return Root()
+                if MockQgis.core.QgsProject.project is None:
+                    MockQgis.core.QgsProject.project = Project()
+                return MockQgis.core.QgsProject.project
+        class QgsTask:
+            CanCancel = 2
+            def __init__(self, description="", flags=0): self._canceled = False
+            def isCanceled(self): return self._canceled
+            def cancel(self): self._canceled = True
+            def setProgress(self, p): pass
+        class QgsApplication:
+            @staticmethod
+            def taskManager():
+                class TaskManager:
+                    def addTask(self, task):
+                        # run tasks right away
+                        task.finished(task.run())
+                return TaskManager()
+        class QgsFeatureRequest:
+            NoGeometry = 1
+            def setFlags(self, flags):
+                self.flags = flags
+                return self
+            def setSubsetOfAttributes(self, *args):
+                self.attributes = args[0]
+                return self
+            def setFilterFids(self, fids):
+                self.fids = fids
+                return self
+        class QgsVectorLayerFeatureSource:
+            # like a provider's feature source, it keeps the subset string in force when it was made
+            def __init__(self, layer):
+                self.layer = layer
+                db = layer.dataProvider()
+                self.subset = db.subsetString() if hasattr(db, 'subsetString') else ""
+            def getFeatures(self, request):
+                return iter(self.layer.matching(self.subset) if hasattr(self.layer, 'matching') else self.layer.features)
+        class QgsSpatialIndex:
+            # bounding boxes as (xmin, ymin, xmax, ymax), extents likewise
+            def __init__(self, features): self.boxes = dict((f.id(), f.bbox) for f in features)
+            def intersects(self, r):
+                return [fid for fid, b in self.boxes.items() if b[0] <= r[2] and r[0] <= b[2] and b[1] <= r[3] and r[1] <= b[3]]
         QgsMapLayer = type('QgsMapLayer', (), {})
         QgsExpression = type('QgsExpression', (), {})
         QgsExpressionContext = type('QgsExpressionContext', (), {})
@@ -26,15 +78,33 @@ class MockQgis:
                     pass
                 def deleteLater(self):
                     pass
-                def setToolTip(self, *args):
-                    pass
+                def setToolTip(self, text):
+                    self._tool_tip = text
+                def toolTip(self):
+                    return getattr(self, '_tool_tip', "")
                 def setFixedWidth(self, *args):
                     pass
                 def setLayout(self, *args):
                     pass
+                def width(self):
+                    return 100
+                def height(self):
+                    return 100
+                def adjustSize(self):
+                    pass
+                def resize(self, *args):
+                    pass
+                def updateGeometry(self):
+                    pass
+                def showEvent(self, event):
+                    pass
             class QVBoxLayout:
                 def addWidget(self, *args):
                     pass
+                def addLayout(self, *args):
+                    pass
+                def removeWidget(self, *args):
+                    pass
                 def setSpacing(self, *args):
                     pass
                 def setContentsMargins(self, *args):
@@ -42,6 +112,8 @@ class MockQgis:
             class QHBoxLayout:
                 def addWidget(self, *args):
                     pass
+                def addLayout(self, *args):
+                    pass
                 def setSpacing(self, *args):
                     pass
                 def setContentsMargins(self, *args):
@@ -64,10 +136,14 @@ class MockQgis:
                     pass
                 def addItem(self, item):
                     self._items.append(item)
+                def clear(self):
+                    self._items = []
                 def count(self):
                     return len(self._items)
                 def item(self, i):
                     return self._items[i]
+                def blockSignals(self, b):
+                    pass
             class QListWidgetItem:
                 def __init__(self, text=""):
                     self.text = text
@@ -116,6 +192,20 @@ class MockQgis:
                 def __init__(self, text=""): pass
                 def flags(self): return 0
                 def setFlags(self, *args): pass
+            class QTableView(QWidget):
+                pass
+            class QLineEdit(QWidget):
+                def __init__(self, text=""):
+                    super().__init__()
+                    self._text = text
+                    self.textChanged = MockQgis.PyQt.QtCore.Signal()
+                def setPlaceholderText(self, text): pass
+                def setText(self, text):
+                    self._text = text
+                    self.textChanged.emit(text)
+                def text(self): return self._text
+            class QPushButton(QWidget):
+                pass
             class QDialogButtonBox(QWidget):
                 Ok = 1
                 Cancel = 2
@@ -125,6 +215,47 @@ class MockQgis:
                         def connect(self, fn): pass
                     self.accepted = Sig()
                     self.rejected = Sig()
+            class QAbstractItemView:
+                NoSelection = 0
+                NoEditTriggers = 0
+                ScrollPerPixel = 1
+            class QStyledItemDelegate:
+                def __init__(self, parent=None): pass
+            class QListView(QWidget):
+                """only the rows listed in visible_rows are on screen"""
+                visible_rows = range(0, 5)
+                def __init__(self, parent=None):
+                    super().__init__()
+                    self.open_editors = {}
+                def setModel(self, model): self._model = model
+                def model(self): return self._model
+                def setItemDelegate(self, d): self._delegate = d
+                def setSelectionMode(self, *args): pass
+                def setEditTriggers(self, *args): pass
+                def setVerticalScrollMode(self, *args): pass
+                def setSpacing(self, *args): pass
+                def setFixedHeight(self, *args): pass
+                def frameWidth(self): return 1
+                def verticalScrollBar(self):
+                    class Bar:
+                        valueChanged = MockQgis.PyQt.QtCore.Signal()
+                    return Bar()
+                def openPersistentEditor(self, index):
+                    self.open_editors[index.row()] = self._model.entries[index.row()].createEditor()
+                def closePersistentEditor(self, index):
+                    self.open_editors.pop(index.row(), None)
+                def viewport(self):
+                    class Rect:
+                        def topLeft(self): return "top"
+                        def bottomLeft(self): return "bottom"
+                    class Viewport:
+                        def rect(self): return Rect()
+                    return Viewport()
+                def indexAt(self, point):
+                    rows = [r for r in self.visible_rows if r < len(self._model.entries)]
+                    if not rows:
+                        return MockQgis.PyQt.QtCore.QModelIndex()
+                    return MockQgis.PyQt.QtCore.QModelIndex(rows[0] if point == "top" else rows[-1])
             class QMessageBox:
                 Yes = 1
                 No = 2
@@ -164,11 +295,63 @@ class MockQgis:
         class QtCore:
 
             class Qt:
+                DisplayRole = 0
+                ToolTipRole = 3
+                CheckStateRole = 10
+                SizeHintRole = 13
                 UserRole = 32
                 ItemIsUserCheckable = 16
+                ItemIsEnabled = 32
                 Checked = 2
                 Unchecked = 0
                 ItemIsEditable = 2
+                ItemIsSelectable = 1
+                EditRole = 2
+                ForegroundRole = 9
+                Horizontal = 1
+            class Signal:
+                def __init__(self): self._slots = []
+                def connect(self, fn): self._slots.append(fn)
+                def disconnect(self, fn): self._slots.remove(fn)
+                def emit(self, *args):
+                    for fn in self._slots: fn(*args)
+            class QModelIndex:
+                def __init__(self, row=-1, column=0): self._row, self._column = row, column
+                def isValid(self): return self._row >= 0
+                def row(self): return self._row
+                def column(self): return self._column
+            class QAbstractListModel:
+                def __init__(self, parent=None):
+                    self.rowsInserted = MockQgis.PyQt.QtCore.Signal()
+                    self.rowsRemoved = MockQgis.PyQt.QtCore.Signal()
+                    self.modelReset = MockQgis.PyQt.QtCore.Signal()
+                    self.dataChanged = MockQgis.PyQt.QtCore.Signal()
+                def index(self, row): return MockQgis.PyQt.QtCore.QModelIndex(row)
+                def beginInsertRows(self, *args): pass
+                def endInsertRows(self): self.rowsInserted.emit()
+                def beginRemoveRows(self, *args): pass
+                def endRemoveRows(self): self.rowsRemoved.emit()
+                def beginResetModel(self): pass
+                def endResetModel(self): self.modelReset.emit()
+            class QAbstractTableModel:
+                def __init__(self, parent=None):
+                    self.dataChanged = MockQgis.PyQt.QtCore.Signal()
+                    self.rowsInserted = MockQgis.PyQt.QtCore.Signal()
+                def index(self, row, column): return MockQgis.PyQt.QtCore.QModelIndex(row, column)
+                def beginInsertRows(self, *args): pass
+                def endInsertRows(self): self.rowsInserted.emit()
+            class QSize:
+                def __init__(self, w, h): self.w, self.h = w, h
+            class QTimer:
+                @staticmethod
+                def singleShot(ms, fn): fn()
+            class QFileSystemWatcher:
+                def __init__(self, paths):
+                    self._paths = list(paths)
+                    self.fileChanged = MockQgis.PyQt.QtCore.Signal()
+                def files(self): return self._paths
+                def addPath(self, path): self._paths.append(path)
+                def deleteLater(self): pass
             class QEvent:
 
                 ContextMenu = 1
@@ -189,8 +372,14 @@ class MockQgis:
                             return self.dt.strftime(fmt)
                     return MockQDateTime(dt)
             class QVariant:
+                String = 10
                 Date = 14
                 DateTime = 16
+        class QtGui:
+            class QColor:
+                def __init__(self, *args): pass
+            class QPalette:
+                Text = 6
     class gui:
         class QgsLayerTreeEmbeddedWidgetProvider:
             def __init__(self):
@@ -228,18 +417,136 @@ class MockQRangeSlider(MockQgis.PyQt.QtWidgets.QWidget):
         return 0
     def end(self):
         return 100
+    def interactionTime(self):
+        return None
+    def blockSignals(self, b):
+        pass
+    def setRange(self, s, e):
+        self.start = lambda: s
+        self.end = lambda: e
+    def invalidateLabels(self):
+        pass
+    def update(self):
+        pass
 
-sys.modules['qrangeslider'] = type('qrangeslider', (), {'QRangeSlider': MockQRangeSlider})
+sys.modules['qrangeslider'] = type('qrangeslider', (), {'QPaintedRangeSlider': MockQRangeSlider})
 
 # modify import locally to allow importing
 with open("data_layer_range_filter_widget.py", "r") as f:
     content = f.read()
-content = content.replace("from .qrangeslider import QRangeSlider", "from qrangeslider import QRangeSlider")
+content = content.replace("from .", "from ")
 with open("data_layer_range_filter_widget_test.py", "w") as f:
     f.write(content)
 
 from data_layer_range_filter_widget_test import RangeSlider
 
+# A vector layer and its provider for the widget tests: fields, features and the
+# provider's name and uri are given, the rest a test overrides in a subclass.
+
+class FakeField:
+    def __init__(self, name, numeric=True): self._name, self._numeric = name, numeric
+    def name(self): return self._name
+    def isNumeric(self): return self._numeric
+    def type(self): return 6 if self._numeric else 10
+
+class FakeNull:
+    # like a QVariant NULL: unhashable, and isNull()
+    __hash__ = None
+    def isNull(self): return True
+
+class FakeFeature:
+    def __init__(self, fid, attrs, names=None, bbox=None): self._fid, self._attrs, self._names, self.bbox = fid, attrs, names, bbox
+    def id(self): return self._fid
+    def attributes(self): return self._attrs
+    def attribute(self, name): return self._attrs[self._names.index(name)]
+
+class FakeProvider:
+    # name() and dataSourceUri() are only there when given, the widget asks for them with hasattr
+    def __init__(self, layer, name=None, uri=None):
+        self.layer = layer
+        self.subset = ""
+        if name is not None:
+            self.name = lambda: name
+        if uri is not None:
+            self.dataSourceUri = lambda: uri
+    def subsetString(self): return self.subset
+    def setSubsetString(self, s): self.subset = s
+    def fields(self): return self.layer.fields()
+    def fieldNameIndex(self, n):
+        names = [f.name() for f in self.layer.fields()]
+        return names.index(n) if n in names else -1
+    def getFeatures(self, request): return iter(self.layer.matching(self.subset))
+
+class FakeLayer:
+    """
+    :param ranges: field name -> (min, max) the aggregates give, else those of the features
+    :param values: field name -> what uniqueValues gives, else the distinct values of the features
+    :param config: the saved configuration of the plugin
+    :param applies_subset: whether the features read honour the provider's subset string
+    :ivar scans: names of the fields aggregated
+    :ivar unique_scans: names of the fields whose distinct values were asked for
+    """
+    Provider = FakeProvider
+
+    def __init__(self, fields, features=(), layer_id="layer_1", name="layer", provider=None, uri=None,
+                 ranges=None, values=None, config=None, count=None, applies_subset=True):
+        for signal in ("willBeDeleted", "dataChanged", "attributeValueChanged", "featureAdded", "featuresDeleted",
+                       "geometryChanged", "committedAttributeValuesChanges", "afterCommitChanges", "afterRollBack"):
+            setattr(self, signal, MockQgis.PyQt.QtCore.Signal())
+        self._fields = list(fields)
+        self.features = list(features)
+        self.db = self.Provider(self, provider, uri)
+        self._id, self._name, self._count = layer_id, name, count
+        self.ranges = ranges or {}
+        self.values = values or {}
+        self._props = {"legend_data_filter_CONFIG": json.dumps(config)} if config is not None else {}
+        self.modified = False
+        self.applies_subset = applies_subset
+        self.scans = []
+        self.unique_scans = []
+    def fields(self): return self._fields
+    def dataProvider(self): return self.db
+    def id(self): return self._id
+    def name(self): return self._name
+    def featureCount(self): return self._count if self._count is not None else len(self.features)
+    def isModified(self): return self.modified
+    def getFeatures(self, request): return self.db.getFeatures(request)
+    def matching(self, subset):
+        """:return: the features a subset string lets through, of its numeric ranges, ILIKE and $id lists; other clauses pass"""
+        names = [f.name() for f in self._fields]
+        found = self.features
+        for clause in subset.split(" AND ") if subset and self.applies_subset else ():
+            bound = re.match(r'^"(\w+)" (>=|<=) (-?[\d.]+)$', clause)
+            ids = re.match(r'^\$id (NOT IN|IN) \(([\d, ]*)\)$', clause)
+            like = re.match(r'^"(\w+)" ILIKE \'%([^%\']*)%\'$', clause)
+            if bound:
+                idx, low, value = names.index(bound.group(1)), bound.group(2) == ">=", float(bound.group(3))
+                found = [f for f in found if f.attributes()[idx] is not None
+                         and (f.attributes()[idx] >= value if low else f.attributes()[idx] <= value)]
+            elif like:
+                idx, text = names.index(like.group(1)), like.group(2).lower()
+                found = [f for f in found if text in str(f.attributes()[idx]).lower()]
+            elif ids:
+                listed = set(int(fid) for fid in ids.group(2).split(", ") if fid)
+                found = [f for f in found if (f.id() in listed) == (ids.group(1) == "IN")]
+        return found
+    def setCustomProperty(self, k, v): self._props[k] = v
+    def customProperty(self, k, default): return self._props.get(k, default)
+    def removeCustomProperty(self, k): self._props.pop(k, None)
+    def uniqueValues(self, idx):
+        name = self._fields[idx].name()
+        self.unique_scans.append(name)
+        return self.values[name] if name in self.values else set(f.attributes()[idx] for f in self.features)
+    def aggregate(self, agg, name):
+        self.scans.append(name)
+        if name in self.ranges:
+            low, high = self.ranges[name]
+        else:
+            idx = [f.name() for f in self._fields].index(name)
+            found = [f.attributes()[idx] for f in self.features if f.attributes()[idx] is not None]
+            low, high = (min(found), max(found)) if found else (0, 0)
+        return [high if agg == MockQgis.core.QgsAggregateCalculator.Max else low]
+
 def test_date_range():
     print("Running Test 1: Date Range")
     fmin = datetime.datetime(2021, 1, 1).timestamp()
@@ -313,34 +620,8 @@ def test_category_filter():
 def test_auto_category():
     print("Running Test 5: Auto Category Filter limits")
     from data_layer_range_filter_widget_test import DataLayerRangeFilterWidget
-    class MockField:
-        def __init__(self, name, isnumeric):
-            self._name = name
-            self._isnumeric = isnumeric
-        def name(self): return self._name
-        def isNumeric(self): return self._isnumeric
-        def type(self): return 10
-    class MockDB:
-        def setSubsetString(self, s): pass
-        def fields(self): return [MockField("f1", False), MockField("f2", False), MockField("f3", False)]
-        def fieldNameIndex(self, n): return ["f1", "f2", "f3"].index(n) if n in ["f1", "f2", "f3"] else -1
-    class MockLayer:
-        class Signal:
-            def connect(self, fn): pass
-        def __init__(self):
-            self.willBeDeleted = self.Signal()
-            self._props = {}
-        def dataProvider(self): return MockDB()
-        def setCustomProperty(self, k, v): self._props[k] = v
-        def customProperty(self, k, default): return self._props.get(k, default)
-        def uniqueValues(self, idx):
-            if idx == 0: return ["A"] # len 1
-            if idx == 1: return ["A", "B", "C"] # len 3
-            if idx == 2: return ["A", "B", "C", "D", "E", "F", "G", "H", "I", "J", "K"] # len 11
-            return []
-        def aggregate(self, agg, name): return [0]
-
-    layer = MockLayer()
+    layer = FakeLayer([FakeField(n, False) for n in ("f1", "f2", "f3")],
+                      values={"f1": ["A"], "f2": ["A", "B", "C"], "f3": list("ABCDEFGHIJK")})
     w = DataLayerRangeFilterWidget(layer)
     # only f2 should be added as a slider initially because f1 has len 1 and f3 has len 11
     assert len(w.sliders) == 1
@@ -373,38 +654,50 @@ def test_context_menu_actions():
     assert slider.parent.dat
     slider.parent.on_coerce_slider_category(slider)
     assert slider.parent.cat
+
+    # every filter widget's context menu is the one its layer's widget shows
+    import data_layer_range_filter_widget_test as m
+    class Action:
+        def __init__(self, text): self.text, self.checked = text, False
+        def setCheckable(self, on): pass
+        def setChecked(self, on): self.checked = on
+    class Menu:
+        chosen = None
+        def __init__(self): self.actions = []
+        def addAction(self, text):
+            self.actions.append(Action(text))
+            return self.actions[-1]
+        def addSeparator(self): pass
+        def exec_(self, pos):
+            Menu.shown = self.actions
+            return next((a for a in self.actions if a.text == Menu.chosen), None)
+    class Event:
+        def type(self): return MockQgis.PyQt.QtCore.QEvent.ContextMenu
+        def globalPos(self): return (0, 0)
+    layer = FakeLayer([FakeField("v"), FakeField("c", False), FakeField("t", False)], layer_id="layer_6m", name="menus",
+                      ranges={"v": (0, 10)}, values={"c": ["a", "b"]},
+                      config={"fields": ["v", "c", "t"], "coerce": {"c": "CATEGORY", "t": "TEXT"}})
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    saved_menu, m.QMenu = m.QMenu, Menu
+    try:
+        for filter_widget in w.sliders:
+            Menu.chosen = None
+            assert filter_widget.eventFilter(filter_widget, Event())
+            assert [a.text for a in Menu.shown][-2:] == ["Follow File", "Visible Extent Only"]
+        Menu.chosen = "Visible Extent Only"
+        w.sliders[1].eventFilter(w.sliders[1], Event())
+        assert w.isExtentOnly()
+        Menu.chosen = "Hide"
+        w.sliders[2].eventFilter(w.sliders[2], Event())
+        assert w.config.coerce["t"] == "HIDDEN" and [s.field_name for s in w.sliders] == ["v", "c"]
+    finally:
+        m.QMenu = saved_menu
     print("Test 6 passed.")
 
 def test_select_fields_duplication():
     print("Running Test 7: Select Fields Duplication")
-    class MockField:
-        def __init__(self, name, isnumeric):
-            self._name = name
-            self._isnumeric = isnumeric
-        def name(self): return self._name
-        def isNumeric(self): return self._isnumeric
-        def type(self): return 10
-
-    class MockDB:
-        def setSubsetString(self, s): pass
-        def fields(self):
-            return [MockField("f1", True), MockField("f2", True), MockField("f3", True)]
-        def fieldNameIndex(self, n):
-            return ["f1", "f2", "f3"].index(n) if n in ["f1", "f2", "f3"] else -1
-
-    class MockLayer:
-        class Signal:
-            def connect(self, fn): pass
-        def __init__(self):
-            self.willBeDeleted = self.Signal()
-            self._props = {}
-        def dataProvider(self): return MockDB()
-        def setCustomProperty(self, k, v): self._props[k] = v
-        def customProperty(self, k, default): return self._props.get(k, default)
-        def uniqueValues(self, idx): return ["A", "B"]
-        def aggregate(self, agg, name): return [0]
-
-    layer = MockLayer()
+    layer = FakeLayer([FakeField(n) for n in ("f1", "f2", "f3")])
 
     # We will simulate the behavior manually to avoid complete widget mocking issues.
     # The actual bug was that OptionsDialog acceptance correctly triggered on_options_closed,
@@ -423,7 +716,7 @@ def test_select_fields_duplication():
 
     def mock_exec(self):
         # simulate accept logic setting custom properties
-        self.layer.setCustomProperty("legend_data_filter_!!SLIDERS!!", "f1###f2###f3")
+        self._parent.config.fields = ["f1", "f2", "f3"]
         # and calling parent.on_options_closed()
         if hasattr(self._parent, 'on_options_closed'):
             self._parent.on_options_closed()
@@ -453,12 +746,1321 @@ def test_select_fields_duplication():
 
     print("Test 7 passed.")
 
+def test_perf_stats():
+    print("Running Test 8: Performance counters")
+    from filter_perf import PerfStats
+    perf = PerfStats()
+    with perf.timed('aggregate'):
+        pass
+    perf.record('aggregate', 3.0)
+    perf.record('aggregate', 40.0)
+    perf.incr('filter_updates')
+    perf.incr('filter_updates')
+
+    s = perf.operations['aggregate']
+    assert s.count == 3
+    assert s.max_ms == 40.0
+    assert s.percentile_ms(50) == 4.0 # 3ms falls in the [2, 4) bucket
+    assert s.percentile_ms(100) == 40.0
+    assert perf.counters['filter_updates'] == 2
+    assert 'aggregate' in perf.report()
+
+    perf.enabled = False
+    perf.record('aggregate', 1.0)
+    assert perf.operations['aggregate'].count == 3
+    print("Test 8 passed.")
+
+def test_interaction_tracer():
+    print("Running Test 9: Interaction latency tracer")
+    import time
+    from filter_perf import InteractionTracer
+    tracer = InteractionTracer()
+    tracer.set_budget("l1", 1000)
+
+    t0 = time.perf_counter()
+    tracer.begin("l1", "layer one", "subset", t0)
+    tracer.mark("l1", "compose")
+    # a second drag event before the frame arrives is folded into the first
+    tracer.begin("l1", "layer one", "subset", time.perf_counter())
+    assert tracer.pending["l1"].start == t0
+    assert tracer.pending["l1"].coalesced == 1
+    total = tracer.finish("l1")
+    assert total is not None and total >= 0
+    assert tracer.finish("l1") is None
+
+    for ms in range(1, 101):
+        tracer.samples[("l1", "subset")].append(float(ms))
+    p50, p95, p99 = tracer.percentiles("l1", "subset")
+    assert (p50, p95, p99) == (50.0, 95.0, 99.0), (p50, p95, p99)
+    assert "layer one" in tracer.report()
+
+    # the strategy is the way the filter just composed reaches the data
+    import data_layer_range_filter_widget_test as m
+    layer = FakeLayer([FakeField("v")], [FakeFeature(i, [i]) for i in range(10)], layer_id="layer_9", name="traced")
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    slider, = w.sliders
+    slider.setState({"start": 0, "end": 50, "dirty": True})
+    w.on_slider_changed(slider)
+    # the columns are only loaded into memory to count the matches
+    assert w.filter_strategy == "subset" and m.TRACER.pending["layer_9"].strategy == "subset"
+    assert w._store is not None
+    m.TRACER.finish("layer_9")
+    slider.setState({"start": 10, "end": 50, "dirty": True})
+    w.on_slider_changed(slider)
+    assert w.filter_strategy == "memory" and m.TRACER.pending["layer_9"].strategy == "memory"
+    m.TRACER.finish("layer_9")
+    assert {("layer_9", "subset"), ("layer_9", "memory")} <= set(m.TRACER.samples)
+    print("Test 9 passed.")
+
+def test_memory_rebuild_cycles():
+    print("Running Test 10: Memory across rebuild cycles")
+    import memory_profile
+    from data_layer_range_filter_widget_test import DataLayerRangeFilterWidget
+    names = ["f%d" % i for i in range(20)]
+    layer = FakeLayer([FakeField(n) for n in names], ranges=dict((n, (0, 100)) for n in names))
+    widget, build = memory_profile.profile_build(DataLayerRangeFilterWidget, layer)
+    assert build['sliders'] == 20
+    assert build['per_slider'] > 0
+    leaks = memory_profile.leak_check(widget, cycles=5)
+    assert len(leaks['per_cycle']) == 5
+    assert not leaks["leak"], leaks["top"]
+
+    class LeakyWidget:
+        def __init__(self): self.kept = []
+        def on_options_closed(self): self.kept.append(bytearray(64 * 1024))
+    assert memory_profile.leak_check(LeakyWidget(), cycles=3)['leak']
+    print("Test 10 passed.")
+
+def test_virtual_filter_list():
+    print("Running Test 11: Virtualized filter list")
+    from data_layer_range_filter_widget_test import DataLayerRangeFilterWidget, FilterEntry, RangeSlider, CategoryFilterWidget
+    names = ["f%d" % i for i in range(40)]
+    layer = FakeLayer([FakeField(n) for n in names], ranges=dict((n, (0, 100)) for n in names))
+    w = DataLayerRangeFilterWidget(layer)
+    assert w._filter_list is not None
+    assert len(w.sliders) == 40
+    assert all(isinstance(e, FilterEntry) for e in w.sliders)
+    # only the rows on screen have real widgets
+    assert sorted(w._filter_list.open_editors) == [0, 1, 2, 3, 4]
+
+    # an editor reports a change through its entry
+    editor = w._filter_list.open_editors[2]
+    assert isinstance(editor, RangeSlider)
+    editor.slider.setRange(10, 50)
+    editor._dirty = True
+    editor.parent.on_slider_changed(editor)
+    entry = w.sliders[2]
+    assert entry.state == {"start": 10, "end": 50, "dirty": True}
+    assert layer.db.subset == '"f2" >= 10 AND "f2" <= 50'
+
+    # scrolling away drops the widget but keeps the filter, and the entry builds the same clause a widget would
+    w._filter_list.visible_rows = range(20, 25)
+    w._filter_list._sync_editors()
+    assert sorted(w._filter_list.open_editors) == [20, 21, 22, 23, 24]
+    slider = RangeSlider(None, "f2", 0, 100)
+    slider.setState(entry.state)
+    assert entry.getRangeFilter() == slider.getRangeFilter()
+
+    cat = FilterEntry(None, "c", 'category', values=["A", "B", "C"])
+    cat.setState({"unchecked": ["A"], "dirty": True})
+    cw = CategoryFilterWidget(None, "c", ["A", "B", "C"])
+    cw.setState(cat.state)
+    assert cat.getRangeFilter() == cw.getRangeFilter() == '"c" IN (\'B\', \'C\')'
+    print("Test 11 passed.")
+
+def test_deferred_build():
+    print("Running Test 12: Deferred build on project load")
+    from data_layer_range_filter_widget_test import DataLayerRangeFilterWidget
+    layer = FakeLayer([FakeField("f1"), FakeField("f2")], layer_id="layer_2", ranges={"f1": (0, 100), "f2": (0, 100)})
+    # settings as stored before the single configuration property
+    layer.setCustomProperty("legend_data_filter_!!SLIDERS!!", "f1###f2")
+    layer.setCustomProperty("legend_data_filter_SCHEMA_VERSION", "2")
+    layer.setCustomProperty("legend_data_filter_UI_MODE", "Spacious")
+    layer.setCustomProperty("legend_data_filter_COERCE_f2", "NUMBER")
+
+    w = DataLayerRangeFilterWidget(layer)
+    # nothing scanned yet, and no filter was kept before
+    assert layer.scans == [] and len(w.sliders) == 0
+    assert layer.db.subset == ""
+    # migrated into one property
+    assert list(layer._props) == ["legend_data_filter_CONFIG"]
+    assert w.config.fields == ["f1", "f2"] and w.config.coerce == {"f2": "NUMBER"} and w.config.is_spacious()
+
+    w.showEvent(None)
+    assert len(w.sliders) == 2 and len(layer.scans) == 4
+    assert layer.db.subset == ""
+    # showing it again does not rebuild
+    w.showEvent(None)
+    assert len(w.sliders) == 2 and len(layer.scans) == 4
+
+    # positions and statistics come back on the next load without a scan or an unfiltered reload
+    w.sliders[0].setState({"start": 10, "end": 50, "dirty": True})
+    w.on_slider_changed(w.sliders[0])
+    saved_filter = layer.db.subset
+    assert saved_filter == '"f1" >= 10 AND "f1" <= 50'
+    subsets = []
+    original_set = layer.db.setSubsetString
+    layer.db.setSubsetString = lambda s: (subsets.append(s), original_set(s))
+    w2 = DataLayerRangeFilterWidget(layer)
+    w2.showEvent(None)
+    assert len(layer.scans) == 4 and subsets == []
+    assert len(w2.sliders) == 2
+    assert w2.sliders[0].getState() == {"start": 10, "end": 50, "dirty": True}
+    assert w2.sliders[0].getRangeFilter() == saved_filter
+
+    # a drag is saved where it comes to rest, or when the project is written
+    import data_layer_range_filter_widget_test as m
+    due = []
+    saved_timer = m.QtCore.QTimer
+    m.QtCore.QTimer = type('QTimer', (), {'singleShot': staticmethod(lambda ms, fn: due.append(fn))})
+    try:
+        for end in (60, 40):
+            w2.sliders[0].setState({"start": 10, "end": end, "dirty": True})
+            w2.on_slider_changed(w2.sliders[0])
+    finally:
+        m.QtCore.QTimer = saved_timer
+    assert json.loads(layer._props["legend_data_filter_CONFIG"])["states"]["f1"]["end"] == 50
+    m.QgsProject.instance().writeProject.emit(None)
+    assert json.loads(layer._props["legend_data_filter_CONFIG"])["states"]["f1"]["end"] == 40
+
+    # a changed source invalidates the snapshot
+    layer._fields.append(FakeField("f3"))
+    w3 = DataLayerRangeFilterWidget(layer)
+    w3.showEvent(None)
+    assert len(layer.scans) == 8 and layer.db.subset == ""
+    assert w3.sliders[0].getState()["dirty"] is False
+
+    # nor is the subset string some providers carry in the uri: the filter changes it, not the data
+    from data_layer_range_filter_widget_test import source_fingerprint, source_uri
+    for uri, source in [('/data/a.gpkg|layername=a|subset="f1" >= 10', "/data/a.gpkg|layername=a"),
+                        ("file:///a.csv?type=csv&subset=%22f1%22%20%3E%3D%2010&xField=x", "file:///a.csv?type=csv&xField=x"),
+                        ("file:///a.csv?type=csv&subset=%22f1%22%20%3E%3D%2010", "file:///a.csv?type=csv"),
+                        ('dbname=\'d\' table="t" (geom) sql="f1" >= 10', 'dbname=\'d\' table="t" (geom)')]:
+        assert source_uri(FakeLayer([], uri=uri).db) == source
+        assert source_fingerprint(FakeLayer([], uri=uri)) == source_fingerprint(FakeLayer([], uri=source))
+    print("Test 12 passed.")
+
+def test_reconcile_rebuild():
+    print("Running Test 13: Rebuild only what changed")
+    from data_layer_range_filter_widget_test import DataLayerRangeFilterWidget, CategoryFilterWidget
+    names = ["f1", "f2", "f3"]
+    layer = FakeLayer([FakeField(n) for n in names], layer_id="layer_3", ranges=dict((n, (0, 100)) for n in names),
+                      values=dict((n, ["A", "B"]) for n in names))
+    w = DataLayerRangeFilterWidget(layer)
+    assert [s.field_name for s in w.sliders] == names
+    f1 = w.sliders[0]
+    f1.setState({"start": 10, "end": 50, "dirty": True})
+    w.on_slider_changed(f1)
+    del layer.scans[:], layer.unique_scans[:]
+
+    # changing one field's type rescans just that field
+    w.on_coerce_slider_category(w.sliders[1])
+    assert set(layer.scans + layer.unique_scans) == {"f2"}
+    assert [s.field_name for s in w.sliders] == names
+    assert w.sliders[0] is f1 and f1.getState()["dirty"] is True
+    assert isinstance(w.sliders[1], CategoryFilterWidget)
+    assert layer.db.subset == '"f1" >= 10 AND "f1" <= 50'
+
+    # hiding one drops it without scanning anything
+    del layer.scans[:], layer.unique_scans[:]
+    w.on_coerce_slider_hide(w.sliders[2])
+    assert layer.scans == [] and layer.unique_scans == []
+    assert [s.field_name for s in w.sliders] == ["f1", "f2"]
+    assert w.config.fields == ["f1", "f2"]
+    print("Test 13 passed.")
+
+def test_options_field_model():
+    print("Running Test 14: Options dialog field model")
+    import data_layer_range_filter_widget_test as m
+    Qt = MockQgis.PyQt.QtCore.Qt
+    QModelIndex = MockQgis.PyQt.QtCore.QModelIndex
+
+    layer = FakeLayer([FakeField("id"), FakeField("kind", False), FakeField("code", False)],
+                      [FakeFeature(i, [i, "k%d" % (i % 3), "c%d" % i]) for i in range(40)], layer_id="layer_4")
+    source = m.QgsVectorLayerFeatureSource(layer)
+    assert m.count_distinct(source, 1) == 3
+    assert m.count_distinct(source, 2, limit=5) == 6
+
+    model = m.FieldTypeModel(["id", "kind", "code"], ["Number", "Hidden/Ignore", "Hidden/Ignore"], {"kind": 3})
+    requested = []
+    model.on_uncounted_categories = requested.extend
+    assert model.setData(QModelIndex(1, model.TYPE), "Category", Qt.EditRole)
+    # known size comes from the cache, no count needed
+    assert requested == [] and model.data(QModelIndex(1, model.DISTINCT)) == "3"
+
+    # bulk assignment asks for the missing counts once, and shows them pending
+    model.setTypes([0, 2], "Category")
+    assert model.types == ["Category", "Category", "Category"]
+    assert requested == ["id", "code"]
+    assert model.data(QModelIndex(2, model.DISTINCT)) == "..."
+
+    task = m.CategorySizeTask(layer, requested, done=lambda task: model.setCounts(task.counts))
+    m.QgsApplication.taskManager().addTask(task)
+    assert model.data(QModelIndex(2, model.DISTINCT)) == "40"
+    assert model.data(QModelIndex(2, model.DISTINCT), Qt.ForegroundRole) is not None
+    assert model.data(QModelIndex(1, model.DISTINCT), Qt.ForegroundRole) is None
+    assert not model.setData(QModelIndex(0, model.NAME), "Category", Qt.EditRole)
+    print("Test 14 passed.")
+
+def test_incremental_edit_stats():
+    print("Running Test 15: Statistics follow layer edits")
+    from data_layer_range_filter_widget_test import DataLayerRangeFilterWidget, FieldStats
+
+    stats = FieldStats('range', fmin=0, fmax=10)
+    assert stats.add(12) and stats.fmax == 12 and not stats.add(5)
+    assert not stats.remove(5) and not stats.stale
+    stats.remove(0)
+    assert stats.stale
+    counted = FieldStats('range', fmin=0, fmax=10, counts={0: 1, 4: 2, 10: 1})
+    assert counted.remove(10) and (counted.fmin, counted.fmax) == (0, 4) and not counted.stale
+    assert not counted.remove(4) and counted.fmax == 4
+
+    def feature(fid, row):
+        return FakeFeature(fid, [row["f1"], row["c"]], ["f1", "c"])
+    class RowsProvider(FakeProvider):
+        rows = {1: {"f1": 50, "c": "A"}, 2: {"f1": 0, "c": "B"}, 3: {"f1": 100, "c": "A"}}
+        def getFeatures(self, request):
+            return [feature(fid, self.rows[fid]) for fid in request.fids if fid in self.rows]
+    class EditedLayer(FakeLayer):
+        Provider = RowsProvider
+        def __init__(self):
+            super().__init__([FakeField("f1"), FakeField("c", False)], layer_id="layer_5")
+            # edit buffer: added features, changed values, deleted fids
+            self.buffer = {}
+            self.changes = {}
+            self.deleted = set()
+        def uniqueValues(self, idx): return sorted(set(r["c"] for r in self.db.rows.values()))
+        def getFeature(self, fid): return feature(fid, self.buffer[fid])
+        def aggregate(self, agg, name):
+            # like QgsVectorLayer, statistics of an edited layer include its edit buffer
+            self.scans.append(name)
+            rows = dict(self.db.rows)
+            rows.update(self.buffer)
+            values = [self.changes.get((fid, name), r[name]) for fid, r in rows.items() if fid not in self.deleted]
+            return [max(values) if agg == 1 else min(values)]
+
+    layer = EditedLayer()
+    w = DataLayerRangeFilterWidget(layer)
+    f1, c = w.sliders
+    assert (f1.fmin, f1.fmax) == (0, 100) and len(layer.scans) == 2
+    f1.setState({"start": 0, "end": 50, "dirty": True})
+    w.on_slider_changed(f1)
+    assert layer.db.subset == '"f1" >= 0 AND "f1" <= 50'
+
+    # widening edits need no scan, and the moved handle stays on its value
+    layer.changes[(1, "f1")] = 200
+    layer.attributeValueChanged.emit(1, 0, 200)
+    assert (f1.fmin, f1.fmax) == (0, 200) and len(layer.scans) == 2
+    assert f1.getState()["end"] == 25
+    assert layer.db.subset == '"f1" >= 0 AND "f1" <= 50'
+    layer.buffer[-1] = {"f1": 20, "c": "C"}
+    layer.featureAdded.emit(-1)
+    assert [c.list_widget.item(i).data(0) for i in range(c.list_widget.count())] == ["A", "B", "C"]
+    assert len(layer.scans) == 2
+
+    # deleting the minimum leaves it unknown: that field, and only that one, is scanned again
+    layer.deleted.add(2)
+    layer.featuresDeleted.emit([2])
+    assert layer.scans[2:] == ["f1", "f1"] and (f1.fmin, f1.fmax) == (20, 200)
+
+    # committing forgets the edit history and refreshes the saved snapshot
+    layer.afterCommitChanges.emit()
+    assert w._edit_values == {} and w.config.stats["fields"]["f1"]["stats"]["fmin"] == 20
+    print("Test 15 passed.")
+
+def test_follow_growing_file():
+    print("Running Test 16: Follow a growing delimited text file")
+    import tempfile
+    from data_layer_range_filter_widget_test import DataLayerRangeFilterWidget
+    path = os.path.join(tempfile.mkdtemp(), "log.csv")
+    with open(path, "w") as f:
+        f.write("f1,c\n0,A\n100,B\n")
+
+    class FollowedLayer(FakeLayer):
+        reloads = 0
+        def reload(self): self.reloads += 1
+        def triggerRepaint(self): pass
+
+    # the delimitedtext provider numbers features by the line they start on
+    layer = FollowedLayer([FakeField("f1"), FakeField("c", False)], [FakeFeature(2, [0, "A"]), FakeFeature(3, [100, "B"])],
+                          layer_id="layer_6", name="log", provider="delimitedtext",
+                          uri="file://" + path + "?type=csv&delimiter=,&xField=f1&yField=f1",
+                          ranges={"f1": (0, 100)}, values={"c": ["A", "B"]})
+    w = DataLayerRangeFilterWidget(layer)
+    f1, c = w.sliders
+    w.setFollowing(True)
+    assert w.isFollowing() and w.config.follow
+
+    # appended rows extend the statistics without a scan, the layer reloads to show them
+    with open(path, "a") as f:
+        f.write("150,C\n120,A\n130,")
+    w._read_followed_file()
+    assert (f1.fmin, f1.fmax) == (0, 150) and len(layer.scans) == 2
+    assert [c.list_widget.item(i).data(0) for i in range(c.list_widget.count())] == ["A", "B", "C"]
+    assert layer.reloads == 1
+    layer.features += [FakeFeature(4, [150, "C"]), FakeFeature(5, [120, "A"])]
+
+    # rows the active filter rejects don't cost a reload
+    c.setState({"unchecked": ["C"], "dirty": True})
+    w.on_slider_changed(c)
+    store = w._store
+    assert len(store) == 4
+    with open(path, "a") as f:
+        f.write("A\n")  # completes "130,A", not yet read
+        f.write("\n10,C\n")
+    w._read_followed_file()
+    assert layer.reloads == 2 # 130,A passes
+    with open(path, "a") as f:
+        f.write("11,C\n")
+    w._read_followed_file()
+    assert layer.reloads == 2
+    # the rows in memory are appended to, not loaded again
+    assert w._store is store and len(store) == 7
+    assert list(store.select({}, {"c": ["C"]})) == [4, 8, 9] and store.column_range("f1") == (0, 150)
+    assert w.toolTip() == "4 of 7 features match"
+
+    w.setFollowing(False)
+    assert not w.isFollowing() and not w.config.follow
+    print("Test 16 passed.")
+
+def test_attribute_loader():
+    print("Running Test 17: Attribute-only chunked loader")
+    from feature_loader import AttributeLoader, columns_for
+
+    class MockSource:
+        def __init__(self, n):
+            self.features = [FakeFeature(100 + i, [None if i % 4 == 0 else i * 0.5, "k%d" % (i % 3), "wide"]) for i in range(n)]
+        def getFeatures(self, request):
+            self.request = request
+            return iter(self.features)
+
+    fields = [FakeField("value"), FakeField("kind", False), FakeField("unused", False)]
+    columns = columns_for(fields, ["kind", "value", "missing"])
+    assert columns == [("kind", 1, False), ("value", 0, True)]
+
+    source = MockSource(10)
+    loader = AttributeLoader(source, columns, chunk_size=4)
+    progress = []
+    sizes, values, kinds, fids = [], [], [], []
+    for chunk in loader.chunks(total=10, progress=progress.append):
+        sizes.append(chunk.size)
+        values.extend(chunk.values("value"))
+        kinds.extend(chunk.values("kind"))
+        fids.extend(chunk.fids[:chunk.size])
+    # only the wanted attributes, no geometry
+    assert source.request.flags == source.request.NoGeometry and source.request.attributes == [1, 0]
+    assert sizes == [4, 4, 2] and progress == [40.0, 80.0, 100.0]
+    assert values == [None if i % 4 == 0 else i * 0.5 for i in range(10)]
+    assert kinds == ["k%d" % (i % 3) for i in range(10)] and fids == list(range(100, 110))
+    # the buffers are allocated once per scan and refilled
+    chunks = set(id(chunk) for chunk in loader.chunks())
+    assert len(chunks) == 1
+
+    polls = []
+    def is_canceled():
+        polls.append(1)
+        return len(polls) == 2
+    assert sum(chunk.size for chunk in loader.chunks(is_canceled=is_canceled)) == 8 and loader.canceled
+    print("Test 17 passed.")
+
+def test_sqlite_fast_path():
+    print("Running Test 18: GeoPackage columns read straight from the file")
+    import sqlite3
+    import tempfile
+    import data_layer_range_filter_widget_test as m
+    from feature_loader import AttributeLoader, SqliteLoader, loader_for, sqlite_source
+
+    path = os.path.join(tempfile.mkdtemp(), "places.gpkg")
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE "places" (fid INTEGER PRIMARY KEY, pop REAL, area INTEGER, kind TEXT, geom BLOB)')
+    connection.executemany('INSERT INTO "places" VALUES (?, ?, ?, ?, ?)',
+                           [(i, None if i == 3 else i * 1.5, 100 - i, "k%d" % (i % 2), b"x" * 100) for i in range(1, 11)])
+    connection.commit()
+    connection.close()
+
+    layer = FakeLayer([FakeField(n, n != "kind") for n in ("fid", "pop", "area", "kind")], layer_id="layer_7", name="places",
+                      provider="ogr", uri=path + "|layername=places", values={"kind": ["k0", "k1"]}, count=10)
+    assert sqlite_source(layer) == {"path": path, "table": "places", "fid": "fid"}
+
+    loader = loader_for(layer, ["pop", "kind"], fids=[2, 3, 9])
+    assert isinstance(loader, SqliteLoader)
+    rows = []
+    for chunk in loader.chunks():
+        rows.extend(zip(chunk.fids[:chunk.size], chunk.values("pop"), chunk.values("kind")))
+    assert rows == [(2, 3.0, "k0"), (3, None, "k1"), (9, 13.5, "k1")]
+    assert loader.min_max(["pop", "area"]) == {"pop": (1.5, 15.0), "area": (90, 99)}
+
+    # the numeric fields' ranges come from one query instead of an aggregate per field
+    w = m.DataLayerRangeFilterWidget(layer)
+    ranges = dict((s.field_name, (s.fmin, s.fmax)) for s in w.sliders if hasattr(s, "fmin"))
+    assert ranges == {"fid": (1, 10), "pop": (1.5, 15.0), "area": (90, 99)}
+    assert layer.scans == []
+
+    task = m.CategorySizeTask(layer, ["kind", "area"])
+    assert isinstance(task.loader, SqliteLoader)
+    m.QgsApplication.taskManager().addTask(task)
+    assert task.counts == {"kind": 2, "area": 10}
+
+    # unsaved edits are only in the layer's edit buffer
+    layer.modified = True
+    assert isinstance(loader_for(layer, ["pop"]), AttributeLoader) and not isinstance(loader_for(layer, ["pop"]), SqliteLoader)
+    assert isinstance(loader_for(layer, ["pop"], committed=True), SqliteLoader)
+    print("Test 18 passed.")
+
+def _thrift_compact(fields):
+    """encodes [(field id, type, value)] as a thrift compact struct, for writing Parquet footers"""
+    import struct as struct_module
+    def varint(n):
+        out = b""
+        while True:
+            if n < 0x80:
+                return out + bytes([n])
+            out += bytes([(n & 0x7f) | 0x80])
+            n >>= 7
+    def zigzag(n):
+        return varint((n << 1) ^ (n >> 63))
+    def value(kind, v):
+        if kind in (5, 6):
+            return zigzag(v)
+        if kind == 7:
+            return struct_module.pack("<d", v)
+        if kind == 8:
+            return varint(len(v)) + v
+        if kind == 9:
+            element, items = v
+            header = bytes([(len(items) << 4) | element]) if len(items) < 15 else bytes([0xf0 | element]) + varint(len(items))
+            return header + b"".join(value(element, item) for item in items)
+        if kind == 12:
+            return _thrift_compact(v)
+        raise ValueError(kind)
+    out = b""
+    last = 0
+    for field_id, kind, v in fields:
+        out += bytes([((field_id - last) << 4) | kind]) + value(kind, v)
+        last = field_id
+    return out + b"\x00"
+
+def test_parquet_footer_stats():
+    print("Running Test 19: Parquet footer statistics")
+    import struct
+    import tempfile
+    import data_layer_range_filter_widget_test as m
+    from parquet_stats import ParquetFooter, parquet_path
+    I32, I64, BINARY, LIST, STRUCT = 5, 6, 8, 9, 12
+
+    def column(name, physical, stats, converted=None):
+        meta = [(1, I32, physical), (3, LIST, (BINARY, [name.encode()])), (12, STRUCT, stats)]
+        return [(2, I64, 0), (3, STRUCT, meta)]
+    def stats(low, high, nulls=0):
+        found = [(3, I64, nulls)]
+        if high is not None:
+            found += [(5, BINARY, high), (6, BINARY, low)]
+        return found
+    d, q = (lambda v: struct.pack("<d", v)), (lambda v: struct.pack("<q", v))
+    schema = [[(4, BINARY, b"schema"), (5, I32, 3)],
+              [(1, I32, 5), (4, BINARY, b"pop")],
+              [(1, I32, 2), (4, BINARY, b"n")],
+              [(1, I32, 6), (4, BINARY, b"name"), (6, I32, 0)]]
+    groups = [
+        [(1, LIST, (STRUCT, [column("pop", 5, stats(d(1), d(10))), column("n", 2, stats(q(0), q(5))),
+                             column("name", 6, stats(b"a", b"m"))])), (2, I64, 100), (3, I64, 10)],
+        [(1, LIST, (STRUCT, [column("pop", 5, stats(d(20), d(30))), column("n", 2, stats(None, None, 5)),
+                             column("name", 6, stats(b"b", b"z"))])), (2, I64, 100), (3, I64, 5)],
+    ]
+    footer = _thrift_compact([(1, I32, 2), (2, LIST, (STRUCT, schema)), (3, I64, 15), (4, LIST, (STRUCT, groups))])
+    path = os.path.join(tempfile.mkdtemp(), "places.parquet")
+    with open(path, "wb") as f:
+        f.write(b"PAR1" + b"\x00" * 16 + footer + struct.pack("<i", len(footer)) + b"PAR1")
+
+    parquet = ParquetFooter.read(path)
+    assert parquet.num_rows == 15 and [n for n, _ in parquet.row_groups] == [10, 5]
+    assert parquet.column_range("pop") == (1.0, 30.0)
+    assert parquet.column_range("n") == (0, 5) # the second group holds only NULLs
+    assert parquet.column_range("name") == ("a", "z")
+
+    layer = FakeLayer([FakeField("pop"), FakeField("n")], layer_id="layer_8", name="places", provider="ogr", uri=path)
+    assert parquet_path(layer) == path
+    # slider ranges straight from the footer
+    w = m.DataLayerRangeFilterWidget(layer)
+    pop, n = w.sliders
+    assert (pop.fmin, pop.fmax) == (1.0, 30.0) and (n.fmin, n.fmax) == (0, 5) and layer.scans == []
+    print("Test 19 passed.")
+
+def test_zone_map_counts():
+    print("Running Test 20: Zone maps over in-memory columns")
+    import data_layer_range_filter_widget_test as m
+    from feature_loader import AttributeLoader
+    from zone_map import ColumnStore, ZoneMap, SKIP, ACCEPT, PARTIAL
+
+    class MockSource:
+        # sorted on "a", so most blocks lie wholly inside or outside a range
+        features = [FakeFeature(i, [float(i), None if i % 10 == 0 else float(i % 7)]) for i in range(100)]
+        def getFeatures(self, request): return iter(self.features)
+
+    loader = AttributeLoader(MockSource(), [("a", 0, True), ("b", 1, True)], chunk_size=16)
+    store = ColumnStore.load(loader)
+    assert len(store) == 100 and store.zone_map.block_rows == [16] * 6 + [4]
+    assert store.zone_map.zones["a"][1] == (16.0, 31.0, 0) and store.zone_map.zones["b"][0] == (0.0, 6.0, 2)
+
+    count, (skipped, accepted, scanned) = store.count({"a": (20, 70)})
+    assert count == 51 and (skipped, accepted, scanned) == (3, 2, 2)
+    assert list(store.select({"a": (20, 70)})) == list(range(20, 71))
+    # NULLs never match, so blocks holding them are checked row by row
+    expected = [i for i in range(100) if 20 <= i <= 70 and i % 10 != 0 and 2 <= i % 7 <= 3]
+    assert list(store.select({"a": (20, 70), "b": (2, 3)})) == expected
+    assert store.count({"a": (20, 70), "b": (2, 3)})[0] == len(expected)
+    assert store.count({"a": (200, 300)}) == (0, (7, 0, 0))
+
+    # appended rows fill up the last block first
+    import zone_map
+    saved, zone_map.BLOCK_SIZE = zone_map.BLOCK_SIZE, 16
+    try:
+        store.append(list(range(100, 120)), {"a": [float(i) for i in range(100, 120)], "b": [None, "x"] + [1.0] * 18})
+    finally:
+        zone_map.BLOCK_SIZE = saved
+    assert len(store) == 120 and store.zone_map.block_rows == [16] * 7 + [8]
+    assert store.zone_map.zones["a"][6] == (96.0, 111.0, 0) and store.zone_map.zones["b"][6] == (0.0, 6.0, 2)
+    assert list(store.select({"a": (98, 103), "b": (0, 10)})) == [98, 99, 102, 103]
+
+    zones = ZoneMap.from_row_groups([(10, {"x": (0, 9, 0)}), (5, {"x": (None, None, 5)})])
+    assert [zones.classify(b, {"x": (0, 20)}) for b in (0, 1)] == [ACCEPT, SKIP]
+    assert zones.classify(0, {"x": (5, 20)}) == PARTIAL
+
+    # the widget counts matches in memory once a filter is moved
+    layer = FakeLayer([FakeField("a"), FakeField("b")], MockSource.features, layer_id="layer_9")
+    w = m.DataLayerRangeFilterWidget(layer)
+    a, b = w.sliders
+    assert w._store is None
+    a.setState({"start": 20, "end": 70, "dirty": True})
+    w.on_slider_changed(a)
+    assert w.toolTip() == "51 of 100 features match"
+    assert layer.db.subset == '"a" >= 19 AND "a" <= 69'
+    layer.features = layer.features[:50]
+    w._drop_store() # as on edits
+    w.on_slider_changed(a)
+    assert w.toolTip() == "31 of 50 features match"
+    # the store was loaded under that filter, and still holds every feature
+    assert len(w._store) == 50
+
+    # a drag is counted where it has got to, not at every position it passed
+    due = []
+    saved_timer = m.QtCore.QTimer
+    m.QtCore.QTimer = type('QTimer', (), {'singleShot': staticmethod(lambda ms, fn: due.append(fn))})
+    try:
+        for end in (60, 50, 40):
+            a.setState({"start": 20, "end": end, "dirty": True})
+            w.on_slider_changed(a)
+    finally:
+        m.QtCore.QTimer = saved_timer
+    # one count and one save of the positions
+    assert len(due) == 2 and w.toolTip() == "31 of 50 features match"
+    for fn in due:
+        fn()
+    assert w.toolTip() == "21 of 50 features match"
+    print("Test 20 passed.")
+
+def test_duckdb_engine():
+    print("Running Test 21: Embedded DuckDB engine")
+    import tempfile
+    import data_layer_range_filter_widget_test as m
+    from duckdb_engine import DuckDbEngine, available, relation_sql, stats_sql
+
+    assert relation_sql({"kind": "parquet", "path": "/data/it's.parquet"}) == (
+        "SELECT file_row_number AS __range_filter_fid, * EXCLUDE (file_row_number) "
+        "FROM read_parquet('/data/it''s.parquet', file_row_number=true)")
+    assert relation_sql({"kind": "csv", "path": "/data/a.csv", "delimiter": ";", "use_header": True, "skip_lines": 2}) == (
+        "SELECT row_number() OVER () + 3 AS __range_filter_fid, * "
+        "FROM read_csv('/data/a.csv', delim=';', quote='\"', header=true, skip=2)")
+    assert stats_sql(["a"], ["b"]) == 'SELECT min("a"), max("a"), list(DISTINCT "b") FROM layer'
+    if not available():
+        print("Test 21 skipped: DuckDB is not installed.")
+        return
+
+    path = os.path.join(tempfile.mkdtemp(), "readings.csv")
+    with open(path, "w") as f:
+        f.write("v,kind\n" + "".join("%d,k%d\n" % (i, i % 3) for i in range(100)))
+    engine = DuckDbEngine({"kind": "csv", "path": path, "delimiter": ",", "use_header": True})
+    assert engine.count() == (100, 100)
+    assert engine.count('"v" >= 10 AND "v" <= 19') == (10, 100)
+    # ids are line numbers, as the delimitedtext provider gives them
+    assert engine.matching_ids('"v" <= 2') == [2, 3, 4]
+    ranges, values = engine.stats(["v"], ["kind"])
+    assert ranges == {"v": (0, 99)} and sorted(values["kind"]) == ["k0", "k1", "k2"]
+
+    layer = FakeLayer([FakeField("v"), FakeField("kind", False)], [FakeFeature(i + 2, [i, "k%d" % (i % 3)]) for i in range(100)],
+                      layer_id="layer_10", name="readings", provider="delimitedtext", uri="file://" + path + "?type=csv&delimiter=,",
+                      values={"kind": ["k0", "k1", "k2"]}, config={"fields": ["v", "kind"], "engine": "duckdb"})
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    v, kind = w.sliders
+    assert (v.fmin, v.fmax) == (0, 99) and layer.scans == []
+    # category filters are counted too, the whole subset string runs in DuckDB
+    kind.setState({"unchecked": ["k0"], "dirty": True})
+    w.on_slider_changed(kind)
+    assert w.toolTip() == "66 of 100 features match"
+    v.setState({"start": 0, "end": 10, "dirty": True})
+    w.on_slider_changed(v)
+    assert layer.db.subset == '"v" >= 0 AND "v" <= 9 AND "kind" IN (\'k1\', \'k2\')'
+    assert w.matchingFeatureIds() == [3, 4, 6, 7, 9, 10]
+    # counted in a task, once per filter
+    engine, calls = w._duckdb[1], []
+    count = engine.count
+    engine.count = lambda subset: (calls.append(subset), count(subset))[1]
+    w.on_slider_changed(v)
+    assert w.toolTip() == "6 of 100 features match" and calls == []
+    # the engine goes on with the same file when only the subset string in its uri changed
+    layer.db.dataSourceUri = lambda: "file://" + path + "?type=csv&delimiter=,&subset=%22v%22%20%3C%3D%209"
+    assert w._duckdb_engine() is engine
+
+    # a filter DuckDB can't run hands counting back to the provider
+    def failing_count(subset):
+        raise m.EngineError("no such function")
+    engine.count = failing_count
+    v.setState({"start": 0, "end": 20, "dirty": True})
+    w.on_slider_changed(v)
+    assert w._duckdb[1] is None and w._duckdb_engine() is None
+    # and to the in-memory columns, category filters included
+    ids = [i + 2 for i in range(20) if i % 3]
+    assert w.toolTip() == "13 of 100 features match"
+    assert w.matchingFeatureIds() == ids
+    print("Test 21 passed.")
+
+def test_parallel_field_stats():
+    print("Running Test 22: Field statistics gathered on worker threads")
+    import sqlite3
+    import tempfile
+    import data_layer_range_filter_widget_test as m
+    from feature_loader import Column, SqliteLoader
+    from parallel_stats import FieldSummary
+
+    # partial results merge into what a single pass finds
+    column = Column("v", True, 4)
+    for i, value in enumerate([3.0, None, 7.5, 1.0]):
+        column.values[i], column.nulls[i] = (0.0, 1) if value is None else (value, 0)
+    first, second = FieldSummary(True, 10), FieldSummary(True, 10)
+    first.add_column(column, 2)
+    second.add_column(column, 4)
+    first.merge(second)
+    assert (first.fmin, first.fmax, first.nulls) == (1.0, 7.5, 2) and first.range() == (1, 7.5)
+    words = Column("w", False, 3)
+    words.values[:] = ["a", "b", "a"]
+    few, many = FieldSummary(False, 2), FieldSummary(False, 2)
+    few.add_column(words, 3)
+    many.values = None
+    few.merge(FieldSummary(False, 2))
+    assert few.values == {"a", "b"}
+    few.merge(many)
+    assert few.values is None
+
+    # a GeoPackage table is split by fid into ranges that cover every row once
+    path = os.path.join(tempfile.mkdtemp(), "split.gpkg")
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE "t" (fid INTEGER PRIMARY KEY, v REAL)')
+    connection.executemany('INSERT INTO "t" VALUES (?, ?)', [(i, i * 2.0) for i in range(5, 105)])
+    connection.commit()
+    connection.close()
+    loader = SqliteLoader(path, "t", "fid", [("v", 1, True)], chunk_size=16)
+    parts = loader.split(3)
+    assert len(parts) == 3 and parts[0].fid_range == (5, 38)
+    fids = [fid for part in parts for chunk in part.chunks() for fid in chunk.fids[:chunk.size]]
+    assert fids == list(range(5, 105))
+    assert parts[0].split(2) == [parts[0]]
+
+    names = ("a", "b", "c", "kind", "label")
+    rows = [(i, None if i % 7 == 0 else i * 0.25, -i, "k%d" % (i % 3), "label %d" % i) for i in range(1, 2001)]
+    path = os.path.join(tempfile.mkdtemp(), "wide.gpkg")
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE "wide" (fid INTEGER PRIMARY KEY, a INTEGER, b REAL, c INTEGER, kind TEXT, label TEXT)')
+    connection.executemany('INSERT INTO "wide" VALUES (?, ?, ?, ?, ?, ?)', [(fid,) + row for fid, row in enumerate(rows, 1)])
+    connection.commit()
+    connection.close()
+    layer = FakeLayer([FakeField(n, n not in ("kind", "label")) for n in names], layer_id="layer_22", name="wide",
+                      provider="ogr", uri=path + "|layername=wide", count=len(rows))
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    ranges = dict((s.field_name, (s.fmin, s.fmax)) for s in w.sliders if hasattr(s, "fmin"))
+    assert ranges == {"a": (1, 2000), "b": (0.25, 500), "c": (-2000, -1)}
+    categories = [s for s in w.sliders if not hasattr(s, "fmin")]
+    # "label" has too many values to be a category, and that was known without asking the layer
+    assert [s.field_name for s in categories] == ["kind"]
+    assert sorted(w._field_stats["kind"].values) == ["k0", "k1", "k2"]
+    assert layer.scans == [] and layer.unique_scans == []
+    assert w._prefetched_ranges == {} and w._prefetched_values == {}
+
+    # other providers aggregate each field themselves rather than be read once per worker
+    layer = FakeLayer([FakeField(n, n not in ("kind", "label")) for n in names],
+                      [FakeFeature(i, list(row)) for i, row in enumerate(rows, 1)],
+                      layer_id="layer_22m", name="wide", provider="memory", uri="memory?")
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    ranges = dict((s.field_name, (s.fmin, s.fmax)) for s in w.sliders if hasattr(s, "fmin"))
+    assert ranges == {"a": (1, 2000), "b": (0.25, 500), "c": (-2000, -1)}
+    assert sorted(set(layer.scans)) == ["a", "b", "c"]
+    print("Test 22 passed.")
+
+def test_dictionary_encoded_categories():
+    print("Running Test 23: Dictionary encoded category columns")
+    import data_layer_range_filter_widget_test as m
+    from feature_loader import AttributeLoader
+    from zone_map import ColumnStore, Dictionary
+
+    dictionary = Dictionary()
+    codes = dictionary.encode(["b", "a", None, "b", FakeNull()])
+    assert codes.typecode == "B" and list(codes) == [0, 1, 2, 0, 2]
+    assert dictionary.values == ["b", "a", None]
+    mask = dictionary.mask(["a", FakeNull(), "missing"])
+    assert len(mask) == 256 and mask[:3] == b"\x00\x01\x01"
+    # past 256 values the codes no longer fit a byte
+    wide = dictionary.encode(["v%d" % i for i in range(300)])
+    assert wide.typecode == "i" and wide[-1] == 302
+
+    class MockSource:
+        features = [FakeFeature(i, [float(i), None if i % 10 == 0 else "k%d" % (i % 4)]) for i in range(100)]
+        def getFeatures(self, request): return iter(self.features)
+
+    store = ColumnStore.load(AttributeLoader(MockSource(), [("a", 0, True), ("kind", 1, False)], chunk_size=16))
+    dictionary, blocks = store.categories["kind"]
+    assert len(dictionary) == 5 and len(blocks) == 7 and sum(len(b) for b in blocks) == 100
+    assert store.can_answer({"a": (0, 1)}, {"kind": ["k1"]}) and not store.can_answer({}, {"other": ["x"]})
+    expected = [i for i in range(100) if i % 10 and i % 4 in (1, 3)]
+    assert store.count({}, {"kind": ["k1", "k3"]})[0] == len(expected)
+    assert list(store.select({}, {"kind": ["k1", "k3"]})) == expected
+    expected = [i for i in expected if 20 <= i <= 70]
+    assert list(store.select({"a": (20, 70)}, {"kind": ["k1", "k3"]})) == expected
+    assert store.count({"a": (20, 70)}, {"kind": ["k1", "k3"]})[0] == len(expected)
+    assert store.count({}, {"kind": [None]})[0] == 10
+
+    # the widget counts category toggles in memory
+    w = m.DataLayerRangeFilterWidget(FakeLayer([FakeField("a"), FakeField("kind", False)], MockSource.features, layer_id="layer_23"))
+    a, kind = w.sliders
+    kind.setState({"unchecked": ["k0", "k2", None], "dirty": True})
+    w.on_slider_changed(kind)
+    assert w.toolTip() == "50 of 100 features match"
+    assert w.matchingFeatureIds() == [i for i in range(100) if i % 10 and i % 4 in (1, 3)]
+    print("Test 23 passed.")
+
+def test_large_category_list():
+    print("Running Test 24: Searchable list for categories with many values")
+    import data_layer_range_filter_widget_test as m
+    from category_index import Bitset, CategoryIndex
+    Qt = MockQgis.PyQt.QtCore.Qt
+
+    bits = Bitset([3, 70, 1])
+    assert list(bits) == [1, 3, 70] and len(bits) == 3 and 70 in bits and 2 not in bits
+    bits.discard(70)
+    assert list(bits.complement(5)) == [0, 2, 4]
+    index = CategoryIndex(["Beta", "alpha", None, "Alpine"], counts=[5, 1, 9, 1])
+    assert index.labels == ["NULL", "Beta", "alpha", "Alpine"] and index.counts == [9, 5, 1, 1]
+    assert index.search("AL") == [2, 3] and index.search("alpi") == [3] and index.search("x") == []
+    index.set_unchecked(["alpha", "gone"])
+    assert index.unchecked_values() == ["alpha"] and index.checked_values() == [None, "Beta", "Alpine"]
+
+    # "c0" on 500 features, "c1" .. "c499" on one each
+    layer = FakeLayer([FakeField("code", False)], [FakeFeature(i, ["c%d" % max(0, i - 499)]) for i in range(999)],
+                      layer_id="layer_24", name="codes", config={"fields": ["code"], "coerce": {"code": "CATEGORY"}})
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    widget, = w.sliders
+    assert isinstance(widget, m.LargeCategoryFilterWidget)
+    model = widget.model
+    # the most frequent values first, a page at a time
+    assert model.rowCount() == m.TOP_VALUES and model.data(model.index(0)) == "c0 (500)"
+    while model.canFetchMore():
+        model.fetchMore()
+    assert model.rowCount() == 500
+    widget.search.setText("c49")
+    assert [model.data(model.index(r), Qt.UserRole) for r in range(model.rowCount())] == ["c49"] + ["c49%d" % i for i in range(10)]
+
+    # a few values unchecked are filtered out, most of them unchecked the rest is listed
+    model.setData(model.index(0), Qt.Unchecked, Qt.CheckStateRole)
+    assert layer.db.subset == '("code" NOT IN (\'c49\') OR "code" IS NULL)'
+    assert widget.getState() == {"unchecked": ["c49"], "dirty": True}
+    widget.search.setText("")
+    widget.setState({"unchecked": ["c%d" % i for i in range(2, 500)], "dirty": True})
+    assert widget.getRangeFilter() == '"code" IN (\'c0\', \'c1\')'
+    assert model.data(model.index(0), Qt.CheckStateRole) == Qt.Checked
+    assert model.data(model.index(2), Qt.CheckStateRole) == Qt.Unchecked
+    # the counts are kept with the saved statistics
+    counts = w._stats["code"][1]["counts"]
+    assert max(counts) == 500 and sum(counts) == 999
+    # and seed the running statistics: the last feature of a value edited away takes it off the list, without a scan
+    assert w._field_stats["code"].counts["c1"] == 1
+    m.PERF.reset()
+    scans = len(layer.unique_scans)
+    # the provider still holds "c1", the edit is in the layer's buffer
+    layer.attributeValueChanged.emit(500, 0, "c0")
+    assert "c1" not in w._field_stats["code"].values and w._field_stats["code"].counts["c0"] == 501
+    assert "stats_rescans" not in m.PERF.counters and len(layer.unique_scans) == scans
+    # to NULL and back: a NULL of any kind is counted as one value
+    layer.attributeValueChanged.emit(501, 0, FakeNull())
+    stats = w._field_stats["code"]
+    assert "c2" not in stats.values and None in stats.values and stats.counts[None] == 1
+    layer.attributeValueChanged.emit(501, 0, "c2")
+    assert "c2" in stats.values and None not in stats.values and None not in stats.counts
+    assert "stats_rescans" not in m.PERF.counters
+    print("Test 24 passed.")
+
+def test_text_filter():
+    print("Running Test 25: Text filter over a trigram index")
+    import data_layer_range_filter_widget_test as m
+    from trigram_index import TrigramIndex
+
+    index = TrigramIndex()
+    index.add([1, 2, 3, 4, 5], ["Main Street", "Mainz", None, "main street", "Elm Road"])
+    assert len(index) == 4 and index.texts == ["main street", "mainz", "elm road"]
+    assert list(index.search("MAIN")) == [1, 4, 2] and index.count("street") == 2
+    # typing on refines the last search
+    index.positions("ma")
+    assert index._candidates("mai") == [0, 1] and list(index.search("mainz")) == [2]
+    assert list(index.search("nowhere")) == [] and list(index.search("d")) == [5]
+
+    assert m.text_filter_clause("name", "50%_o'k") == '"name" LIKE \'%50\\%\\_o\'\'k%\' ESCAPE \'\\\''
+    assert m.text_filter_clause("name", "ab", "ILIKE") == '"name" ILIKE \'%ab%\''
+
+    layer = FakeLayer([FakeField("street", False)],
+                      [FakeFeature(i, ["%d %s" % (i, ["Main Street", "Mill Lane", "Market Square"][i % 3])]) for i in range(30)],
+                      layer_id="layer_25", name="addresses", provider="memory", uri="Point?field=street:string",
+                      config={"fields": ["street"], "coerce": {"street": "TEXT"}})
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    text_filter, = w.sliders
+    assert isinstance(text_filter, m.TextFilterWidget) and "street" in w._text_indexes
+    # few matches go to the provider as feature ids
+    text_filter.line_edit.setText("1 m")
+    assert layer.db.subset == "$id IN (1, 11, 21)"
+    assert w.toolTip() == "3 of 30 features match" and w.matchingFeatureIds() == [1, 11, 21]
+    text_filter.line_edit.setText("zzz")
+    assert layer.db.subset == "1 = 0"
+    # many are left to the provider's ILIKE
+    text_filter.line_edit.setText("main")
+    assert len(w.matchingFeatureIds()) == 10 and w.toolTip() == "10 of 30 features match"
+    saved_limit, m.ID_FILTER_LIMIT = m.ID_FILTER_LIMIT, 5
+    try:
+        text_filter.line_edit.setText("mai")
+        assert layer.db.subset == '"street" ILIKE \'%mai%\''
+    finally:
+        m.ID_FILTER_LIMIT = saved_limit
+    text_filter.line_edit.setText("")
+    assert layer.db.subset == "" and w.toolTip() == ""
+
+    # edits drop the index, the next search loads it again, past the filter of the last one
+    text_filter.line_edit.setText("1 m")
+    w._drop_store()
+    assert w._text_indexes == {}
+    text_filter.line_edit.setText("lane")
+    assert "street" in w._text_indexes and w.toolTip() == "10 of 30 features match"
+    text_filter.line_edit.setText("main")
+    assert w.toolTip() == "10 of 30 features match"
+    print("Test 25 passed.")
+
+def test_expression_slider():
+    print("Running Test 26: Slider on a cached expression column")
+    import data_layer_range_filter_widget_test as m
+    from feature_loader import ExpressionLoader
+
+    class MockExpression:
+        evaluations = 0
+        def __init__(self, text): self.text = text
+        def hasParserError(self): return self.text.count("(") != self.text.count(")")
+        def parserErrorString(self): return "unbalanced parentheses"
+        def prepare(self, context): return True
+        def needsGeometry(self): return self.text.startswith("$")
+        def evaluate(self, context):
+            MockExpression.evaluations += 1
+            return context.feature.area
+    class MockContext:
+        def __init__(self, scopes=None): self.feature = None
+        def setFeature(self, feature): self.feature = feature
+    class MockContextUtils:
+        @staticmethod
+        def globalProjectLayerScopes(layer): return []
+    class MockFeature(FakeFeature):
+        def __init__(self, fid, area):
+            super().__init__(fid, [])
+            self.area = area
+    class MockSource:
+        def __init__(self, features): self.features = features
+        def getFeatures(self, request):
+            self.request = request
+            return iter(self.features)
+
+    # geometries are only read for expressions that need them; a NULL value is a NULL
+    source = MockSource([MockFeature(1, 2.5), MockFeature(2, None)])
+    loader = ExpressionLoader(source, [("$area", MockExpression("$area"))], MockContext())
+    chunk = next(loader.chunks())
+    assert not hasattr(source.request, 'flags') and chunk.size == 2
+    assert chunk.columns["$area"].get(0) == 2.5 and chunk.columns["$area"].get(1) is None
+    assert MockExpression("id").needsGeometry() is False
+
+    saved = m.QgsExpression, m.QgsExpressionContext, m.QgsExpressionContextUtils
+    m.QgsExpression, m.QgsExpressionContext, m.QgsExpressionContextUtils = MockExpression, MockContext, MockContextUtils
+    try:
+        # fid 19 has no geometry
+        layer = FakeLayer([], [MockFeature(i, 10.0 * i if i < 19 else None) for i in range(20)], layer_id="layer_26", name="parcels",
+                          provider="memory", uri="Polygon?field=id:integer",
+                          config={"fields": ["$area", "$perimeter("], "expressions": ["$area", "$perimeter("]})
+        w = m.DataLayerRangeFilterWidget(layer)
+        w._ensure_built()
+        # the expression that does not parse gets no slider
+        slider, = w.sliders
+        assert slider.field_name == "$area" and (slider.fmin, slider.fmax) == (0.0, 180.0)
+        assert w.config.stats["fields"]["$area"]["stats"]["fmax"] == 180.0
+        evaluations = MockExpression.evaluations = 0
+
+        slider.setState({"start": 0, "end": 50, "dirty": True})
+        w.on_slider_changed(slider)
+        assert layer.db.subset == "$id IN (0, 1, 2, 3, 4, 5, 6, 7, 8, 9)"
+        assert w.toolTip() == "10 of 20 features match"
+        # the column was read unfiltered, so widening the range finds the features the last filter left out
+        slider.setState({"start": 10, "end": 100, "dirty": True})
+        w.on_slider_changed(slider)
+        assert layer.db.subset == "$id IN (%s)" % ", ".join(str(fid) for fid in range(2, 19))
+        assert w.toolTip() == "17 of 20 features match" and w.matchingFeatureIds() == list(range(2, 19))
+        # nothing was evaluated again while dragging
+        assert MockExpression.evaluations == evaluations
+
+        # DuckDB cannot run the ids and expressions of the filter: the columns count
+        class FailingEngine:
+            def count(self, subset): raise AssertionError("counted by DuckDB")
+        w._duckdb_engine = lambda: FailingEngine()
+        w._update_match_count()
+        assert w.toolTip() == "17 of 20 features match"
+        del w._duckdb_engine
+
+        # too many to list: the provider evaluates the expression, or is given the few out of range
+        limit = m.ID_FILTER_LIMIT
+        m.ID_FILTER_LIMIT = 5
+        try:
+            w._expression_clauses.clear()
+            w.on_slider_changed(slider)
+            assert layer.db.subset == "($area) >= 18.0 AND ($area) <= 180.0"
+            layer.db.name = lambda: "ogr"
+            w._expression_clauses.clear()
+            w.on_slider_changed(slider)
+            assert layer.db.subset == "FID NOT IN (0, 1, 19)"
+            layer.db.name = lambda: "memory"
+        finally:
+            m.ID_FILTER_LIMIT = limit
+
+        # an edited geometry drops the column, the next change computes it again
+        layer.features[3].area = 1000.0
+        layer.geometryChanged.emit(3, None)
+        assert w._expression_columns == {}
+        w.on_slider_changed(slider)
+        assert MockExpression.evaluations == 20 and slider.fmax == 1000.0
+        assert layer.db.subset == "$id IN (%s)" % ", ".join(str(fid) for fid in range(2, 19) if fid != 3)
+        assert w.toolTip() == "16 of 20 features match"
+    finally:
+        m.QgsExpression, m.QgsExpressionContext, m.QgsExpressionContextUtils = saved
+
+    model = m.FieldTypeModel(["id"], ["Number"])
+    model.appendField("$area", "Number")
+    assert model.rowCount() == 2 and model.data(m.QtCore.QModelIndex(1, model.NAME)) == "$area"
+    print("Test 26 passed.")
+
+def test_joined_field_filter():
+    print("Running Test 27: Semi-join filters on joined fields")
+    import data_layer_range_filter_widget_test as m
+    from semi_join import JoinTable
+
+    # a key is joined to the first row that has it
+    table = JoinTable([1, 2.0, None, 2, 3], [5, 7, 9, None, 7])
+    assert table.range() == (5, 9) and table.distinct_values() == [5, 7, 9, None]
+    assert table.keys_by_value() == {5: [1], 7: [2, 3]}
+    assert table.keys_between(6, 9) == [2, 3] and table.keys_between(0, 5) == [1] and table.keys_between(8, 9) == []
+
+    class OwnerLayer(FakeLayer):
+        reads = 0
+        def getFeatures(self, request):
+            self.reads += 1
+            return iter(self.features)
+    class MockJoin:
+        def __init__(self, join_layer): self._layer = join_layer
+        def joinLayer(self): return self._layer
+        def joinFieldName(self): return "pid"
+        def targetFieldName(self): return "parcel"
+        def joinFieldNamesSubset(self): return None
+        def prefixedFieldName(self, field): return "owners_" + field.name()
+    class ParcelLayer(FakeLayer):
+        def vectorJoins(self): return [MockJoin(owners)]
+
+    # parcel id, assessed value, owner kind
+    owners = OwnerLayer([FakeField("pid"), FakeField("value"), FakeField("kind", False)],
+                        [FakeFeature(i, [i, 1000 * i, "public" if i % 4 == 0 else "private"]) for i in range(1, 13)],
+                        layer_id="owners", name="owners", provider="memory", uri="None?field=pid:integer")
+    layer = ParcelLayer([FakeField("parcel")], layer_id="layer_27", name="parcels", provider="ogr", uri="/nonexistent/parcels.shp",
+                        config={"fields": ["owners_value", "owners_kind"], "coerce": {"owners_kind": "CATEGORY"}}, count=12)
+    w = m.DataLayerRangeFilterWidget(layer)
+    w._ensure_built()
+    value, kind = w.sliders
+    # statistics come from the join layer, read once for each joined field
+    assert (value.fmin, value.fmax) == (1000, 12000) and owners.reads == 2
+    # NULL for the parcels no owner row is joined to
+    assert w._stats["owners_kind"][1]["values"] == ["private", "public", None]
+
+    # the range is evaluated on the join layer, the parcels are filtered on their key
+    value.setState({"start": 0, "end": 25, "dirty": True})
+    w.on_slider_changed(value)
+    assert layer.db.subset == '"parcel" IN (1, 2, 3)'
+    # with NULL checked the parcels no owner row is joined to stay in
+    kind.setState({"unchecked": ["private"], "dirty": True})
+    w.on_slider_changed(kind)
+    assert layer.db.subset == ('"parcel" IN (1, 2, 3) AND ("parcel" NOT IN (1, 2, 3, 5, 6, 7, 9, 10, 11) OR "parcel" IS NULL)')
+    kind.setState({"unchecked": ["private", None], "dirty": True})
+    w.on_slider_changed(kind)
+    assert layer.db.subset == '"parcel" IN (1, 2, 3) AND "parcel" IN (4, 8, 12)'
+    # composing again for the same states reads nothing
+    w.on_slider_changed(value)
+    assert owners.reads == 2 and w._join_clauses["owners_value"][0] == (1000.0, 3750.0)
+
+    # edits on the join layer bring the filters up to date and apply them again with the new keys
+    owners.features[5]._attrs[1] = 2500
+    owners.features[11]._attrs[1:] = [20000, "trust"]
+    owners.dataChanged.emit()
+    assert (value.fmin, value.fmax) == (1000, 20000) and w._stats["owners_kind"][1]["values"] == ["private", "public", "trust", None]
+    # keys of a range come in the order of their values
+    assert layer.db.subset == '"parcel" IN (1, 2, 6, 3) AND "parcel" IN (4, 8, 12)' and owners.reads == 4
+    w.onLayerRemoved()
+    assert owners.dataChanged._slots == []
+    print("Test 27 passed.")
+
+def test_visible_extent_stats():
+    print("Running Test 28: Statistics of the features in the visible extent")
+    import data_layer_range_filter_widget_test as m
+    from extent_index import ExtentTracker
+    from feature_loader import Chunk
+
+    # points along the x axis
+    layer = FakeLayer([FakeField("v"), FakeField("c", False)],
+                      [FakeFeature(i, [10 * i, "a" if i < 10 else "b"], bbox=(i, 0, i, 0)) for i in range(20)],
+                      layer_id="layer_28", name="points", provider="memory", uri="Point?field=v:integer&field=c:string",
+                      values={"c": ["a", "b"]}, config={"fields": ["v", "c"], "coerce": {"c": "CATEGORY"}, "extent_only": True})
+    w = m.DataLayerRangeFilterWidget(layer)
+    view = [(0, -1, 4, 1)]
+    w._visible_extent = lambda: view[0]
+    w._ensure_built()
+    v, c = w.sliders
+    def listed():
+        return [c.list_widget.item(i).data(MockQgis.PyQt.QtCore.Qt.UserRole) for i in range(c.list_widget.count())]
+    # the filters span the features in view
+    assert (v.fmin, v.fmax) == (0.0, 40.0) and listed() == ["a"]
+    assert w.toolTip() == "5 features in view"
+    # the whole layer's statistics are still what is saved
+    assert w.config.stats["fields"]["v"]["stats"]["fmax"] == 190
+
+    # a pan only adds and removes the features that entered and left the view
+    view[0] = (3, -1, 12, 1)
+    m.PERF.reset()
+    w._on_extent_changed()
+    assert m.PERF.counters["extent_features_entered"] == 8 and m.PERF.counters["extent_features_left"] == 3
+    assert (v.fmin, v.fmax) == (30.0, 120.0) and listed() == ["a", "b"]
+    v.setState({"start": 0, "end": 50, "dirty": True})
+    w.on_slider_changed(v)
+    assert layer.db.subset == '"v" >= 30 AND "v" <= 75'
+    assert w.toolTip() == "5 of 10 features in view match"
+
+    # an edited value is swapped in place, the features in view are not indexed again
+    tracker = w._extent
+    for value in (500, 50):
+        layer.features[5].attributes()[0] = value
+        layer.attributeValueChanged.emit(5, 0, value)
+        assert w._extent is tracker and v.fmax == (500.0 if value == 500 else 120.0)
+    assert tracker.columns["v"][5] == 50
+    # a NULL of any kind is held as None, in and out of view
+    layer.attributeValueChanged.emit(5, 1, FakeNull())
+    assert tracker.columns["c"][5] is None and listed() == ["a", "b", None]
+    layer.attributeValueChanged.emit(5, 1, "a")
+    assert listed() == ["a", "b"]
+
+    # a feature moved out of view is no longer counted
+    layer.features[12].bbox = (100, 0, 100, 0)
+    layer.geometryChanged.emit(12, None)
+    assert v.fmax == 110.0 and w.toolTip() == "5 of 9 features in view match"
+
+    w.setExtentOnly(False)
+    assert w._extent is None and (v.fmin, v.fmax) == (0, 190) and w.toolTip() == "5 of 20 features match"
+
+    chunk = Chunk([("c", 1, False)], 2)
+    chunk.columns["c"].values[:] = ["a", FakeNull()]
+    chunk.size = 2
+    assert chunk.values("c") == ["a", None]
+    tracker = ExtentTracker(m.QgsSpatialIndex(layer.features[:3]), {"v": {0: 0.0, 1: 10.0, 2: None}})
+    assert tracker.move((1, -1, 5, 1)) == ({1, 2}, set())
+    assert tracker.move((0, -1, 1, 1)) == ({0}, {2})
+    print("Test 28 passed.")
+
+def test_painted_range_slider():
+    print("Running Test 29: Painted range slider")
+    import importlib.util
+    import types
+
+    # just enough of Qt to lay out, paint and drag the slider for real
+    class QRect:
+        def __init__(self, x, y, w, h): self.x, self.y, self.w, self.h = x, y, w, h
+        def left(self): return self.x
+        def right(self): return self.x + self.w - 1
+        def united(self, other):
+            left, right = min(self.left(), other.left()), max(self.right(), other.right())
+            return QRect(left, min(self.y, other.y), right - left + 1, max(self.h, other.h))
+        def adjusted(self, x1, y1, x2, y2): return QRect(self.x + x1, self.y + y1, self.w - x1 + x2, self.h - y1 + y2)
+        def contains(self, x, y): return self.left() <= x <= self.right() and self.y <= y < self.y + self.h
+    class QColor:
+        def __init__(self, *args): self.args = args
+        def isValid(self): return True
+        def darker(self, factor): return QColor("darker", self.args)
+    class QWidget:
+        def __init__(self, parent=None): self.w, self.h, self.updates = 0, 0, []
+        def setObjectName(self, name): pass
+        def setMouseTracking(self, tracking): pass
+        def setFocusPolicy(self, policy): pass
+        def resize(self, w, h): self.w, self.h = w, h
+        def width(self): return self.w
+        def height(self): return self.h
+        def update(self, *rect): self.updates.append(rect)
+    class QPainter:
+        Antialiasing = 1
+        painted = []
+        def __getattr__(self, name):
+            return lambda *args: QPainter.painted.append((name,) + args)
+    class Event:
+        def __init__(self, x=0, button=1, key=None): self._x, self._button, self._key, self.accepted = x, button, key, None
+        def x(self): return self._x
+        def button(self): return self._button
+        def key(self): return self._key
+        def accept(self): self.accepted = True
+        def ignore(self): self.accepted = False
+    Qt = type('Qt', (), {'LeftButton': 1, 'RightButton': 2, 'Key_Left': 3, 'Key_Right': 4, 'Key_Up': 5,
+                         'AlignLeft': 1, 'AlignRight': 2, 'ClickFocus': 1, 'Horizontal': 1})
+    QtCore = types.SimpleNamespace(pyqtSignal=lambda *types: MockQgis.PyQt.QtCore.Signal(), Qt=Qt, QRect=QRect, QRectF=lambda rect: rect,
+                                   QSize=MockQgis.PyQt.QtCore.QSize)
+    QtGui = types.SimpleNamespace(QColor=QColor, QPainter=QPainter, QFont=lambda *args: None,
+                                  QFontMetrics=lambda font: types.SimpleNamespace(height=lambda: 12),
+                                  QPen=lambda color: types.SimpleNamespace(setWidth=lambda width: None))
+    QtWidgets = types.SimpleNamespace(QWidget=QWidget, QGroupBox=QWidget, QGridLayout=object, QSplitter=object,
+                                      QHBoxLayout=object, QApplication=object)
+    mocked = {'PyQt5': types.SimpleNamespace(QtCore=QtCore, QtGui=QtGui, uic=None), 'PyQt5.QtWidgets': QtWidgets}
+    saved = dict((name, sys.modules.get(name)) for name in mocked)
+    sys.modules.update(mocked)
+    try:
+        spec = importlib.util.spec_from_file_location("qrangeslider_painted", "qrangeslider.py")
+        qrangeslider = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(qrangeslider)
+    finally:
+        for name, module in saved.items():
+            sys.modules[name] = module
+
+    # 8 pixel handles leave 192 to travel over, 2 pixels a value
+    s = qrangeslider.QPaintedRangeSlider()
+    s.resize(208, 20)
+    s.setMin(0)
+    s.setMax(96)
+    s.setRange(24, 72)
+    assert (s._startHandleRect().left(), s._endHandleRect().left()) == (48, 152)
+    starts = []
+    s.startValueChanged.connect(starts.append)
+
+    # a handle is grabbed a little outside its edges and keeps where it was grabbed
+    press = Event(46)
+    s.mousePressEvent(press)
+    assert press.accepted and s._drag == s._DRAG_START
+    s.mouseMoveEvent(Event(66))
+    s.mouseReleaseEvent(Event(66))
+    assert s.getRange() == (34, 72) and starts[-1] == 34 and s.interactionTime() is not None
+    s.mousePressEvent(Event(154))
+    s.mouseMoveEvent(Event(130))
+    s.mouseReleaseEvent(Event(130))
+    assert s.getRange() == (34, 60)
+    # the span moves both ends, and stops at the edges
+    s.mousePressEvent(Event(100))
+    assert s._drag == s._DRAG_SPAN
+    s.mouseMoveEvent(Event(120))
+    assert s.getRange() == (44, 70)
+    s.mouseMoveEvent(Event(400))
+    s.mouseReleaseEvent(Event(400))
+    assert s.getRange() == (70, 96)
+    # outside the handles and span, or with another button, nothing is grabbed
+    for event in (Event(10), Event(100, button=2)):
+        s.mousePressEvent(event)
+        assert event.accepted is False and s._drag == s._DRAG_NONE
+    moved = Event(50)
+    s.mouseMoveEvent(moved)
+    assert moved.accepted is False and s.getRange() == (70, 96)
+    # on top of each other at the maximum, the start handle is the one that can move
+    s.setRange(96, 96)
+    s.mousePressEvent(Event(200))
+    assert s._drag == s._DRAG_START
+    s.mouseReleaseEvent(Event(200))
+    # arrow keys move the range while it stays within bounds
+    s.setRange(10, 20)
+    s.keyPressEvent(Event(key=Qt.Key_Left))
+    assert s.getRange() == (9, 19)
+    key = Event(key=Qt.Key_Up)
+    s.keyPressEvent(key)
+    assert key.accepted is False and s.getRange() == (9, 19)
+
+    # one paint draws the track, the labels and both handles
+    class Printer:
+        calls = 0
+        def pretty(self, value):
+            Printer.calls += 1
+            return "v%d" % value
+    s.setDrawValues(True, Printer())
+    QPainter.painted = []
+    s.paintEvent(None)
+    assert [call[3] for call in QPainter.painted if call[0] == "drawText"] == ["v0", "v96", "v9", "v19"]
+    assert len([call for call in QPainter.painted if call[0] == "fillRect"]) == 3
+    assert len([call for call in QPainter.painted if call[0] == "drawRoundedRect"]) == 2
+    assert QPainter.painted[-1] == ("end",)
+    # the span is drawn darker while it is dragged
+    s.mousePressEvent(Event(40))
+    QPainter.painted = []
+    s.paintEvent(None)
+    assert QPainter.painted[3] == ("fillRect", QPainter.painted[3][1], s._spanActiveColor)
+    s.mouseReleaseEvent(Event(40))
+
+    # labels come from a table built once per range, then indexed
+    assert Printer.calls == 97
+    s.paintEvent(None)
+    assert s.label(50) == "v50" and Printer.calls == 97
+    s.invalidateLabels()
+    assert s.label(50) == "v50" and Printer.calls == 194
+    s.setMax(qrangeslider.LABEL_TABLE_LIMIT + 1)
+    assert s.label(50) == "v50" and s._labels[1] is None and Printer.calls == 195
+    s.setDrawValues(True)
+    assert s.label(50) == "50"
+
+    s.setSpanStyle("background: #393;")
+    assert s._spanColor.args == ("#393",) and s._spanActiveColor.args == ("darker", ("#393",))
+    print("Test 29 passed.")
 
 if __name__ == '__main__':
     test_category_filter()
     test_auto_category()
     test_context_menu_actions()
     test_select_fields_duplication()
+    test_perf_stats()
+    test_interaction_tracer()
+    test_memory_rebuild_cycles()
+    test_virtual_filter_list()
+    test_deferred_build()
+    test_reconcile_rebuild()
+    test_options_field_model()
+    test_incremental_edit_stats()
+    test_follow_growing_file()
+    test_attribute_loader()
+    test_sqlite_fast_path()
+    test_parquet_footer_stats()
+    test_zone_map_counts()
+    test_duckdb_engine()
+    test_parallel_field_stats()
+    test_dictionary_encoded_categories()
+    test_large_category_list()
+    test_text_filter()
+    test_expression_slider()
+    test_joined_field_filter()
+    test_visible_extent_stats()
+    test_painted_range_slider()
 
 # Cleanup
 import os
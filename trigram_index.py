@@ -0,0 +1,106 @@
+# Substring search over a text column held in memory.
+#
+# Every distinct value of the column is lowered and cut into its three
+# letter sequences; each trigram lists the values it occurs in. A search
+# for a piece of text of three letters or more only looks at the values
+# listed under its rarest trigram, and checks those with a plain substring
+# test, so typing into a text filter finds the matching features without
+# going through the provider. Successive keystrokes usually narrow the
+# previous search, which is then refined instead of started over.
+
+from array import array
+
+try:
+    from .category_index import value_key
+except ImportError:
+    # loaded as a top-level module, as the tests do
+    from category_index import value_key
+
+# below this many letters a search has no trigram to go by and checks every value
+TRIGRAM = 3
+
+
+def trigrams(text):
+    return set(text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1))
+
+
+class TrigramIndex(object):
+    """
+    Case-insensitive substring index over one text column.
+
+    :ivar texts: distinct lowered values
+    :ivar fids: array('q') of the feature ids per distinct value
+    :ivar postings: trigram -> array('i') of positions in texts
+    """
+
+    def __init__(self):
+        self.texts = []
+        self.fids = []
+        self.postings = {}
+        self._positions = {}
+        self._rows = 0
+        # (text, positions) of the last search
+        self._last = None
+
+    @classmethod
+    def load(cls, loader, name, total=None, progress=None, is_canceled=None):
+        """
+        indexes one column that a feature_loader loader reads
+
+        :return: the index, or None when the load was canceled
+        """
+        index = cls()
+        for chunk in loader.chunks(total, progress, is_canceled):
+            index.add(chunk.fids[:chunk.size], chunk.columns[name].values[:chunk.size])
+        return None if loader.canceled else index
+
+    def add(self, fids, values):
+        """indexes the values of the features fids; NULLs never match"""
+        for fid, value in zip(fids, values):
+            if value_key(value) is None:
+                continue
+            text = str(value).lower()
+            position = self._positions.get(text)
+            if position is None:
+                position = self._positions[text] = len(self.texts)
+                self.texts.append(text)
+                self.fids.append(array('q'))
+                for trigram in trigrams(text):
+                    self.postings.setdefault(trigram, array('i')).append(position)
+            self.fids[position].append(fid)
+            self._rows += 1
+        self._last = None
+
+    def __len__(self):
+        """number of features indexed"""
+        return self._rows
+
+    def _candidates(self, text):
+        if self._last is not None and self._last[0] in text:
+            # typing on: only what matched before can still match
+            return self._last[1]
+        if len(text) < TRIGRAM:
+            return range(len(self.texts))
+        lists = [self.postings.get(trigram) for trigram in trigrams(text)]
+        if any(found is None for found in lists):
+            return ()
+        return min(lists, key=len)
+
+    def positions(self, text):
+        """:return: positions in texts of the values containing text, ignoring case"""
+        text = text.lower()
+        texts = self.texts
+        found = [i for i in self._candidates(text) if text in texts[i]]
+        self._last = (text, found)
+        return found
+
+    def search(self, text):
+        """:return: array('q') of the ids of the features whose value contains text, ignoring case"""
+        selected = array('q')
+        for i in self.positions(text):
+            selected.extend(self.fids[i])
+        return selected
+
+    def count(self, text):
+        """:return: number of features whose value contains text"""
+        return sum(len(self.fids[i]) for i in self.positions(text))
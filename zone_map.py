@@ -0,0 +1,327 @@
+# Block-level zone maps over the columns of a layer held in memory.
+#
+# The values of the range filtered fields are kept in fixed size blocks,
+# each with the minimum, maximum and number of NULLs of every column. A range
+# query looks at those first: a block that cannot hold a match is skipped, a
+# block that lies wholly inside every range is taken whole, and only the
+# blocks straddling a range boundary have their values compared one by one.
+# On large layers that comes close to what a sorted index would give, for a
+# few numbers per block.
+#
+# Text columns, as category filters use them, are dictionary encoded: every
+# distinct value is stored once and each row holds its small integer code.
+# A category filter becomes a lookup table from code to 0 or 1, and for the
+# usual column of fewer than 256 values a block is tested with one
+# bytes.translate, no Python loop over the rows.
+
+from array import array
+
+try:
+    from .category_index import value_key
+except ImportError:
+    # loaded as a top-level module, as the tests do
+    from category_index import value_key
+
+BLOCK_SIZE = 4096
+
+SKIP, ACCEPT, PARTIAL = range(3)
+
+
+class Dictionary(object):
+    """
+    The distinct values of a text column, numbered in order of appearance.
+
+    :ivar values: code -> value
+    :ivar codes: value -> code
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values):
+        """:return: array of the codes of values, adding the new ones; of bytes while there are at most 256"""
+        codes = self.codes
+        encoded = []
+        for value in values:
+            key = value_key(value)
+            code = codes.get(key)
+            if code is None:
+                code = codes[key] = len(self.values)
+                self.values.append(key)
+            encoded.append(code)
+        return array('B' if len(self.values) <= 256 else 'i', encoded)
+
+    def mask(self, allowed):
+        """:return: bytes with a 1 at the code of every value in allowed, at least 256 long for translate"""
+        table = bytearray(max(256, len(self.values)))
+        for value in allowed:
+            code = self.codes.get(value_key(value))
+            if code is not None:
+                table[code] = 1
+        return bytes(table)
+
+
+def _take(codes, table):
+    """:return: bytes with table's entry for every code"""
+    if codes.typecode == 'B':
+        return codes.tobytes().translate(table)
+    return bytes(table[code] for code in codes)
+
+
+def _both(a, b):
+    """:return: bytes of 0/1 flags set where they are set in a and b"""
+    n = len(a)
+    return (int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(n, 'little')
+
+
+class ZoneMap(object):
+    """
+    Per-block statistics of some columns.
+
+    :ivar block_rows: number of rows in each block
+    :ivar zones: column name -> list of (min, max, null count) per block, min and max
+        None when the block holds no value, or none that is known
+    """
+
+    def __init__(self):
+        self.block_rows = []
+        self.zones = {}
+
+    @classmethod
+    def from_row_groups(cls, row_groups):
+        """:param row_groups: list of (rows, {column: (min, max, null count)}), e.g. Parquet row groups"""
+        zone_map = cls()
+        names = set()
+        for _, columns in row_groups:
+            names.update(columns)
+        for rows, columns in row_groups:
+            zone_map.add_block(rows, dict((name, columns.get(name, (None, None, None))) for name in names))
+        return zone_map
+
+    def add_block(self, rows, zones):
+        """:param zones: column name -> (min, max, null count) of the new block"""
+        block = len(self.block_rows)
+        self.block_rows.append(rows)
+        for name, zone in zones.items():
+            self.zones.setdefault(name, [(None, None, None)] * block).append(zone)
+
+    def grow_block(self, rows, zones):
+        """
+        adds rows to the last block
+
+        :param zones: column name -> (min, max, null count) of the rows added
+        """
+        block = len(self.block_rows) - 1
+        self.block_rows[block] += rows
+        for name, (zmin, zmax, nulls) in zones.items():
+            column = self.zones.setdefault(name, [(None, None, None)] * (block + 1))
+            old_min, old_max, old_nulls = column[block]
+            if old_nulls is None:
+                continue # not known before, nor after
+            lows = [v for v in (old_min, zmin) if v is not None]
+            highs = [v for v in (old_max, zmax) if v is not None]
+            column[block] = (min(lows) if lows else None, max(highs) if highs else None, old_nulls + nulls)
+
+    def classify(self, block, ranges):
+        """
+        :param ranges: column name -> (low, high), as in "col" >= low AND "col" <= high
+        :return: SKIP if no row of the block can match, ACCEPT if every row does, PARTIAL otherwise
+        """
+        rows = self.block_rows[block]
+        verdict = ACCEPT
+        for name, (low, high) in ranges.items():
+            zones = self.zones.get(name)
+            if zones is None:
+                verdict = PARTIAL
+                continue
+            zmin, zmax, nulls = zones[block]
+            if nulls is not None and nulls == rows:
+                return SKIP # NULL never passes a range
+            if zmin is None or zmax is None:
+                verdict = PARTIAL
+                continue
+            try:
+                if zmin > high or zmax < low:
+                    return SKIP
+                if nulls != 0 or zmin < low or zmax > high:
+                    verdict = PARTIAL
+            except TypeError:
+                verdict = PARTIAL # not comparable
+        return verdict
+
+    def blocks(self, ranges):
+        """:return: (skipped, accepted, partial) lists of block indexes"""
+        found = ([], [], [])
+        for block in range(len(self.block_rows)):
+            found[self.classify(block, ranges)].append(block)
+        return found
+
+
+class ColumnStore(object):
+    """
+    Columns of a layer held in memory, in blocks of up to BLOCK_SIZE rows: numeric ones
+    with a zone map over them, text ones dictionary encoded.
+
+    :ivar fids: array('q') of feature ids per block
+    :ivar columns: column name -> list of (array('d') values, bytearray NULL flags) per block
+    :ivar categories: column name -> (Dictionary, list of code arrays per block)
+    """
+
+    def __init__(self, names, category_names=()):
+        self.names = list(names)
+        self.fids = []
+        self.columns = dict((name, []) for name in self.names)
+        self.categories = dict((name, (Dictionary(), [])) for name in category_names)
+        self.zone_map = ZoneMap()
+
+    @classmethod
+    def load(cls, loader, total=None, progress=None, is_canceled=None):
+        """
+        fills a store from the columns a feature_loader loader reads, one block per chunk
+
+        :return: the store, or None when the load was canceled
+        """
+        names = [name for name, _, numeric in loader.columns if numeric]
+        category_names = [name for name, _, numeric in loader.columns if not numeric]
+        store = cls(names, category_names)
+        for chunk in loader.chunks(total, progress, is_canceled):
+            store.add_chunk(chunk)
+        return None if loader.canceled else store
+
+    def add_chunk(self, chunk):
+        """copies the values out of a loader chunk, which the loader reuses"""
+        n = chunk.size
+        self.fids.append(chunk.fids[:n])
+        zones = {}
+        for name in self.names:
+            column = chunk.columns[name]
+            values, nulls = column.values[:n], column.nulls[:n]
+            self.columns[name].append((values, nulls))
+            present = [values[i] for i in range(n) if not nulls[i]]
+            null_count = n - len(present)
+            zones[name] = (min(present), max(present), null_count) if present else (None, None, null_count)
+        for name, (dictionary, blocks) in self.categories.items():
+            blocks.append(dictionary.encode(chunk.columns[name].values[:n]))
+        self.zone_map.add_block(n, zones)
+
+    def append(self, fids, values):
+        """
+        adds rows after the last, filling up the last block before starting another
+
+        :param fids: ids of the features added
+        :param values: column name -> their values, None for NULL, for every column of the store
+        """
+        start = 0
+        while start < len(fids):
+            if not self.fids or len(self.fids[-1]) >= BLOCK_SIZE:
+                self._add_empty_block()
+            end = min(len(fids), start + BLOCK_SIZE - len(self.fids[-1]))
+            self._grow_block(fids[start:end], dict((name, column[start:end]) for name, column in values.items()))
+            start = end
+
+    def _add_empty_block(self):
+        self.fids.append(array('q'))
+        for name in self.names:
+            self.columns[name].append((array('d'), bytearray()))
+        for dictionary, blocks in self.categories.values():
+            blocks.append(array('B'))
+        self.zone_map.add_block(0, dict((name, (None, None, 0)) for name in self.names))
+
+    def _grow_block(self, fids, values):
+        self.fids[-1].extend(fids)
+        zones = {}
+        for name in self.names:
+            column, nulls = self.columns[name][-1]
+            present = []
+            for value in values[name]:
+                try:
+                    column.append(value)
+                    nulls.append(0)
+                    present.append(column[-1])
+                except TypeError:
+                    column.append(0.0)
+                    nulls.append(1) # NULL, or not a number
+            null_count = len(fids) - len(present)
+            zones[name] = (min(present), max(present), null_count) if present else (None, None, null_count)
+        for name, (dictionary, blocks) in self.categories.items():
+            codes = dictionary.encode(values[name])
+            if blocks[-1].typecode != codes.typecode:
+                # past 256 values the codes no longer fit a byte
+                blocks[-1] = array(codes.typecode, blocks[-1])
+            blocks[-1].extend(codes)
+        self.zone_map.grow_block(len(fids), zones)
+
+    def __len__(self):
+        return sum(self.zone_map.block_rows)
+
+    def column_range(self, name):
+        """:return: (min, max) of a numeric column, or None if it holds nothing but NULLs"""
+        zones = [(zmin, zmax) for zmin, zmax, _ in self.zone_map.zones.get(name, []) if zmin is not None]
+        if not zones:
+            return None
+        return min(zmin for zmin, _ in zones), max(zmax for _, zmax in zones)
+
+    def can_answer(self, ranges, categories=None):
+        return all(name in self.columns for name in ranges) and all(name in self.categories for name in categories or ())
+
+    def _masks(self, categories):
+        """:return: [(code blocks, lookup table)] for category name -> allowed values"""
+        return [(self.categories[name][1], self.categories[name][0].mask(allowed))
+                for name, allowed in (categories or {}).items()]
+
+    def _hits(self, block, masks):
+        """:return: bytes flagging the rows of a block whose category values are allowed, None without categories"""
+        hits = None
+        for blocks, table in masks:
+            taken = _take(blocks[block], table)
+            hits = taken if hits is None else _both(hits, taken)
+        return hits
+
+    def _scan_block(self, block, ranges, hits=None):
+        """:return: positions within the block of the rows inside every range, and allowed by hits"""
+        tests = [(self.columns[name][block], low, high) for name, (low, high) in ranges.items()]
+        positions = []
+        for i in range(self.zone_map.block_rows[block]):
+            if hits is not None and not hits[i]:
+                continue
+            for (values, nulls), low, high in tests:
+                if nulls[i] or not low <= values[i] <= high:
+                    break
+            else:
+                positions.append(i)
+        return positions
+
+    def count(self, ranges, categories=None):
+        """
+        :param categories: column name -> values allowed, as in "col" IN (...)
+        :return: (number of rows inside every range with allowed values, (blocks skipped, accepted, scanned))
+        """
+        skipped, accepted, partial = self.zone_map.blocks(ranges)
+        masks = self._masks(categories)
+        total = 0
+        for block in accepted:
+            hits = self._hits(block, masks)
+            total += self.zone_map.block_rows[block] if hits is None else hits.count(1)
+        total += sum(len(self._scan_block(block, ranges, self._hits(block, masks))) for block in partial)
+        return total, (len(skipped), len(accepted), len(partial))
+
+    def select(self, ranges, categories=None):
+        """:return: array('q') of the ids of the features inside every range with allowed values"""
+        skipped, accepted, partial = self.zone_map.blocks(ranges)
+        masks = self._masks(categories)
+        selected = array('q')
+        whole = set(accepted)
+        for block in sorted(accepted + partial):
+            fids = self.fids[block]
+            hits = self._hits(block, masks)
+            if block in whole and hits is None:
+                selected.extend(fids)
+            elif block in whole:
+                selected.extend(fids[i] for i in range(len(fids)) if hits[i])
+            else:
+                selected.extend(fids[i] for i in self._scan_block(block, ranges, hits))
+        return selected